@@ -1,16 +1,53 @@
-from fastapi import FastAPI, APIRouter, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, APIRouter, WebSocket, WebSocketDisconnect, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, JSONResponse
 from dotenv import load_dotenv
 from pathlib import Path
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError, model_validator
 from typing import List, Optional, Dict, Any
 import os
 import logging
 import json
+import random
+import re
 import asyncio
-import aiomysql
-import docker
-from datetime import datetime
+import functools
+import hashlib
+import base64
+import fcntl
+import gzip
+import zlib
+import bisect
+import importlib.util
+import socket
+import sys
+import threading
+import time
+import uuid
+import httpx
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, suppress
+from datetime import datetime, timezone
+
+def lazy_import(name: str):
+    """A module that is only executed on first attribute access."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+# The Docker SDK (with requests) and the MySQL driver take a noticeable part of
+# startup to import, and the app serves health checks before it needs either
+aiomysql = lazy_import('aiomysql')
+docker = lazy_import('docker')
+requests = lazy_import('requests')
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -20,170 +57,2226 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
+# httpx logs every request at INFO, which floods the log once health probes run
+logging.getLogger('httpx').setLevel(logging.WARNING)
 
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
 
-db_pool = None
-docker_client = None
-active_connections: List[WebSocket] = []
 
-async def init_mysql():
-    global db_pool
+DOCKER_MAX_WORKERS = int(os.environ.get('DOCKER_MAX_WORKERS', 16))
+DOCKER_LIFECYCLE_CONCURRENCY = int(os.environ.get('DOCKER_LIFECYCLE_CONCURRENCY', 8))
+DOCKER_STOP_TIMEOUT = int(os.environ.get('DOCKER_STOP_TIMEOUT', 10))
+DOCKER_CALL_TIMEOUT = float(os.environ.get('DOCKER_CALL_TIMEOUT', 10))
+DOCKER_POOL_SIZE = int(os.environ.get('DOCKER_POOL_SIZE', 10))
+# Long-lived stats and log streams per Docker host; each holds a thread and a connection
+DOCKER_STREAM_LIMIT = int(os.environ.get('DOCKER_STREAM_LIMIT', 64))
+DOCKER_HEALTH_INTERVAL = float(os.environ.get('DOCKER_HEALTH_INTERVAL', 30))
+DOCKER_EVENTS_RETRY_MAX = float(os.environ.get('DOCKER_EVENTS_RETRY_MAX', 30))
+STATS_BUFFER_SIZE = int(os.environ.get('STATS_BUFFER_SIZE', 3600))
+STATS_SCAN_INTERVAL = float(os.environ.get('STATS_SCAN_INTERVAL', 5))
+WS_STATS_MIN_INTERVAL = float(os.environ.get('WS_STATS_MIN_INTERVAL', 1))
+WS_STATS_MAX_SERVICES = int(os.environ.get('WS_STATS_MAX_SERVICES', 200))
+WS_QUEUE_SIZE = int(os.environ.get('WS_QUEUE_SIZE', 100))
+WS_SEND_TIMEOUT = float(os.environ.get('WS_SEND_TIMEOUT', 10))
+# What to do when a client's outbound queue is full: "drop" the oldest
+# message or "disconnect" the client.
+WS_SLOW_CLIENT_POLICY = os.environ.get('WS_SLOW_CLIENT_POLICY', 'drop')
+IMAGE_PULL_CONCURRENCY = int(os.environ.get('IMAGE_PULL_CONCURRENCY', 2))
+IMAGE_WARM_INTERVAL = float(os.environ.get('IMAGE_WARM_INTERVAL', 3600))
+# Run containers by the resolved repo digest instead of image:tag
+IMAGE_PIN_DIGESTS = os.environ.get('IMAGE_PIN_DIGESTS', '0') == '1'
+HEALTH_PROBE_HOST = os.environ.get('HEALTH_PROBE_HOST', 'localhost')
+HEALTH_INTERVAL = float(os.environ.get('HEALTH_INTERVAL', 15))
+HEALTH_MAX_BACKOFF = float(os.environ.get('HEALTH_MAX_BACKOFF', 300))
+HEALTH_TIMEOUT = float(os.environ.get('HEALTH_TIMEOUT', 5))
+HEALTH_JITTER = float(os.environ.get('HEALTH_JITTER', 0.1))
+HEALTH_HISTORY = int(os.environ.get('HEALTH_HISTORY', 20))
+HEALTH_MAX_CONCURRENCY = int(os.environ.get('HEALTH_MAX_CONCURRENCY', 100))
+BULK_PARALLELISM = int(os.environ.get('BULK_PARALLELISM', 4))
+LOGS_MAX_BYTES = int(os.environ.get('LOGS_MAX_BYTES', 10 * 1024 * 1024))
+LOGS_STREAM_BUFFER = int(os.environ.get('LOGS_STREAM_BUFFER', 256))
+SERVICES_PAGE_MAX = int(os.environ.get('SERVICES_PAGE_MAX', 500))
+SERVICES_EXPORT_BATCH = int(os.environ.get('SERVICES_EXPORT_BATCH', 500))
+MYSQL_POOL_MINSIZE = int(os.environ.get('MYSQL_POOL_MINSIZE', 1))
+MYSQL_POOL_MAXSIZE = int(os.environ.get('MYSQL_POOL_MAXSIZE', 10))
+MYSQL_POOL_RECYCLE = int(os.environ.get('MYSQL_POOL_RECYCLE', 3600))
+MYSQL_CONNECT_TIMEOUT = float(os.environ.get('MYSQL_CONNECT_TIMEOUT', 10))
+MYSQL_ACQUIRE_TIMEOUT = float(os.environ.get('MYSQL_ACQUIRE_TIMEOUT', 5))
+MYSQL_SLOW_QUERY_MS = float(os.environ.get('MYSQL_SLOW_QUERY_MS', 200))
+MYSQL_SLOW_QUERY_LOG = os.environ.get('MYSQL_SLOW_QUERY_LOG', '')
+LOG_ARCHIVE_ENABLED = os.environ.get('LOG_ARCHIVE_ENABLED', '1') == '1'
+LOG_ARCHIVE_DIR = os.environ.get('LOG_ARCHIVE_DIR', str(ROOT_DIR / 'log_archive'))
+LOG_SEGMENT_BYTES = int(os.environ.get('LOG_SEGMENT_BYTES', 4 * 1024 * 1024))
+LOG_SEGMENT_SECONDS = float(os.environ.get('LOG_SEGMENT_SECONDS', 300))
+LOG_RETENTION_BYTES = int(os.environ.get('LOG_RETENTION_BYTES', 2 * 1024 * 1024 * 1024))
+LOG_COMPRESS_LEVEL = int(os.environ.get('LOG_COMPRESS_LEVEL', 6))
+LOG_BLOOM_BITS = int(os.environ.get('LOG_BLOOM_BITS', 17))
+LOG_SEARCH_MAX_RESULTS = int(os.environ.get('LOG_SEARCH_MAX_RESULTS', 1000))
+METRICS_HISTORY_ENABLED = os.environ.get('METRICS_HISTORY_ENABLED', '1') == '1'
+METRICS_HISTORY_DIR = os.environ.get('METRICS_HISTORY_DIR', str(ROOT_DIR / 'metrics_history'))
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 60))
+METRICS_RETENTION_10S = float(os.environ.get('METRICS_RETENTION_10S', 2 * 86400))
+METRICS_RETENTION_1M = float(os.environ.get('METRICS_RETENTION_1M', 35 * 86400))
+METRICS_RETENTION_1H = float(os.environ.get('METRICS_RETENTION_1H', 400 * 86400))
+RECONCILE_INTERVAL = float(os.environ.get('RECONCILE_INTERVAL', 30))
+RECONCILE_RESTART = os.environ.get('RECONCILE_RESTART', '0') == '1'
+RECONCILE_RESTARTS_PER_MINUTE = float(os.environ.get('RECONCILE_RESTARTS_PER_MINUTE', 6))
+RECONCILE_RESTART_BACKOFF = float(os.environ.get('RECONCILE_RESTART_BACKOFF', 30))
+RECONCILE_RESTART_MAX_BACKOFF = float(os.environ.get('RECONCILE_RESTART_MAX_BACKOFF', 900))
+HOST_REFRESH_INTERVAL = float(os.environ.get('HOST_REFRESH_INTERVAL', 15))
+HOST_MAX_WORKERS = int(os.environ.get('HOST_MAX_WORKERS', 8))
+SCHEDULER_DEFAULT_MEMORY_MB = float(os.environ.get('SCHEDULER_DEFAULT_MEMORY_MB', 256))
+SCHEDULER_CPU_WEIGHT = float(os.environ.get('SCHEDULER_CPU_WEIGHT', 1.0))
+SCHEDULER_MEMORY_WEIGHT = float(os.environ.get('SCHEDULER_MEMORY_WEIGHT', 1.0))
+SCHEDULER_IMAGE_WEIGHT = float(os.environ.get('SCHEDULER_IMAGE_WEIGHT', 0.5))
+# What to do with a start that would overcommit its host: "reject" it or
+# "queue" it until enough capacity is released.
+ADMISSION_POLICY = os.environ.get('ADMISSION_POLICY', 'reject')
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 120))
+ADMISSION_CPU_OVERCOMMIT = float(os.environ.get('ADMISSION_CPU_OVERCOMMIT', 1.0))
+ADMISSION_MEMORY_OVERCOMMIT = float(os.environ.get('ADMISSION_MEMORY_OVERCOMMIT', 1.0))
+ADMISSION_SYNC_INTERVAL = float(os.environ.get('ADMISSION_SYNC_INTERVAL', 15))
+# Broadcast backplane: "memory" (single worker), "unix" (workers on one host)
+# or "redis" (several hosts; needs the redis package).
+EVENT_BUS = os.environ.get('EVENT_BUS', 'memory')
+EVENT_BUS_SOCKET_DIR = os.environ.get('EVENT_BUS_SOCKET_DIR', '/tmp/orchestrator-bus')
+EVENT_BUS_CHANNEL = os.environ.get('EVENT_BUS_CHANNEL', 'orchestrator:events')
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+EVENT_BUS_RETRY_MAX = float(os.environ.get('EVENT_BUS_RETRY_MAX', 30))
+EVENT_BUS_OUTBOX_SIZE = int(os.environ.get('EVENT_BUS_OUTBOX_SIZE', 1000))
+EVENT_BUS_PEER_SCAN = float(os.environ.get('EVENT_BUS_PEER_SCAN', 1))
+
+# Operations that can hold a worker thread for seconds; they share a smaller
+# lane so quick lookups always have threads left in the pool.
+DOCKER_LIFECYCLE_OPS = {"run", "start", "stop", "restart", "remove"}
+DOCKER_OP_TIMEOUTS = {
+    "connect": 5.0,
+    "ping": 5.0,
+    "get": 5.0,
+    "list": 5.0,
+    "logs": 15.0,
+    "stats": 10.0,
+    "run": 300.0,
+    "start": 60.0,
+    "stop": DOCKER_STOP_TIMEOUT + 5.0,
+    "restart": DOCKER_STOP_TIMEOUT + 30.0,
+    "remove": 30.0,
+    "pull": 1800.0,
+}
+
+# "Try Again Later": sent to clients evicted by the disconnect policy
+WS_CLOSE_TRY_AGAIN_LATER = 1013
+
+LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+class LatencyHistogram:
+    """Cumulative-bucket latency histogram in milliseconds."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, elapsed_ms: float):
+        self.counts[bisect.bisect_left(self.buckets, elapsed_ms)] += 1
+        self.count += 1
+        self.total += elapsed_ms
+        self.max = max(self.max, elapsed_ms)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile."""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count, 2) if self.count else None,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "max_ms": round(self.max, 2),
+            "buckets": {**{str(bound): count for bound, count in zip(self.buckets, self.counts)},
+                        "+Inf": self.counts[-1]},
+        }
+
+class DockerTimeout(Exception):
+    def __init__(self, op: str, timeout: float):
+        super().__init__(f"Docker operation '{op}' timed out after {timeout}s")
+        self.op = op
+        self.timeout = timeout
+
+class DockerGateway:
+    """Runs blocking docker-py calls on a bounded thread pool.
+
+    Every call gets a per-operation timeout and goes through a concurrency
+    limit, so a slow stop or stats call never blocks the event loop. One
+    DockerClient (and its connection pool) is shared for the whole process
+    and rebuilt when the daemon connection drops. Long-lived stats and log
+    streams use a second client sized for them, so they never take the
+    pooled connections short calls reuse, and at most DOCKER_STREAM_LIMIT
+    of them run at once.
+    """
+
+    def __init__(self, max_workers: int, lifecycle_concurrency: int, pool_size: int, base_url: Optional[str] = None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="docker")
+        self.base_url = base_url
+        self.slots = asyncio.Semaphore(max_workers)
+        self.lifecycle_slots = asyncio.Semaphore(min(lifecycle_concurrency, max_workers))
+        self.pool_size = pool_size
+        self.docker_client = None
+        self.stream_docker_client = None
+        self.client_lock = asyncio.Lock()
+        self.stream_slots = threading.BoundedSemaphore(DOCKER_STREAM_LIMIT)
+        self.active_streams = 0
+        self.healthy = False
+        self.counters = {"connects": 0, "reconnects": 0, "reuses": 0, "health_failures": 0, "streams_rejected": 0}
+        self.latency: Dict[str, LatencyHistogram] = {}
+        self.failures: Dict[tuple, int] = {}
+
+    async def run(self, op: str, fn, /, *args, op_timeout: Optional[float] = None, **kwargs):
+        # Positional-only so docker-py keyword arguments such as timeout= pass through
+        op_timeout = op_timeout or DOCKER_OP_TIMEOUTS.get(op, DOCKER_CALL_TIMEOUT)
+        if op in DOCKER_LIFECYCLE_OPS:
+            async with self.lifecycle_slots:
+                return await self._submit(op, op_timeout, fn, *args, **kwargs)
+        return await self._submit(op, op_timeout, fn, *args, **kwargs)
+
+    async def _submit(self, op: str, op_timeout: float, fn, /, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        async with self.slots:
+            future = loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                result = await asyncio.wait_for(future, op_timeout)
+                outcome = None
+                return result
+            except asyncio.TimeoutError:
+                outcome = "timeout"
+                raise DockerTimeout(op, op_timeout)
+            except requests.exceptions.ConnectionError:
+                # The daemon went away; drop the client so the next call reconnects
+                outcome = "connection"
+                self.invalidate()
+                raise
+            finally:
+                self.observe(op, (time.perf_counter() - started) * 1000, outcome)
+
+    def observe(self, op: str, elapsed_ms: float, outcome: Optional[str]):
+        histogram = self.latency.get(op)
+        if histogram is None:
+            histogram = self.latency[op] = LatencyHistogram()
+        histogram.observe(elapsed_ms)
+        if outcome:
+            self.failures[(op, outcome)] = self.failures.get((op, outcome), 0) + 1
+
+    async def client(self):
+        if self.docker_client is not None:
+            self.counters["reuses"] += 1
+            return self.docker_client
+        async with self.client_lock:
+            if self.docker_client is None:
+                self.docker_client = await self.run("connect", self._connect, self.pool_size)
+                if self.counters["connects"] > 0:
+                    self.counters["reconnects"] += 1
+                self.counters["connects"] += 1
+                self.healthy = True
+                logger.info(f"Docker client connected to {self.base_url or 'local daemon'} (pool size {self.pool_size})")
+        return self.docker_client
+
+    def _connect(self, pool_size: int):
+        if self.base_url:
+            return docker.DockerClient(base_url=self.base_url, max_pool_size=pool_size)
+        return docker.from_env(max_pool_size=pool_size)
+
+    async def stream_client(self):
+        if self.stream_docker_client is None:
+            async with self.client_lock:
+                if self.stream_docker_client is None:
+                    self.stream_docker_client = await self.run("connect", self._connect, DOCKER_STREAM_LIMIT)
+        return self.stream_docker_client
+
+    def start_stream(self, name: str, target, *args) -> Optional[threading.Thread]:
+        """Run a blocking stream reader on its own thread; None when every stream slot is taken."""
+        if not self.stream_slots.acquire(blocking=False):
+            self.counters["streams_rejected"] += 1
+            return None
+        self.active_streams += 1
+
+        def run():
+            try:
+                target(*args)
+            finally:
+                self.active_streams -= 1
+                self.stream_slots.release()
+
+        thread = threading.Thread(target=run, name=name, daemon=True)
+        thread.start()
+        return thread
+
+    def invalidate(self):
+        clients = (self.docker_client, self.stream_docker_client)
+        self.docker_client = self.stream_docker_client = None
+        self.healthy = False
+        for client in clients:
+            if client is not None:
+                try:
+                    client.close()
+                except Exception:
+                    pass
+
+    async def health_check(self) -> bool:
+        try:
+            client = await self.client()
+            await self.run("ping", client.ping)
+            self.healthy = True
+        except Exception as e:
+            self.healthy = False
+            self.counters["health_failures"] += 1
+            logger.warning(f"Docker health check failed: {e}")
+            self.invalidate()
+        return self.healthy
+
+    async def health_loop(self):
+        while True:
+            await self.health_check()
+            await asyncio.sleep(DOCKER_HEALTH_INTERVAL)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"connected": self.docker_client is not None, "healthy": self.healthy,
+                "pool_size": self.pool_size, "streams": self.active_streams, "stream_limit": DOCKER_STREAM_LIMIT,
+                **self.counters}
+
+    async def get_container(self, service_id: str):
+        client = await self.client()
+        return await self.run("get", client.containers.get, f"orch_{service_id}")
+
+    async def list_container_states(self) -> Dict[str, Dict[str, Any]]:
+        """Status of every orch_* container keyed by service id, from one list call."""
+        client = await self.client()
+        containers = await self.run("list", client.api.containers, all=True, filters={"name": "orch_"})
+        states = {}
+        for container in containers:
+            for name in container.get('Names') or []:
+                name = name.lstrip('/')
+                if name.startswith('orch_'):
+                    states[name[len('orch_'):]] = {"status": container['State'], "container_id": container['Id']}
+        return states
+
+    def shutdown(self):
+        self.invalidate()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+docker_gateway = DockerGateway(DOCKER_MAX_WORKERS, DOCKER_LIFECYCLE_CONCURRENCY, DOCKER_POOL_SIZE)
+
+def _docker_time(value: Optional[str]) -> Optional[str]:
+    # Docker reports "never" as the zero time
+    if not value or value.startswith("0001-01-01"):
+        return None
+    return value
+
+def state_timestamp(value: Optional[str]) -> Optional[float]:
+    """Epoch seconds of a container state time, from an event isoformat or Docker's RFC3339Nano."""
+    if not value:
+        return None
     try:
-        db_pool = await aiomysql.create_pool(
-            host=os.environ.get('MYSQL_HOST', 'localhost'),
-            port=int(os.environ.get('MYSQL_PORT', 3306)),
-            user=os.environ.get('MYSQL_USER', 'root'),
-            password=os.environ.get('MYSQL_PASSWORD', 'rootpass'),
-            db=os.environ.get('MYSQL_DATABASE', 'orchestration_db'),
-            autocommit=True,
-            maxsize=10
+        parsed = datetime.fromisoformat(re.sub(r'(\.\d{6})\d+', r'\1', value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return (parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)).timestamp()
+
+def _container_state(service_id: str, inspect: Dict[str, Any]) -> Dict[str, Any]:
+    state = inspect.get('State') or {}
+    health = state.get('Health') or {}
+    return {
+        "service_id": service_id,
+        "status": state.get('Status', 'unknown'),
+        "container_id": inspect.get('Id'),
+        "started_at": _docker_time(state.get('StartedAt')),
+        "finished_at": _docker_time(state.get('FinishedAt')),
+        "exit_code": state.get('ExitCode'),
+        "oom_killed": bool(state.get('OOMKilled')),
+        "health": health.get('Status'),
+        "health_at": _docker_time((health.get('Log') or [{}])[-1].get('End')),
+    }
+
+class DockerEventSource:
+    """Container snapshots and the live events stream of the Docker daemon."""
+
+    def __init__(self, gateway: DockerGateway):
+        self.gateway = gateway
+
+    async def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        client = await self.gateway.client()
+        containers = await self.gateway.run("list", client.api.containers, all=True, filters={"name": "orch_"})
+        names = [name.lstrip('/') for c in containers for name in c.get('Names') or []]
+        names = [name for name in names if name.startswith('orch_')]
+        inspects = await asyncio.gather(
+            *(self.gateway.run("get", client.api.inspect_container, name) for name in names),
+            return_exceptions=True
         )
-        logger.info("MySQL pool created successfully")
+        return {
+            name[len('orch_'):]: _container_state(name[len('orch_'):], inspect)
+            for name, inspect in zip(names, inspects) if isinstance(inspect, dict)
+        }
+
+    async def subscribe(self):
+        """Open the events stream now and return an async iterator over it.
+
+        The stream is opened before the caller takes its snapshot, so no event
+        between the two is lost.
+        """
+        client = await self.gateway.client()
+        stream = await self.gateway.run("connect", client.events, decode=True, filters={"type": "container"})
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+
+        def pump():
+            try:
+                for event in stream:
+                    loop.call_soon_threadsafe(queue.put_nowait, event)
+            except Exception as e:
+                logger.warning(f"Docker events stream ended: {e}")
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, None)
+
+        threading.Thread(target=pump, name="docker-events", daemon=True).start()
+        return DockerEventStream(queue, stream)
+
+class DockerEventStream:
+    """Async iterator over events pumped from the daemon by a reader thread.
+
+    aclose() closes the daemon stream, which also ends the reader thread, even
+    when iteration never started.
+    """
+
+    def __init__(self, queue: asyncio.Queue, stream):
+        self.queue = queue
+        self.stream = stream
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Dict[str, Any]:
+        event = await self.queue.get()
+        if event is None:
+            raise StopAsyncIteration
+        return event
+
+    async def aclose(self):
+        with suppress(Exception):
+            self.stream.close()
+
+class QueueEventSource:
+    """In-process event source fed by push(); stands in for the daemon in tests."""
+
+    def __init__(self, initial: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.initial = initial or {}
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    async def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {service_id: dict(state) for service_id, state in self.initial.items()}
+
+    async def subscribe(self):
+        return self._drain()
+
+    async def _drain(self):
+        while True:
+            event = await self.queue.get()
+            if event is None:
+                return
+            yield event
+
+    def push(self, event: Dict[str, Any]):
+        self.queue.put_nowait(event)
+
+    def disconnect(self):
+        self.queue.put_nowait(None)
+
+class ContainerStateCache:
+    """In-process table of orch_* container state kept current by Docker events.
+
+    Each change is broadcast as a container_state diff. The table is rebuilt
+    from a snapshot every time the events stream (re)connects.
+    """
+
+    def __init__(self):
+        self.states: Dict[str, Dict[str, Any]] = {}
+        self.synced = False
+
+    def get(self, service_id: str) -> Dict[str, Any]:
+        return self.states.get(service_id) or {"service_id": service_id, "status": "stopped", "container_id": None}
+
+    async def run(self, source):
+        delay = 1.0
+        while True:
+            try:
+                events = await source.subscribe()
+                try:
+                    await self.resync(await source.snapshot())
+                    delay = 1.0
+                    async for event in events:
+                        await self.apply_event(event)
+                finally:
+                    # Also on a failed snapshot, so the daemon stream is not leaked
+                    await events.aclose()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Container state sync failed: {e}")
+            self.synced = False
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, DOCKER_EVENTS_RETRY_MAX)
+
+    async def resync(self, snapshot: Dict[str, Dict[str, Any]]):
+        for service_id in set(self.states) | set(snapshot):
+            await self._update(service_id, snapshot.get(service_id))
+        self.synced = True
+
+    async def apply_event(self, event: Dict[str, Any]):
+        actor = event.get('Actor') or {}
+        attributes = actor.get('Attributes') or {}
+        name = attributes.get('name', '')
+        if event.get('Type', 'container') != 'container' or not name.startswith('orch_'):
+            return
+        service_id = name[len('orch_'):]
+        action = event.get('Action') or event.get('status') or ''
+        when = event['timeNano'] / 1e9 if event.get('timeNano') else event.get('time')
+        when = datetime.fromtimestamp(when, timezone.utc).isoformat() if when else None
+
+        state = dict(self.get(service_id))
+        state['container_id'] = actor.get('ID') or event.get('id') or state.get('container_id')
+        # A healthy result never outlives the process that earned it; containers
+        # with a HEALTHCHECK go back to 'starting' until the next health_status.
+        # health_at is when health last changed.
+        health = state.get('health')
+        restarted = 'starting' if health is not None else None
+        if action == 'destroy':
+            await self._update(service_id, None)
+            return
+        if action == 'create':
+            state.update(status='created', exit_code=None, oom_killed=False)
+            health = None
+        elif action in ('start', 'restart'):
+            state.update(status='running', started_at=when or state.get('started_at'), exit_code=None,
+                         oom_killed=False)
+            health = restarted
+        elif action == 'unpause':
+            state.update(status='running', exit_code=None, oom_killed=False)
+        elif action == 'die':
+            exit_code = attributes.get('exitCode')
+            state.update(status='exited', finished_at=when, exit_code=int(exit_code) if exit_code is not None else None)
+            health = restarted
+        elif action == 'oom':
+            state['oom_killed'] = True
+        elif action == 'pause':
+            state['status'] = 'paused'
+        elif action.startswith('health_status:'):
+            health = action.split(':', 1)[1].strip()
+        else:
+            return
+        if health != state.get('health'):
+            state['health_at'] = when
+        state['health'] = health
+        await self._update(service_id, state)
+
+    async def _update(self, service_id: str, state: Optional[Dict[str, Any]]):
+        old = self.states.get(service_id)
+        if state is None:
+            if old is None:
+                return
+            del self.states[service_id]
+            state = {"service_id": service_id, "status": "stopped", "container_id": None}
+        else:
+            state.setdefault('service_id', service_id)
+            self.states[service_id] = state
+        changes = {key: value for key, value in state.items() if (old or {}).get(key) != value}
+        if changes:
+            state_waiters.notify(service_id, state)
+            if changes.get('health') == 'healthy':
+                readiness.notify_ready(service_id, "docker_healthcheck")
+            await broadcast_message({"type": "container_state", "service_id": service_id,
+                                     "changes": changes, "state": state}, local=True)
+
+container_states = ContainerStateCache()
+
+def compute_stats(stats: Dict[str, Any]) -> Dict[str, float]:
+    """Flatten one Docker stats document into the numbers we keep per sample."""
+    cpu_stats = stats.get('cpu_stats') or {}
+    precpu_stats = stats.get('precpu_stats') or {}
+    cpu_delta = (cpu_stats.get('cpu_usage') or {}).get('total_usage', 0) - (precpu_stats.get('cpu_usage') or {}).get('total_usage', 0)
+    system_delta = cpu_stats.get('system_cpu_usage', 0) - precpu_stats.get('system_cpu_usage', 0)
+    cpu_percent = (cpu_delta / system_delta) * 100.0 if system_delta > 0 and precpu_stats.get('system_cpu_usage') else 0.0
+
+    memory_stats = stats.get('memory_stats') or {}
+    networks = (stats.get('networks') or {}).values()
+    blkio = (stats.get('blkio_stats') or {}).get('io_service_bytes_recursive') or []
+    return {
+        "cpu_percent": cpu_percent,
+        "memory_usage": float(memory_stats.get('usage', 0)),
+        "memory_limit": float(memory_stats.get('limit', 0)),
+        "net_rx": float(sum(n.get('rx_bytes', 0) for n in networks)),
+        "net_tx": float(sum(n.get('tx_bytes', 0) for n in networks)),
+        "blk_read": float(sum(e.get('value', 0) for e in blkio if e.get('op', '').lower() == 'read')),
+        "blk_write": float(sum(e.get('value', 0) for e in blkio if e.get('op', '').lower() == 'write')),
+    }
+
+def format_stats(sample: Optional[Dict[str, float]]) -> Dict[str, Any]:
+    if not sample:
+        return {"cpu_percent": 0, "memory_usage_mb": 0, "memory_percent": 0}
+    mem_limit = sample['memory_limit']
+    return {
+        "cpu_percent": round(sample['cpu_percent'], 2),
+        "memory_usage_mb": round(sample['memory_usage'] / (1024 * 1024), 2),
+        "memory_percent": round((sample['memory_usage'] / mem_limit) * 100.0 if mem_limit > 0 else 0.0, 2),
+        "net_rx_bytes": int(sample['net_rx']),
+        "net_tx_bytes": int(sample['net_tx']),
+        "blk_read_bytes": int(sample['blk_read']),
+        "blk_write_bytes": int(sample['blk_write']),
+        "timestamp": sample['ts'],
+    }
+
+class StatsRing:
+    """Fixed-size ring buffer of stats samples, one array('d') column per field."""
+
+    FIELDS = ("ts", "cpu_percent", "memory_usage", "memory_limit", "net_rx", "net_tx", "blk_read", "blk_write")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.columns = {field: array('d', bytes(8 * capacity)) for field in self.FIELDS}
+        self.count = 0
+        self.head = 0
+        self.lock = threading.Lock()
+
+    def append(self, sample: Dict[str, float]):
+        with self.lock:
+            for field, column in self.columns.items():
+                column[self.head] = sample[field]
+            self.head = (self.head + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+
+    def latest(self) -> Optional[Dict[str, float]]:
+        with self.lock:
+            if not self.count:
+                return None
+            i = (self.head - 1) % self.capacity
+            return {field: column[i] for field, column in self.columns.items()}
+
+    def window(self, seconds: float, points: int) -> List[Dict[str, float]]:
+        """Samples from the last `seconds`, averaged into at most `points` buckets."""
+        with self.lock:
+            indices = [(self.head - self.count + k) % self.capacity for k in range(self.count)]
+            ts = self.columns['ts']
+            since = time.time() - seconds
+            indices = [i for i in indices if ts[i] >= since]
+            if not indices:
+                return []
+            size = -(-len(indices) // max(points, 1))
+            series = []
+            for start in range(0, len(indices), size):
+                bucket = indices[start:start + size]
+                point = {field: sum(column[i] for i in bucket) / len(bucket) for field, column in self.columns.items()}
+                point['ts'] = ts[bucket[-1]]
+                series.append(point)
+            return series
+
+    def aggregate(self, start: float, end: float) -> Optional[tuple]:
+        """(samples, cpu sum, cpu max, memory sum, memory max) over samples in [start, end)."""
+        with self.lock:
+            ts, cpu, mem = self.columns['ts'], self.columns['cpu_percent'], self.columns['memory_usage']
+            samples, cpu_sum, cpu_max, mem_sum, mem_max = 0, 0.0, 0.0, 0.0, 0.0
+            # Walk back from the newest sample; the ring is in time order
+            for k in range(1, self.count + 1):
+                i = (self.head - k) % self.capacity
+                if ts[i] >= end:
+                    continue
+                if ts[i] < start:
+                    break
+                samples += 1
+                cpu_sum += cpu[i]
+                cpu_max = max(cpu_max, cpu[i])
+                mem_sum += mem[i]
+                mem_max = max(mem_max, mem[i])
+        return (samples, cpu_sum, cpu_max, mem_sum, mem_max) if samples else None
+
+class StatsSampler:
+    """Streams Docker stats for one container into a StatsRing on a daemon thread."""
+
+    def __init__(self, service_id: str, ring: StatsRing):
+        self.service_id = service_id
+        self.ring = ring
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, gateway: DockerGateway, client) -> bool:
+        self.stopped.clear()
+        self.thread = gateway.start_stream(f"stats-{self.service_id}", self._pump, client)
+        return self.thread is not None
+
+    def stop(self):
+        self.stopped.set()
+
+    def _pump(self, client):
+        try:
+            for stats in client.api.stats(f"orch_{self.service_id}", stream=True, decode=True):
+                if self.stopped.is_set():
+                    return
+                if not (stats.get('precpu_stats') or {}).get('system_cpu_usage'):
+                    continue
+                sample = compute_stats(stats)
+                sample['ts'] = time.time()
+                self.ring.append(sample)
+        except Exception as e:
+            logger.debug(f"Stats stream for {self.service_id} ended: {e}")
+
+class StatsManager:
+    """One sampler per running container, shared by every reader of its stats."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.rings: Dict[str, StatsRing] = {}
+        self.samplers: Dict[str, StatsSampler] = {}
+
+    async def ensure(self, service_id: str):
+        sampler = self.samplers.get(service_id)
+        if sampler and sampler.alive:
+            return
+        gateway = host_registry.gateway_for(service_id)
+        client = await gateway.stream_client()
+        ring = self.rings.setdefault(service_id, StatsRing(self.capacity))
+        sampler = StatsSampler(service_id, ring)
+        if sampler.start(gateway, client):
+            self.samplers[service_id] = sampler
+        else:
+            logger.debug(f"No stream slot free for {service_id} stats; retrying on the next scan")
+
+    def discard(self, service_id: str):
+        sampler = self.samplers.pop(service_id, None)
+        if sampler:
+            sampler.stop()
+        self.rings.pop(service_id, None)
+
+    def latest(self, service_id: str) -> Optional[Dict[str, float]]:
+        ring = self.rings.get(service_id)
+        return ring.latest() if ring else None
+
+    def history(self, service_id: str, seconds: float, points: int) -> List[Dict[str, float]]:
+        ring = self.rings.get(service_id)
+        return ring.window(seconds, points) if ring else []
+
+    async def run(self):
+        while True:
+            try:
+                statuses = await get_container_statuses()
+                running = {service_id for service_id, state in statuses.items() if state['status'] == 'running'}
+                for service_id in running:
+                    await self.ensure(service_id)
+                for service_id in set(self.samplers) - running:
+                    self.discard(service_id)
+            except Exception as e:
+                logger.debug(f"Stats sampler scan failed: {e}")
+            await asyncio.sleep(STATS_SCAN_INTERVAL)
+
+    def shutdown(self):
+        for sampler in self.samplers.values():
+            sampler.stop()
+
+stats_manager = StatsManager(STATS_BUFFER_SIZE)
+
+class FileLeaderLock:
+    """An flock on a file in a directory the workers share; the holder leads.
+
+    The kernel drops the lock when its holder exits, so another worker takes
+    it over on its next try.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self.fd is not None
+
+    def acquire(self) -> bool:
+        if self.fd is not None:
+            return True
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self.fd = fd
+        logger.info(f"This worker now writes to {self.path.parent}")
+        return True
+
+    def release(self):
+        fd, self.fd = self.fd, None
+        if fd is not None:
+            os.close(fd)
+
+# Rollup tiers: (name, bucket seconds, retention seconds, partition strftime format)
+METRICS_TIERS = (
+    ("10s", 10, METRICS_RETENTION_10S, "%Y-%m-%d"),
+    ("1m", 60, METRICS_RETENTION_1M, "%Y-%m-%d"),
+    ("1h", 3600, METRICS_RETENTION_1H, "%Y-%m"),
+)
+
+class RollupBucket:
+    __slots__ = ("start", "samples", "cpu_sum", "cpu_max", "mem_sum", "mem_max")
+
+    def __init__(self, start: float):
+        self.start = start
+        self.samples = 0
+        self.cpu_sum = self.cpu_max = self.mem_sum = self.mem_max = 0.0
+
+    def add(self, samples: int, cpu_sum: float, cpu_max: float, mem_sum: float, mem_max: float):
+        self.samples += samples
+        self.cpu_sum += cpu_sum
+        self.cpu_max = max(self.cpu_max, cpu_max)
+        self.mem_sum += mem_sum
+        self.mem_max = max(self.mem_max, mem_max)
+
+    def row(self) -> tuple:
+        return (self.start, self.samples, self.cpu_sum / self.samples, self.cpu_max,
+                self.mem_sum / self.samples, self.mem_max)
+
+class MetricsHistory:
+    """Downsampled CPU/memory history for every sampled container.
+
+    Every 10 s the latest ring samples are folded into 10 s, 1 min and 1 h
+    buckets. Finished buckets are buffered and flushed in batches to
+    fixed-width numpy record files, one per tier, service and day (month for
+    the 1 h tier), so a query reads only the partitions it needs. Only the
+    worker holding the directory's writer lock records; the others read.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.leader = FileLeaderLock(directory / 'writer.lock')
+        self.last_flush = time.monotonic()
+        self.open: Dict[tuple, RollupBucket] = {}
+        self.pending: Dict[tuple, List[tuple]] = {}
+        self.counters = {"ticks": 0, "rows": 0, "flushes": 0, "expired_files": 0}
+        self.last_tick_ms = 0.0
+        self.last_flush_ms = 0.0
+
+    @staticmethod
+    def dtype():
+        import numpy as np
+        return np.dtype([("ts", "<f8"), ("samples", "<u4"), ("cpu", "<f4"), ("cpu_max", "<f4"),
+                         ("mem", "<f4"), ("mem_max", "<f4")])
+
+    def tick(self, bucket_end: float):
+        """Fold the samples of [bucket_end - 10 s, bucket_end) into every tier."""
+        started = time.perf_counter()
+        bucket_start = bucket_end - METRICS_TIERS[0][1]
+        for service_id, ring in list(stats_manager.rings.items()):
+            aggregate = ring.aggregate(bucket_start, bucket_end)
+            if aggregate is None:
+                continue
+            for tier, period, _, _ in METRICS_TIERS:
+                key = (tier, service_id)
+                start = bucket_start - bucket_start % period
+                bucket = self.open.get(key)
+                if bucket is not None and bucket.start != start:
+                    self.emit(key, bucket)
+                    bucket = None
+                if bucket is None:
+                    bucket = self.open[key] = RollupBucket(start)
+                bucket.add(*aggregate)
+        # Close buckets whose period is over even if their container went quiet
+        for key, bucket in list(self.open.items()):
+            period = next(p for tier, p, _, _ in METRICS_TIERS if tier == key[0])
+            if bucket.start + period <= bucket_end:
+                self.emit(key, self.open.pop(key))
+        self.counters["ticks"] += 1
+        self.last_tick_ms = (time.perf_counter() - started) * 1000
+
+    def emit(self, key: tuple, bucket: RollupBucket):
+        self.pending.setdefault(key, []).append(bucket.row())
+        self.counters["rows"] += 1
+
+    def partition_path(self, tier: str, service_id: str, ts: float) -> Path:
+        fmt = next(f for name, _, _, f in METRICS_TIERS if name == tier)
+        return self.directory / tier / service_id / f"{time.strftime(fmt, time.gmtime(ts))}.bin"
+
+    def flush(self, pending: Dict[tuple, List[tuple]]):
+        import numpy as np
+        
+        started = time.perf_counter()
+        dtype = self.dtype()
+        for (tier, service_id), rows in pending.items():
+            by_path: Dict[Path, List[tuple]] = {}
+            for row in rows:
+                by_path.setdefault(self.partition_path(tier, service_id, row[0]), []).append(row)
+            for path, part in by_path.items():
+                path.parent.mkdir(parents=True, exist_ok=True)
+                with open(path, 'ab') as f:
+                    np.array(part, dtype=dtype).tofile(f)
+        self.counters["flushes"] += 1
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+
+    def enforce_retention(self, now: float):
+        for tier, _, retention, fmt in METRICS_TIERS:
+            cutoff = time.strftime(fmt, time.gmtime(now - retention))
+            tier_dir = self.directory / tier
+            if not tier_dir.exists():
+                continue
+            # Partition names sort chronologically, so anything before the cutoff's name is expired
+            for path in tier_dir.glob("*/*.bin"):
+                if path.stem < cutoff:
+                    with suppress(OSError):
+                        path.unlink()
+                        self.counters["expired_files"] += 1
+
+    def choose_tier(self, start: float, now: float) -> str:
+        for tier, _, retention, _ in METRICS_TIERS:
+            if now - start <= retention:
+                return tier
+        return METRICS_TIERS[-1][0]
+
+    def read(self, tier: str, service_id: str, start: float, end: float):
+        import numpy as np
         
+        dtype = self.dtype()
+        fmt = next(f for name, _, _, f in METRICS_TIERS if name == tier)
+        step = 86400 if fmt == "%Y-%m-%d" else 28 * 86400
+        names = {time.strftime(fmt, time.gmtime(ts)) for ts in np.arange(start, end + step, step)}
+        names.add(time.strftime(fmt, time.gmtime(end)))
+        parts = [np.fromfile(path, dtype=dtype) for path in
+                 (self.directory / tier / service_id / f"{name}.bin" for name in sorted(names)) if path.exists()]
+        pending = self.pending.get((tier, service_id))
+        if pending:
+            parts.append(np.array(pending, dtype=dtype))
+        if not parts:
+            return np.empty(0, dtype=dtype)
+        rows = np.concatenate(parts)
+        return rows[(rows["ts"] >= start) & (rows["ts"] < end)]
+
+    def summarize(self, tier: str, service_ids: List[str], start: float, end: float) -> Dict[str, Any]:
+        import numpy as np
+        
+        result = {}
+        for service_id in service_ids:
+            rows = self.read(tier, service_id, start, end)
+            if not len(rows):
+                continue
+            weights = rows["samples"].astype(np.float64)
+            summary = {"points": int(len(rows)), "samples": int(weights.sum())}
+            for field, name, scale in (("cpu", "cpu_percent", 1.0), ("mem", "memory_mb", 1 / (1024 * 1024))):
+                values = rows[field].astype(np.float64) * scale
+                p50, p95 = np.percentile(values, [50, 95])
+                summary[name] = {
+                    "p50": round(float(p50), 2),
+                    "p95": round(float(p95), 2),
+                    "avg": round(float(np.average(values, weights=weights)), 2),
+                    "max": round(float(rows[field + "_max"].max()) * scale, 2),
+                }
+            result[service_id] = summary
+        return result
+
+    def known_services(self, tier: str) -> List[str]:
+        tier_dir = self.directory / tier
+        on_disk = {path.name for path in tier_dir.iterdir()} if tier_dir.exists() else set()
+        return sorted(on_disk | {service_id for t, service_id in self.pending if t == tier})
+
+    async def step(self, now: float):
+        """Close the 10 s bucket ending before `now` and flush when due, if this worker records."""
+        if not self.leader.held and not await asyncio.to_thread(self.leader.acquire):
+            return
+        period = METRICS_TIERS[0][1]
+        self.tick(now - now % period)
+        if time.monotonic() - self.last_flush >= METRICS_FLUSH_INTERVAL:
+            pending, self.pending = self.pending, {}
+            await asyncio.to_thread(self.flush, pending)
+            await asyncio.to_thread(self.enforce_retention, now)
+            self.last_flush = time.monotonic()
+
+    async def run(self):
+        period = METRICS_TIERS[0][1]
+        self.last_flush = time.monotonic()
+        while True:
+            # Wake just after each 10 s boundary so the closed bucket is complete
+            now = time.time()
+            await asyncio.sleep(period - now % period + 1.0)
+            try:
+                await self.step(time.time())
+            except Exception as e:
+                logger.warning(f"Metrics history update failed: {e}")
+
+    def shutdown(self):
+        pending, self.pending = self.pending, {}
+        with suppress(Exception):
+            self.flush(pending)
+        self.leader.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"directory": str(self.directory), "leader": self.leader.held, "open_buckets": len(self.open),
+                "pending_rows": sum(len(rows) for rows in self.pending.values()),
+                "last_tick_ms": round(self.last_tick_ms, 2), "last_flush_ms": round(self.last_flush_ms, 2),
+                **self.counters}
+
+metrics_history = MetricsHistory(Path(METRICS_HISTORY_DIR))
+
+
+def repo_name(image: str) -> str:
+    """Repository with Docker Hub's implicit registry and library/ prefix removed."""
+    for prefix in ('docker.io/', 'index.docker.io/', 'registry-1.docker.io/'):
+        if image.startswith(prefix):
+            image = image[len(prefix):]
+            break
+    return image[len('library/'):] if image.startswith('library/') else image
+
+def repo_digest(info: Dict[str, Any], image: str) -> Optional[str]:
+    """The RepoDigests entry for `image`; an image pushed to several repos lists one per repo."""
+    repo = repo_name(image)
+    for digest in info.get('RepoDigests') or []:
+        if repo_name(digest.split('@', 1)[0]) == repo:
+            return digest
+    return None
+
+class ImageState:
+    def __init__(self, image: str, tag: str):
+        self.image = image
+        self.tag = tag
+        self.state = "unknown"
+        self.digest: Optional[str] = None
+        self.layers: Dict[str, Dict[str, Any]] = {}
+        self.error: Optional[str] = None
+        self.pulled_at: Optional[str] = None
+        self.last_broadcast = 0.0
+
+    @property
+    def ref(self) -> str:
+        return f"{self.image}:{self.tag}"
+
+    @property
+    def progress(self) -> float:
+        total = sum(layer.get('total') or 0 for layer in self.layers.values())
+        current = sum(layer.get('current') or 0 for layer in self.layers.values())
+        return round(current / total, 3) if total else (1.0 if self.state == "warm" else 0.0)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"image": self.ref, "state": self.state, "digest": self.digest, "progress": self.progress,
+                "layers": len(self.layers), "error": self.error, "pulled_at": self.pulled_at}
+
+class ImageManager:
+    """Keeps images of enabled services pulled so start only creates and starts.
+
+    Pulls run in the background with bounded concurrency. Concurrent callers
+    of the same image share one pull, and layer progress is broadcast as
+    image_pull messages.
+    """
+
+    def __init__(self, gateway: DockerGateway, concurrency: int):
+        self.gateway = gateway
+        self.slots = asyncio.Semaphore(concurrency)
+        self.images: Dict[str, ImageState] = {}
+        self.pulls: Dict[str, asyncio.Future] = {}
+
+    def get(self, image: str, tag: str) -> ImageState:
+        ref = f"{image}:{tag}"
+        if ref not in self.images:
+            self.images[ref] = ImageState(image, tag)
+        return self.images[ref]
+
+    async def check(self, image: str, tag: str) -> ImageState:
+        state = self.get(image, tag)
+        if state.state == "pulling":
+            return state
+        client = await self.gateway.client()
+        try:
+            info = await self.gateway.run("get", client.api.inspect_image, state.ref)
+            state.state = "warm"
+            state.digest = repo_digest(info, state.image)
+        except docker.errors.ImageNotFound:
+            state.state = "cold"
+        return state
+
+    async def ensure(self, image: str, tag: str) -> str:
+        """Make sure the image is local and return the reference to run."""
+        state = await self.check(image, tag)
+        if state.state != "warm":
+            await self.pull(image, tag)
+        return state.digest if IMAGE_PIN_DIGESTS and state.digest else state.ref
+
+    async def pull(self, image: str, tag: str) -> ImageState:
+        state = self.get(image, tag)
+        future = self.pulls.get(state.ref)
+        if future is None:
+            future = asyncio.ensure_future(self._pull(state))
+            self.pulls[state.ref] = future
+            future.add_done_callback(lambda _: self.pulls.pop(state.ref, None))
+        await asyncio.shield(future)
+        return state
+
+    async def _pull(self, state: ImageState):
+        async with self.slots:
+            state.state = "pulling"
+            state.layers = {}
+            state.error = None
+            loop = asyncio.get_running_loop()
+            client = await self.gateway.client()
+
+            def on_progress(event: Dict[str, Any]):
+                loop.call_soon_threadsafe(self._record, state, event)
+
+            try:
+                await self.gateway.run("pull", self._pull_blocking, client, state, on_progress)
+                info = await self.gateway.run("get", client.api.inspect_image, state.ref)
+                state.digest = repo_digest(info, state.image)
+                state.state = "warm"
+                state.pulled_at = datetime.now(timezone.utc).isoformat()
+            except Exception as e:
+                state.state = "error"
+                state.error = str(e)
+                logger.error(f"Error pulling {state.ref}: {e}")
+                raise
+            finally:
+                await broadcast_message({"type": "image_pull", **state.to_dict()})
+
+    @staticmethod
+    def _pull_blocking(client, state: ImageState, on_progress):
+        for event in client.api.pull(state.image, tag=state.tag, stream=True, decode=True):
+            if 'error' in event:
+                raise docker.errors.APIError(event['error'])
+            on_progress(event)
+
+    def _record(self, state: ImageState, event: Dict[str, Any]):
+        layer_id = event.get('id')
+        if layer_id and event.get('progressDetail') is not None:
+            layer = state.layers.setdefault(layer_id, {})
+            layer['status'] = event.get('status')
+            layer.update({k: v for k, v in event['progressDetail'].items() if k in ('current', 'total')})
+            if event.get('status') in ('Pull complete', 'Already exists') and layer.get('total'):
+                layer['current'] = layer['total']
+        now = time.monotonic()
+        if now - state.last_broadcast >= 1.0:
+            state.last_broadcast = now
+            asyncio.ensure_future(broadcast_message({"type": "image_pull", **state.to_dict()}))
+
+    async def warm_enabled(self):
         async with db_pool.acquire() as conn:
             async with conn.cursor() as cursor:
-                await cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS services (
-                        id VARCHAR(100) PRIMARY KEY,
-                        name VARCHAR(255) NOT NULL,
-                        category VARCHAR(50) NOT NULL,
-                        image VARCHAR(255) NOT NULL,
-                        tag VARCHAR(50) DEFAULT 'latest',
-                        description TEXT,
-                        ports JSON,
-                        env_vars JSON,
-                        volumes JSON,
-                        health_check VARCHAR(255),
-                        enabled BOOLEAN DEFAULT FALSE,
-                        icon VARCHAR(50),
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
-                await cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS containers (
-                        id VARCHAR(100) PRIMARY KEY,
-                        service_id VARCHAR(100) NOT NULL,
-                        container_id VARCHAR(255),
-                        status VARCHAR(50),
-                        started_at TIMESTAMP,
-                        stopped_at TIMESTAMP,
-                        FOREIGN KEY (service_id) REFERENCES services(id) ON DELETE CASCADE
-                    )
-                """)
-                
-                await cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS layouts (
-                        id VARCHAR(100) PRIMARY KEY,
-                        name VARCHAR(255) NOT NULL,
-                        layout_data JSON NOT NULL,
-                        is_default BOOLEAN DEFAULT FALSE,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
-                logger.info("Database tables created/verified")
-                
-                await cursor.execute("SELECT COUNT(*) FROM services")
-                result = await cursor.fetchone()
-                if result[0] == 0:
-                    await seed_services(cursor)
-                    
-    except Exception as e:
-        logger.error(f"MySQL initialization error: {e}")
-        raise
+                await cursor.execute("SELECT DISTINCT image, tag FROM services WHERE enabled = TRUE")
+                images = await cursor.fetchall()
 
-async def seed_services(cursor):
-    core_services = [
-        {
-            "id": "duckdb",
-            "name": "DuckDB",
-            "category": "database",
-            "image": "datacatering/duckdb",
-            "tag": "latest",
-            "description": "In-process analytical database",
-            "ports": json.dumps(["8080:8080"]),
-            "env_vars": json.dumps({}),
-            "volumes": json.dumps(["duckdb-data:/data"]),
-            "health_check": "/health",
-            "enabled": 1,
-            "icon": "Database"
-        },
-        {
-            "id": "minio",
-            "name": "MinIO",
-            "category": "storage",
-            "image": "minio/minio",
-            "tag": "latest",
-            "description": "S3-compatible object storage",
-            "ports": json.dumps(["9000:9000", "9001:9001"]),
-            "env_vars": json.dumps({"MINIO_ROOT_USER": "admin", "MINIO_ROOT_PASSWORD": "adminpass123"}),
-            "volumes": json.dumps(["minio-data:/data"]),
-            "health_check": "/minio/health/live",
-            "enabled": 1,
-            "icon": "HardDrive"
-        },
-        {
-            "id": "n8n",
-            "name": "n8n",
-            "category": "automation",
-            "image": "n8nio/n8n",
-            "tag": "latest",
-            "description": "Workflow automation tool",
-            "ports": json.dumps(["5678:5678"]),
-            "env_vars": json.dumps({"N8N_BASIC_AUTH_ACTIVE": "false"}),
-            "volumes": json.dumps(["n8n-data:/home/node/.n8n"]),
-            "health_check": "/healthz",
-            "enabled": 1,
-            "icon": "Workflow"
-        },
-        {
-            "id": "temporal",
-            "name": "Temporal",
-            "category": "orchestration",
-            "image": "temporalio/auto-setup",
-            "tag": "latest",
-            "description": "Workflow orchestration engine",
-            "ports": json.dumps(["7233:7233", "8088:8088"]),
-            "env_vars": json.dumps({}),
-            "volumes": json.dumps(["temporal-data:/etc/temporal"]),
-            "health_check": "/",
-            "enabled": 1,
-            "icon": "GitBranch"
-        },
-        {
-            "id": "dbeaver",
-            "name": "DBeaver CE",
-            "category": "tool",
-            "image": "dbeaver/cloudbeaver",
-            "tag": "latest",
-            "description": "Web-based database management",
-            "ports": json.dumps(["8978:8978"]),
-            "env_vars": json.dumps({}),
-            "volumes": json.dumps(["dbeaver-data:/opt/cloudbeaver/workspace"]),
-            "health_check": "/",
-            "enabled": 1,
-            "icon": "Database"
-        },
-        {
-            "id": "code-server",
-            "name": "VS Code Server",
-            "category": "tool",
-            "image": "codercom/code-server",
-            "tag": "latest",
-            "description": "VS Code in the browser",
-            "ports": json.dumps(["8443:8080"]),
-            "env_vars": json.dumps({"PASSWORD": "admin123"}),
-            "volumes": json.dumps(["code-server-data:/home/coder"]),
-            "health_check": "/healthz",
-            "enabled": 1,
-            "icon": "Code"
-        },
-        {
-            "id": "electerm",
-            "name": "Electerm",
+        async def warm(image: str, tag: str):
+            state = await self.check(image, tag)
+            # latest moves upstream, so a local copy is only as fresh as its last pull
+            if state.state == "cold" or tag == "latest":
+                await self.pull(image, tag)
+
+        results = await asyncio.gather(*(warm(image, tag) for image, tag in images), return_exceptions=True)
+        failures = [r for r in results if isinstance(r, Exception)]
+        if failures:
+            logger.warning(f"Image warm-up finished with {len(failures)} failures")
+
+    async def run(self):
+        # The database connects in the background; warm up as soon as it is there
+        while not db_state["connected"]:
+            await asyncio.sleep(1.0)
+        while True:
+            try:
+                await self.warm_enabled()
+            except Exception as e:
+                logger.warning(f"Image warm-up failed: {e}")
+            await asyncio.sleep(IMAGE_WARM_INTERVAL)
+
+image_manager = ImageManager(docker_gateway, IMAGE_PULL_CONCURRENCY)
+
+LOCAL_HOST_ID = "local"
+
+def service_host_ports(service: Dict[str, Any]) -> frozenset:
+    ports = json.loads(service['ports']) if service['ports'] else []
+    return frozenset(mapping.split(':')[0] for mapping in ports if ':' in mapping)
+
+def service_resources(service: Dict[str, Any]) -> Dict[str, Any]:
+    """Resource spec of a raw or parsed services row; {} when none is set."""
+    resources = service.get('resources')
+    if isinstance(resources, str):
+        resources = json.loads(resources)
+    return resources or {}
+
+def cpuset_size(cpuset: str) -> int:
+    count = 0
+    for part in cpuset.split(','):
+        first, _, last = part.partition('-')
+        count += int(last or first) - int(first) + 1
+    return count
+
+class Host:
+    """One Docker daemon containers can be placed on, with its last observed load."""
+
+    def __init__(self, host_id: str, gateway: DockerGateway, images: ImageManager, address: str,
+                 docker_url: Optional[str] = None, enabled: bool = True):
+        self.id = host_id
+        self.gateway = gateway
+        self.images = images
+        self.address = address
+        self.docker_url = docker_url
+        self.enabled = enabled
+        self.healthy = False
+        self.ncpu = 0
+        self.mem_total = 0.0
+        self.cpu_free = 0.0
+        self.mem_free = 0.0
+        self.used_ports: set = set()
+        self.cached_images: set = set()
+        self.states: Dict[str, Dict[str, Any]] = {}
+        self.refreshed_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def schedulable(self) -> bool:
+        return self.enabled and self.healthy and self.mem_total > 0
+
+    async def refresh(self, placed: List[str]):
+        """Read capacity, published ports, cached images and container states in three calls."""
+        client = await self.gateway.client()
+        info, containers, images = await asyncio.gather(
+            self.gateway.run("get", client.info),
+            self.gateway.run("list", client.api.containers, all=True),
+            self.gateway.run("list", client.api.images),
+        )
+        used_ports, states = set(), {}
+        for container in containers:
+            if container['State'] == 'running':
+                used_ports.update(str(port['PublicPort']) for port in container.get('Ports') or [] if port.get('PublicPort'))
+            for name in container.get('Names') or []:
+                name = name.lstrip('/')
+                if name.startswith('orch_'):
+                    states[name[len('orch_'):]] = {"status": container['State'], "container_id": container['Id']}
+
+        # Load is what our own containers on this host currently use
+        cpu_used, mem_used = 0.0, 0.0
+        for service_id in placed:
+            sample = stats_manager.latest(service_id)
+            if sample and states.get(service_id, {}).get('status') == 'running':
+                cpu_used += sample['cpu_percent']
+                mem_used += sample['memory_usage']
+
+        self.ncpu = info.get('NCPU') or 0
+        self.mem_total = float(info.get('MemTotal') or 0)
+        self.cpu_free = max(0.0, 1.0 - cpu_used / 100.0)
+        self.mem_free = max(0.0, self.mem_total - mem_used)
+        self.used_ports = used_ports
+        self.cached_images = {tag for image in images for tag in image.get('RepoTags') or []}
+        self.states = states
+        self.healthy = True
+        self.refreshed_at = time.time()
+        self.last_error = None
+
+    def reserve(self, ports: frozenset, memory: float):
+        # Count a placement against the host until the next refresh observes it
+        self.used_ports.update(ports)
+        self.mem_free = max(0.0, self.mem_free - memory)
+
+    def unreserve(self, ports: frozenset, memory: float):
+        self.used_ports.difference_update(ports)
+        self.mem_free = min(self.mem_total, self.mem_free + memory)
+
+    def to_dict(self, services: List[str]) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "docker_url": self.docker_url,
+            "address": self.address,
+            "enabled": self.enabled,
+            "healthy": self.healthy,
+            "ncpu": self.ncpu,
+            "memory_total_mb": round(self.mem_total / (1024 * 1024), 1),
+            "memory_free_mb": round(self.mem_free / (1024 * 1024), 1),
+            "cpu_free_percent": round(self.cpu_free * 100, 1),
+            "used_ports": sorted(self.used_ports, key=lambda port: int(port) if port.isdigit() else 0),
+            "cached_images": len(self.cached_images),
+            "services": services,
+            "refreshed_at": self.refreshed_at,
+            "last_error": self.last_error,
+        }
+
+class HostRegistry:
+    """Docker endpoints from the hosts table plus the local daemon, and where each service runs.
+
+    Placement scores every schedulable host on CPU and memory headroom and on
+    whether the image is already cached, after dropping hosts whose published
+    ports clash or whose free memory is short. Host load is refreshed in the
+    background, so a placement only walks precomputed numbers.
+    """
+
+    def __init__(self):
+        self.hosts: Dict[str, Host] = {
+            LOCAL_HOST_ID: Host(LOCAL_HOST_ID, docker_gateway, image_manager, HEALTH_PROBE_HOST),
+        }
+        self.placements: Dict[str, str] = {}
+        # Placements by this worker whose start has not succeeded yet, with what
+        # undoing them takes: (previous host id, host id, ports, memory, host refreshed_at)
+        self.pending: Dict[str, tuple] = {}
+        self.counters = {"placements": 0, "sticky": 0, "rejected": 0, "abandoned": 0, "refresh_failures": 0}
+
+    def host_for(self, service_id: str) -> Host:
+        return self.hosts.get(self.placements.get(service_id, LOCAL_HOST_ID)) or self.hosts[LOCAL_HOST_ID]
+
+    def gateway_for(self, service_id: str) -> DockerGateway:
+        return self.host_for(service_id).gateway
+
+    def address_for(self, service_id: str) -> str:
+        return self.host_for(service_id).address
+
+    def memory_estimate(self, service: Dict[str, Any]) -> float:
+        declared = service_resources(service).get('memory_mb')
+        if declared:
+            return declared * 1024 * 1024
+        sample = stats_manager.latest(service['id'])
+        if sample and sample['memory_usage'] > 0:
+            return sample['memory_usage']
+        return SCHEDULER_DEFAULT_MEMORY_MB * 1024 * 1024
+
+    def place(self, service: Dict[str, Any]) -> Host:
+        service_id = service['id']
+        current = self.hosts.get(self.placements.get(service_id))
+        if current is not None and (current.schedulable or len(self.hosts) == 1):
+            # Stay put: the container, its volumes and its image live there
+            self.counters["sticky"] += 1
+            return current
+        ports, memory = frozenset(), 0.0
+        if len(self.hosts) == 1:
+            host = self.hosts[LOCAL_HOST_ID]
+        else:
+            ports, memory = service_host_ports(service), self.memory_estimate(service)
+            host = self.choose(ports, memory, admission.demand(service), f"{service['image']}:{service['tag']}")
+            if host is None:
+                self.counters["rejected"] += 1
+                raise HTTPException(status_code=503, detail=f"No Docker host has room for {service_id}")
+            host.reserve(ports, memory)
+        self.pending[service_id] = (self.placements.get(service_id), host.id, ports, memory, host.refreshed_at)
+        self.placements[service_id] = host.id
+        self.counters["placements"] += 1
+        return host
+
+    def unplace(self, service_id: str):
+        """Undo the placement of a start that failed, including its reservation."""
+        entry = self.pending.pop(service_id, None)
+        if entry is None:
+            return
+        previous, host_id, ports, memory, refreshed_at = entry
+        host = self.hosts.get(host_id)
+        # A refresh since then already replaced the reservation with observed load
+        if host is not None and host.refreshed_at == refreshed_at:
+            host.unreserve(ports, memory)
+        if previous is None:
+            self.placements.pop(service_id, None)
+        else:
+            self.placements[service_id] = previous
+        self.counters["abandoned"] += 1
+
+    def choose(self, ports: frozenset, memory: float, demand: tuple, image_ref: str) -> Optional[Host]:
+        best, best_score = None, -1.0
+        declared = demand[0] or demand[1]
+        for host in self.hosts.values():
+            if not host.schedulable or host.mem_free < memory or not ports.isdisjoint(host.used_ports):
+                continue
+            if declared and not admission.fits(host, *demand):
+                continue
+            score = (SCHEDULER_CPU_WEIGHT * host.cpu_free
+                     + SCHEDULER_MEMORY_WEIGHT * host.mem_free / host.mem_total
+                     + (SCHEDULER_IMAGE_WEIGHT if image_ref in host.cached_images else 0.0))
+            if score > best_score:
+                best, best_score = host, score
+        return best
+
+    def placed(self, service_id: str, host_id: str):
+        self.placements[service_id] = host_id
+        self.pending.pop(service_id, None)
+
+    def note_state(self, service_id: str, status: str, container_id: Optional[str]):
+        # Remote hosts are only listed on refresh; keep their view current for our own changes
+        host = self.host_for(service_id)
+        if host.id != LOCAL_HOST_ID:
+            host.states[service_id] = {"status": status, "container_id": container_id}
+
+    def remote_state(self, service_id: str, host: Host) -> Dict[str, Any]:
+        return host.states.get(service_id, {"status": "stopped", "container_id": None})
+
+    def remote_states(self) -> Dict[str, Dict[str, Any]]:
+        states = {}
+        for service_id, host_id in self.placements.items():
+            if host_id != LOCAL_HOST_ID and host_id in self.hosts:
+                states[service_id] = self.remote_state(service_id, self.hosts[host_id])
+        return states
+
+    def services_on(self, host_id: str) -> List[str]:
+        return sorted(service_id for service_id, placed_on in self.placements.items() if placed_on == host_id)
+
+    def sync(self, rows: List[Dict[str, Any]]):
+        seen = {LOCAL_HOST_ID}
+        for row in rows:
+            seen.add(row['id'])
+            host = self.hosts.get(row['id'])
+            if host is None or host.docker_url != row['docker_url']:
+                if host is not None:
+                    host.gateway.shutdown()
+                gateway = DockerGateway(HOST_MAX_WORKERS, DOCKER_LIFECYCLE_CONCURRENCY, DOCKER_POOL_SIZE,
+                                        base_url=row['docker_url'])
+                host = Host(row['id'], gateway, ImageManager(gateway, IMAGE_PULL_CONCURRENCY), row['address'],
+                            row['docker_url'])
+                self.hosts[row['id']] = host
+            host.address = row['address']
+            host.enabled = bool(row['enabled'])
+        for host_id in set(self.hosts) - seen:
+            self.hosts.pop(host_id).gateway.shutdown()
+
+    async def load(self):
+        async with db_pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute("SELECT id, docker_url, address, enabled FROM hosts")
+                rows = await cursor.fetchall()
+                await cursor.execute("SELECT service_id, host_id FROM containers")
+                placements = {row['service_id']: row['host_id'] for row in await cursor.fetchall()}
+        self.sync(rows)
+        for service_id in self.pending:
+            if service_id in self.placements:
+                placements[service_id] = self.placements[service_id]
+        self.placements = placements
+
+    async def refresh_host(self, host: Host):
+        try:
+            await host.refresh(self.services_on(host.id))
+        except Exception as e:
+            host.healthy = False
+            host.last_error = str(e)
+            self.counters["refresh_failures"] += 1
+            logger.warning(f"Refreshing Docker host {host.id} failed: {e}")
+
+    async def refresh(self):
+        await asyncio.gather(*(self.refresh_host(host) for host in list(self.hosts.values())))
+
+    async def run(self):
+        while True:
+            try:
+                if db_pool.pool is not None:
+                    await self.load()
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"Host registry refresh failed: {e}")
+            await asyncio.sleep(HOST_REFRESH_INTERVAL)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counters, "hosts": [host.to_dict(self.services_on(host.id)) for host in self.hosts.values()]}
+
+    def shutdown(self):
+        for host_id, host in self.hosts.items():
+            if host_id != LOCAL_HOST_ID:
+                host.gateway.shutdown()
+
+host_registry = HostRegistry()
+
+def health_url(service: Dict[str, Any]) -> Optional[str]:
+    ports = json.loads(service['ports']) if service['ports'] else []
+    if not service.get('health_check') or not ports or ':' not in ports[0]:
+        return None
+    host_port = ports[0].split(':')[0]
+    path = service['health_check'] if service['health_check'].startswith('/') else '/' + service['health_check']
+    return f"http://{host_registry.address_for(service['id'])}:{host_port}{path}"
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))], 1)
+
+class HealthTarget:
+    def __init__(self, service_id: str, url: str, interval: float):
+        self.service_id = service_id
+        self.url = url
+        self.interval = interval
+        self.history: deque = deque(maxlen=HEALTH_HISTORY)
+        self.failures = 0
+        self.healthy: Optional[bool] = None
+        self.next_due = time.monotonic() + random.uniform(0, interval)
+        self.in_flight = False
+        # Wall time the last successful probe was sent
+        self.ok_at: Optional[float] = None
+
+    def schedule(self):
+        # Failing targets back off exponentially; jitter spreads probes out
+        delay = min(self.interval * (2 ** self.failures), HEALTH_MAX_BACKOFF)
+        self.next_due = time.monotonic() + delay * random.uniform(1 - HEALTH_JITTER, 1 + HEALTH_JITTER)
+
+    def summary(self) -> Dict[str, Any]:
+        latencies = [entry['latency_ms'] for entry in self.history if entry['ok']]
+        last = self.history[-1] if self.history else None
+        return {
+            "healthy": self.healthy,
+            "url": self.url,
+            "last_checked": last['ts'] if last else None,
+            "last_error": last.get('error') if last else None,
+            "consecutive_failures": self.failures,
+            "success_rate": round(sum(e['ok'] for e in self.history) / len(self.history), 3) if self.history else None,
+            "latency_ms": {"p50": percentile(latencies, 50), "p95": percentile(latencies, 95), "p99": percentile(latencies, 99)},
+        }
+
+class HealthProber:
+    """Probes the health_check path of every running service on one shared HTTP client."""
+
+    def __init__(self):
+        self.targets: Dict[str, HealthTarget] = {}
+        self.client: Optional[httpx.AsyncClient] = None
+        self.slots = asyncio.Semaphore(HEALTH_MAX_CONCURRENCY)
+        self.tasks: set = set()
+
+    def get(self, service_id: str) -> Optional[Dict[str, Any]]:
+        target = self.targets.get(service_id)
+        return target.summary() if target else None
+
+    async def refresh_targets(self):
+        async with db_pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute("SELECT id, ports, health_check, health_interval FROM services WHERE enabled = TRUE")
+                services = await cursor.fetchall()
+        statuses = await get_container_statuses()
+        wanted = {}
+        for service in services:
+            url = health_url(service)
+            if url and (statuses.get(service['id']) or {}).get('status') == 'running':
+                wanted[service['id']] = (url, service.get('health_interval') or HEALTH_INTERVAL)
+        for service_id in set(self.targets) - set(wanted):
+            del self.targets[service_id]
+        for service_id, (url, interval) in wanted.items():
+            target = self.targets.get(service_id)
+            if target is None or target.url != url:
+                self.targets[service_id] = HealthTarget(service_id, url, interval)
+            else:
+                target.interval = interval
+
+    async def probe(self, target: HealthTarget):
+        entry: Dict[str, Any] = {"ts": datetime.now(timezone.utc).isoformat()}
+        sent_at = time.time()
+        started = time.perf_counter()
+        try:
+            try:
+                async with self.slots:
+                    response = await self.client.get(target.url)
+                entry['status_code'] = response.status_code
+                entry['ok'] = response.status_code < 400
+                if not entry['ok']:
+                    entry['error'] = f"HTTP {response.status_code}"
+            except Exception as e:
+                # InvalidURL and friends are not HTTPError; any failure counts against the target
+                entry['ok'] = False
+                entry['error'] = f"{type(e).__name__}: {e}"
+            entry['latency_ms'] = round((time.perf_counter() - started) * 1000, 2)
+            target.history.append(entry)
+            target.failures = 0 if entry['ok'] else target.failures + 1
+            if entry['ok']:
+                target.ok_at = sent_at
+                readiness.notify_ready(target.service_id, "health_check")
+            if target.healthy != entry['ok']:
+                target.healthy = entry['ok']
+                await broadcast_message({"type": "health", "service_id": target.service_id, **target.summary()}, local=True)
+        finally:
+            target.in_flight = False
+            target.schedule()
+
+    async def run(self):
+        self.client = httpx.AsyncClient(
+            timeout=HEALTH_TIMEOUT,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=HEALTH_MAX_CONCURRENCY, max_keepalive_connections=HEALTH_MAX_CONCURRENCY),
+        )
+        last_refresh = 0.0
+        try:
+            while True:
+                now = time.monotonic()
+                if now - last_refresh >= HEALTH_INTERVAL:
+                    try:
+                        await self.refresh_targets()
+                    except Exception as e:
+                        logger.warning(f"Health target refresh failed: {e}")
+                    last_refresh = now
+                for target in list(self.targets.values()):
+                    if not target.in_flight and target.next_due <= now:
+                        target.in_flight = True
+                        task = asyncio.create_task(self.probe(target))
+                        self.tasks.add(task)
+                        task.add_done_callback(self._probe_done)
+                await asyncio.sleep(0.5)
+        finally:
+            for task in self.tasks:
+                task.cancel()
+            await self.client.aclose()
+
+    def _probe_done(self, task: asyncio.Task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Health probe failed: {task.exception()}")
+
+health_prober = HealthProber()
+
+READY_STATES = {"ready"}
+
+class StateWaiters:
+    """Futures resolved by container state changes instead of polling Docker."""
+
+    def __init__(self):
+        self.waiters: Dict[str, List[tuple]] = {}
+
+    async def wait(self, service_id: str, status: str, timeout: float) -> Dict[str, Any]:
+        current = await get_container_status(service_id)
+        if current.get('status') == status:
+            return current
+        future = asyncio.get_running_loop().create_future()
+        entry = (status, future)
+        self.waiters.setdefault(service_id, []).append(entry)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            waiters = self.waiters.get(service_id, [])
+            if entry in waiters:
+                waiters.remove(entry)
+            if not waiters:
+                self.waiters.pop(service_id, None)
+
+    def notify(self, service_id: str, state: Dict[str, Any]):
+        for status, future in self.waiters.get(service_id, []):
+            if status == state.get('status') and not future.done():
+                future.set_result(state)
+
+state_waiters = StateWaiters()
+
+class ReadinessTracker:
+    """Waits until a service passes its health check.
+
+    All callers waiting on the same service share one future and at most one
+    fast probe loop. Docker HEALTHCHECK events and the regular health prober
+    resolve the future as soon as they see the service healthy.
+    """
+
+    def __init__(self):
+        self.pending: Dict[str, asyncio.Future] = {}
+        self.probes: Dict[str, asyncio.Task] = {}
+        self.waiting: Dict[str, int] = {}
+
+    def notify_ready(self, service_id: str, source: str):
+        future = self.pending.pop(service_id, None)
+        if future and not future.done():
+            future.set_result({"ready": True, "source": source})
+        task = self.probes.pop(service_id, None)
+        if task:
+            task.cancel()
+
+    def already_ready(self, service_id: str, since: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Ready from health observed after the current process started (and after `since`)."""
+        state = container_states.get(service_id)
+        started = max(filter(None, (state_timestamp(state.get('started_at')), since)), default=None)
+        if started is None:
+            return None
+        if state.get('health') == 'healthy' and (state_timestamp(state.get('health_at')) or 0) >= started:
+            return {"ready": True, "source": "docker_healthcheck"}
+        target = health_prober.targets.get(service_id)
+        if target and target.healthy and target.ok_at is not None and target.ok_at >= started:
+            return {"ready": True, "source": "health_check"}
+        return None
+
+    async def wait(self, service_id: str, timeout: float, since: Optional[float] = None) -> Dict[str, Any]:
+        ready = self.already_ready(service_id, since)
+        if ready:
+            return ready
+        future = self.pending.get(service_id)
+        if future is None or future.done():
+            future = asyncio.get_running_loop().create_future()
+            self.pending[service_id] = future
+            self.probes[service_id] = asyncio.create_task(self.probe(service_id))
+        self.waiting[service_id] = self.waiting.get(service_id, 0) + 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        finally:
+            self.waiting[service_id] -= 1
+            if not self.waiting[service_id]:
+                # Last waiter gave up: stop probing on its behalf
+                del self.waiting[service_id]
+                if not future.done():
+                    self.pending.pop(service_id, None)
+                    future.cancel()
+                    task = self.probes.pop(service_id, None)
+                    if task:
+                        task.cancel()
+
+    async def probe(self, service_id: str):
+        try:
+            await self._probe(service_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Readiness probe for {service_id} failed: {e}")
+
+    async def _probe(self, service_id: str):
+        service = await fetch_service(service_id)
+        url = health_url(service)
+        state = await state_waiters.wait(service_id, "running", HEALTH_MAX_BACKOFF)
+        if state.get('health') is not None:
+            # The image has a Docker HEALTHCHECK; its events will resolve us
+            return
+        if url is None:
+            self.notify_ready(service_id, "running")
+            return
+        client = health_prober.client or httpx.AsyncClient(timeout=HEALTH_TIMEOUT)
+        delay = 0.25
+        try:
+            while True:
+                with suppress(httpx.HTTPError):
+                    response = await client.get(url, timeout=HEALTH_TIMEOUT)
+                    if response.status_code < 400:
+                        self.notify_ready(service_id, "health_check")
+                        return
+                await asyncio.sleep(delay)
+                delay = min(delay * 1.5, 5.0)
+        finally:
+            if client is not health_prober.client:
+                await client.aclose()
+
+readiness = ReadinessTracker()
+
+async def await_service_state(service_id: str, state: str, timeout: float,
+                              since: Optional[float] = None) -> Dict[str, Any]:
+    """Block until the service reaches `state` ("ready" or a container status).
+
+    `since` is the wall time a start was issued; health seen before it is ignored.
+    """
+    started = time.perf_counter()
+    try:
+        if state in READY_STATES:
+            detail = await readiness.wait(service_id, timeout, since)
+        else:
+            detail = await state_waiters.wait(service_id, state, timeout)
+        reached = True
+    except asyncio.TimeoutError:
+        detail, reached = None, False
+    return {"service_id": service_id, "state": state, "reached": reached, "detail": detail,
+            "waited_ms": round((time.perf_counter() - started) * 1000, 1)}
+background_tasks: List[asyncio.Task] = []
+
+STATEMENT_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE|ON|TABLE(?:\s+IF\s+NOT\s+EXISTS)?)\s+`?([\w.]+)", re.IGNORECASE)
+
+@functools.lru_cache(maxsize=512)
+def statement_name(query: str) -> str:
+    """Short label for a statement, e.g. "SELECT services"."""
+    parts = query.split(None, 1)
+    verb = parts[0].upper() if parts else "?"
+    match = STATEMENT_TABLE.search(query)
+    return f"{verb} {match.group(1)}" if match else verb
+
+slow_query_logger = logging.getLogger("slow_query")
+if MYSQL_SLOW_QUERY_LOG:
+    slow_query_handler = logging.FileHandler(MYSQL_SLOW_QUERY_LOG)
+    slow_query_handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    slow_query_logger.addHandler(slow_query_handler)
+
+class DatabaseUnavailable(Exception):
+    def __init__(self):
+        super().__init__("Database is not connected yet")
+
+class DatabaseBusy(Exception):
+    def __init__(self, waited: float):
+        super().__init__(f"No database connection available after {waited}s")
+        self.waited = waited
+
+class DatabaseMetrics:
+    def __init__(self):
+        self.acquire_wait = LatencyHistogram()
+        self.statements: Dict[str, LatencyHistogram] = {}
+        self.counters = {"acquires": 0, "acquire_timeouts": 0, "late_releases": 0, "queries": 0, "errors": 0, "slow_queries": 0}
+
+    def observe(self, query: str, elapsed_ms: float, failed: bool):
+        name = statement_name(query)
+        histogram = self.statements.get(name)
+        if histogram is None:
+            histogram = self.statements[name] = LatencyHistogram()
+        histogram.observe(elapsed_ms)
+        self.counters["queries"] += 1
+        if failed:
+            self.counters["errors"] += 1
+        if elapsed_ms >= MYSQL_SLOW_QUERY_MS:
+            self.counters["slow_queries"] += 1
+            slow_query_logger.warning(f"slow query {name} took {elapsed_ms:.1f}ms: {' '.join(query.split())[:500]}")
+
+db_metrics = DatabaseMetrics()
+
+class InstrumentedCursor:
+    """Cursor proxy that times execute/executemany."""
+
+    def __init__(self, cursor_context):
+        self._context = cursor_context
+        self._cursor = None
+
+    async def __aenter__(self):
+        self._cursor = await self._context.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return await self._context.__aexit__(*exc_info)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    async def _timed(self, method, query, args):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = await method(query, args)
+            failed = False
+            return result
+        finally:
+            db_metrics.observe(query, (time.perf_counter() - started) * 1000, failed)
+
+    async def execute(self, query, args=None):
+        return await self._timed(self._cursor.execute, query, args)
+
+    async def executemany(self, query, args):
+        return await self._timed(self._cursor.executemany, query, args)
+
+class InstrumentedConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *cursors):
+        return InstrumentedCursor(self._conn.cursor(*cursors))
+
+class InstrumentedPool:
+    """aiomysql pool wrapper with a bounded acquire wait and per-statement metrics.
+
+    acquire() raises DatabaseBusy instead of hanging when the pool stays
+    exhausted for MYSQL_ACQUIRE_TIMEOUT seconds. A connection that arrives
+    after the caller gave up goes straight back to the pool.
+    """
+
+    def __init__(self, pool, acquire_timeout: float):
+        self.pool = pool
+        self.acquire_timeout = acquire_timeout
+
+    @asynccontextmanager
+    async def acquire(self):
+        if self.pool is None:
+            raise DatabaseUnavailable()
+        started = time.perf_counter()
+        pending = asyncio.ensure_future(self.pool.acquire())
+        try:
+            conn = await asyncio.wait_for(asyncio.shield(pending), self.acquire_timeout)
+        except BaseException as e:
+            pending.add_done_callback(self._release_late)
+            pending.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                db_metrics.counters["acquire_timeouts"] += 1
+                logger.error(f"MySQL pool exhausted: no connection after {self.acquire_timeout}s")
+                raise DatabaseBusy(self.acquire_timeout)
+            raise
+        db_metrics.counters["acquires"] += 1
+        db_metrics.acquire_wait.observe((time.perf_counter() - started) * 1000)
+        try:
+            yield InstrumentedConnection(conn)
+        finally:
+            self.pool.release(conn)
+
+    def _release_late(self, pending: asyncio.Future):
+        if not pending.cancelled() and pending.exception() is None:
+            db_metrics.counters["late_releases"] += 1
+            self.pool.release(pending.result())
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+
+    async def wait_closed(self):
+        if self.pool is not None:
+            await self.pool.wait_closed()
+
+    def stats(self) -> Optional[Dict[str, Any]]:
+        if self.pool is None:
+            return None
+        size, free = self.pool.size, self.pool.freesize
+        return {"minsize": self.pool.minsize, "maxsize": self.pool.maxsize, "size": size,
+                "in_use": size - free, "idle": free, "acquire_timeout": self.acquire_timeout}
+
+db_pool = InstrumentedPool(None, MYSQL_ACQUIRE_TIMEOUT)
+db_state: Dict[str, Any] = {"connected": False, "schema_version": None, "attempts": 0, "last_error": None}
+
+async def index_exists(cursor, table: str, index: str) -> bool:
+    await cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.statistics "
+        "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s",
+        (table, index)
+    )
+    return (await cursor.fetchone())[0] > 0
+
+async def ensure_index(cursor, table: str, index: str, columns: str):
+    if not await index_exists(cursor, table, index):
+        await cursor.execute(f"CREATE INDEX {index} ON {table} ({columns})")
+
+async def drop_index(cursor, table: str, index: str):
+    if await index_exists(cursor, table, index):
+        await cursor.execute(f"DROP INDEX {index} ON {table}")
+
+async def ensure_services_category_index(cursor):
+    await ensure_index(cursor, 'services', 'idx_services_category_enabled', 'category, enabled')
+
+async def ensure_column(cursor, table: str, column: str, definition: str):
+    await cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.columns "
+        "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s",
+        (table, column)
+    )
+    if (await cursor.fetchone())[0] == 0:
+        await cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+# Limits for the seeded services that can starve the others on a shared host
+SEED_RESOURCES = {
+    "code-server": {"cpus": 2.0, "memory_mb": 2048, "pids": 1024},
+    "nextcloud": {"cpus": 1.0, "memory_mb": 1024, "pids": 512},
+    "keycloak": {"cpus": 1.0, "memory_mb": 1024, "pids": 512},
+}
+
+# Catalog rows the seed migration inserted during this boot
+seeded_services: set = set()
+
+async def seed_service_resources(cursor):
+    """Default limits for freshly seeded rows only.
+
+    Rows from an existing install keep running unlimited: new limits would
+    change their config hash and recreate their containers.
+    """
+    ncpu = os.cpu_count() or 1
+    rows = [(json.dumps({**resources, "cpus": min(resources["cpus"], ncpu)}), service_id)
+            for service_id, resources in SEED_RESOURCES.items() if service_id in seeded_services]
+    if rows:
+        await cursor.executemany("UPDATE services SET resources = %s WHERE id = %s AND resources IS NULL", rows)
+
+# Ordered schema migrations: (version, name, steps). A step is SQL or an async
+# callable taking a cursor. MySQL commits DDL implicitly, so every step must be
+# safe to re-run in case a boot dies halfway through a migration.
+MIGRATIONS = [
+    (1, "create services, containers and layouts", [
+        """
+            CREATE TABLE IF NOT EXISTS services (
+                id VARCHAR(100) PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                category VARCHAR(50) NOT NULL,
+                image VARCHAR(255) NOT NULL,
+                tag VARCHAR(50) DEFAULT 'latest',
+                description TEXT,
+                ports JSON,
+                env_vars JSON,
+                volumes JSON,
+                health_check VARCHAR(255),
+                enabled BOOLEAN DEFAULT FALSE,
+                icon VARCHAR(50),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """,
+        """
+            CREATE TABLE IF NOT EXISTS containers (
+                id VARCHAR(100) PRIMARY KEY,
+                service_id VARCHAR(100) NOT NULL,
+                container_id VARCHAR(255),
+                status VARCHAR(50),
+                started_at TIMESTAMP,
+                stopped_at TIMESTAMP,
+                FOREIGN KEY (service_id) REFERENCES services(id) ON DELETE CASCADE
+            )
+        """,
+        """
+            CREATE TABLE IF NOT EXISTS layouts (
+                id VARCHAR(100) PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                layout_data JSON NOT NULL,
+                is_default BOOLEAN DEFAULT FALSE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """,
+    ]),
+    (2, "add service dependencies", [
+        """
+            CREATE TABLE IF NOT EXISTS service_dependencies (
+                service_id VARCHAR(100) NOT NULL,
+                depends_on VARCHAR(100) NOT NULL,
+                PRIMARY KEY (service_id, depends_on),
+                FOREIGN KEY (service_id) REFERENCES services(id) ON DELETE CASCADE,
+                FOREIGN KEY (depends_on) REFERENCES services(id) ON DELETE CASCADE
+            )
+        """,
+    ]),
+    (3, "index services by category and enabled", [ensure_services_category_index]),
+    (4, "seed the service catalog", [lambda cursor: seed_services(cursor)]),
+    (5, "add docker hosts and container placement", [
+        """
+            CREATE TABLE IF NOT EXISTS hosts (
+                id VARCHAR(100) PRIMARY KEY,
+                docker_url VARCHAR(255) NOT NULL,
+                address VARCHAR(255) NOT NULL,
+                enabled BOOLEAN DEFAULT TRUE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """,
+        lambda cursor: ensure_column(cursor, 'containers', 'host_id', f"VARCHAR(100) NOT NULL DEFAULT '{LOCAL_HOST_ID}'"),
+    ]),
+    (6, "add service resource limits", [
+        lambda cursor: ensure_column(cursor, 'services', 'resources', "JSON"),
+        seed_service_resources,
+    ]),
+    (7, "add per-service health intervals", [
+        lambda cursor: ensure_column(cursor, 'services', 'health_interval', "FLOAT"),
+    ]),
+    # Pages are keyset-ordered by id, so filtered indexes end in id
+    (8, "index services for filtered pagination", [
+        lambda cursor: ensure_index(cursor, 'services', 'idx_services_category_id', 'category, id'),
+        lambda cursor: ensure_index(cursor, 'services', 'idx_services_category_enabled_id', 'category, enabled, id'),
+        lambda cursor: drop_index(cursor, 'services', 'idx_services_category_enabled'),
+    ]),
+]
+
+async def run_migrations(cursor) -> int:
+    """Apply pending migrations and return the schema version.
+
+    Once everything is applied this costs two statements. Workers booting
+    together serialize on a named lock and skip what another already applied.
+    """
+    await cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    await cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    current = (await cursor.fetchone())[0]
+    if current >= MIGRATIONS[-1][0]:
+        return current
+    
+    await cursor.execute("SELECT GET_LOCK('orch_schema_migrations', 60)")
+    if (await cursor.fetchone())[0] != 1:
+        # 0 is a timeout: another worker is still migrating, so retry rather than race it
+        raise RuntimeError("Timed out waiting for the schema migration lock")
+    try:
+        await cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+        current = (await cursor.fetchone())[0]
+        for version, name, steps in MIGRATIONS:
+            if version <= current:
+                continue
+            for step in steps:
+                if callable(step):
+                    await step(cursor)
+                else:
+                    await cursor.execute(step)
+            await cursor.execute("INSERT INTO schema_version (version, name) VALUES (%s, %s)", (version, name))
+            current = version
+            logger.info(f"Applied schema migration {version}: {name}")
+    finally:
+        await cursor.execute("SELECT RELEASE_LOCK('orch_schema_migrations')")
+    return current
+
+def mysql_settings() -> Dict[str, Any]:
+    return {
+        "host": os.environ.get('MYSQL_HOST', 'localhost'),
+        "port": int(os.environ.get('MYSQL_PORT', 3306)),
+        "user": os.environ.get('MYSQL_USER', 'root'),
+        "password": os.environ.get('MYSQL_PASSWORD', 'rootpass'),
+        "db": os.environ.get('MYSQL_DATABASE', 'orchestration_db'),
+    }
+
+async def init_mysql():
+    pool = await aiomysql.create_pool(
+        **mysql_settings(),
+        autocommit=True,
+        minsize=MYSQL_POOL_MINSIZE,
+        maxsize=MYSQL_POOL_MAXSIZE,
+        pool_recycle=MYSQL_POOL_RECYCLE,
+        connect_timeout=MYSQL_CONNECT_TIMEOUT
+    )
+    try:
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                version = await run_migrations(cursor)
+    except Exception:
+        pool.close()
+        await pool.wait_closed()
+        raise
+    
+    # Requests only see the pool once the schema is current
+    db_pool.pool = pool
+    db_state.update(connected=True, schema_version=version, last_error=None)
+    logger.info(f"MySQL pool created successfully (minsize={MYSQL_POOL_MINSIZE}, maxsize={MYSQL_POOL_MAXSIZE}, schema v{version})")
+
+class DatabaseLeaderLock:
+    """A MySQL named lock on a connection of its own; the worker holding it leads.
+
+    GET_LOCK belongs to the session, so a worker that dies or loses its
+    connection gives the lock up and another worker takes it on its next try.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.conn = None
+        self.held = False
+        self.counters = {"acquired": 0, "lost": 0}
+
+    async def acquire(self) -> bool:
+        """Whether this worker leads; takes the lock when it is free."""
+        held = False
+        if not db_state["connected"]:
+            # Give the lock up with the rest of the database
+            self.close()
+        else:
+            try:
+                if self.conn is None:
+                    self.conn = await aiomysql.connect(**mysql_settings(), autocommit=True,
+                                                       connect_timeout=MYSQL_CONNECT_TIMEOUT)
+                async with self.conn.cursor() as cursor:
+                    if self.held:
+                        await cursor.execute("SELECT IS_USED_LOCK(%s) = CONNECTION_ID()", (self.name,))
+                    else:
+                        await cursor.execute("SELECT GET_LOCK(%s, 0)", (self.name,))
+                    held = bool((await cursor.fetchone())[0])
+            except Exception as e:
+                logger.warning(f"Leader lock {self.name} check failed: {e}")
+                self.close()
+        if held and not self.held:
+            self.counters["acquired"] += 1
+            logger.info(f"This worker now holds {self.name}")
+        elif self.held and not held:
+            self.counters["lost"] += 1
+            logger.warning(f"This worker lost {self.name}")
+        self.held = held
+        return held
+
+    def close(self):
+        conn, self.conn = self.conn, None
+        if conn is not None:
+            conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"name": self.name, "held": self.held, **self.counters}
+
+async def connect_database():
+    """Connect and migrate in the background, retrying with backoff until it works."""
+    delay = 1.0
+    while True:
+        db_state["attempts"] += 1
+        try:
+            await init_mysql()
+            return
+        except Exception as e:
+            db_state["last_error"] = str(e)
+            logger.error(f"MySQL initialization error: {e}; retrying in {delay:.0f}s")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 30.0)
+
+async def seed_services(cursor):
+    core_services = [
+        {
+            "id": "duckdb",
+            "name": "DuckDB",
+            "category": "database",
+            "image": "datacatering/duckdb",
+            "tag": "latest",
+            "description": "In-process analytical database",
+            "ports": json.dumps(["8080:8080"]),
+            "env_vars": json.dumps({}),
+            "volumes": json.dumps(["duckdb-data:/data"]),
+            "health_check": "/health",
+            "enabled": 1,
+            "icon": "Database"
+        },
+        {
+            "id": "minio",
+            "name": "MinIO",
+            "category": "storage",
+            "image": "minio/minio",
+            "tag": "latest",
+            "description": "S3-compatible object storage",
+            "ports": json.dumps(["9000:9000", "9001:9001"]),
+            "env_vars": json.dumps({"MINIO_ROOT_USER": "admin", "MINIO_ROOT_PASSWORD": "adminpass123"}),
+            "volumes": json.dumps(["minio-data:/data"]),
+            "health_check": "/minio/health/live",
+            "enabled": 1,
+            "icon": "HardDrive"
+        },
+        {
+            "id": "n8n",
+            "name": "n8n",
+            "category": "automation",
+            "image": "n8nio/n8n",
+            "tag": "latest",
+            "description": "Workflow automation tool",
+            "ports": json.dumps(["5678:5678"]),
+            "env_vars": json.dumps({"N8N_BASIC_AUTH_ACTIVE": "false"}),
+            "volumes": json.dumps(["n8n-data:/home/node/.n8n"]),
+            "health_check": "/healthz",
+            "enabled": 1,
+            "icon": "Workflow"
+        },
+        {
+            "id": "temporal",
+            "name": "Temporal",
+            "category": "orchestration",
+            "image": "temporalio/auto-setup",
+            "tag": "latest",
+            "description": "Workflow orchestration engine",
+            "ports": json.dumps(["7233:7233", "8088:8088"]),
+            "env_vars": json.dumps({}),
+            "volumes": json.dumps(["temporal-data:/etc/temporal"]),
+            "health_check": "/",
+            "enabled": 1,
+            "icon": "GitBranch"
+        },
+        {
+            "id": "dbeaver",
+            "name": "DBeaver CE",
+            "category": "tool",
+            "image": "dbeaver/cloudbeaver",
+            "tag": "latest",
+            "description": "Web-based database management",
+            "ports": json.dumps(["8978:8978"]),
+            "env_vars": json.dumps({}),
+            "volumes": json.dumps(["dbeaver-data:/opt/cloudbeaver/workspace"]),
+            "health_check": "/",
+            "enabled": 1,
+            "icon": "Database"
+        },
+        {
+            "id": "code-server",
+            "name": "VS Code Server",
+            "category": "tool",
+            "image": "codercom/code-server",
+            "tag": "latest",
+            "description": "VS Code in the browser",
+            "ports": json.dumps(["8443:8080"]),
+            "env_vars": json.dumps({"PASSWORD": "admin123"}),
+            "volumes": json.dumps(["code-server-data:/home/coder"]),
+            "health_check": "/healthz",
+            "enabled": 1,
+            "icon": "Code"
+        },
+        {
+            "id": "electerm",
+            "name": "Electerm",
             "category": "tool",
             "image": "electerm/electerm-web",
             "tag": "latest",
@@ -359,7 +2452,7 @@ async def seed_services(cursor):
             "image": "nextcloud",
             "tag": "latest",
             "description": "File sharing platform",
-            "ports": json.dumps(["8081:80"]),
+            "ports": json.dumps(["8083:80"]),
             "env_vars": json.dumps({}),
             "volumes": json.dumps(["nextcloud-data:/var/www/html"]),
             "health_check": "/status.php",
@@ -383,18 +2476,55 @@ async def seed_services(cursor):
     ]
     
     all_services = core_services + optional_services
+    ids = [service['id'] for service in all_services]
+    await cursor.execute(f"SELECT id FROM services WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+    existing = {row[0] for row in await cursor.fetchall()}
     
-    for service in all_services:
-        await cursor.execute(
-            """INSERT INTO services (id, name, category, image, tag, description, ports, env_vars, 
-               volumes, health_check, enabled, icon) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
-            (service['id'], service['name'], service['category'], service['image'], service['tag'],
-             service['description'], service['ports'], service['env_vars'], service['volumes'],
-             service['health_check'], service['enabled'], service['icon'])
-        )
+    await cursor.executemany(
+        """INSERT IGNORE INTO services (id, name, category, image, tag, description, ports, env_vars, 
+           volumes, health_check, enabled, icon) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+        [(service['id'], service['name'], service['category'], service['image'], service['tag'],
+          service['description'], service['ports'], service['env_vars'], service['volumes'],
+          service['health_check'], service['enabled'], service['icon']) for service in all_services]
+    )
+    
+    dependencies = [("grafana", "prometheus"), ("amphi", "duckdb")]
+    await cursor.executemany(
+        "INSERT IGNORE INTO service_dependencies (service_id, depends_on) VALUES (%s, %s)",
+        dependencies
+    )
     
+    seeded_services.update(set(ids) - existing)
     logger.info(f"Seeded {len(all_services)} services")
 
+class UlimitSpec(BaseModel):
+    soft: int = Field(..., ge=0)
+    hard: int = Field(..., ge=0)
+
+class ResourceSpec(BaseModel):
+    cpus: Optional[float] = Field(None, gt=0)
+    cpuset: Optional[str] = Field(None, pattern=r'^\d+(-\d+)?(,\d+(-\d+)?)*$')
+    memory_mb: Optional[int] = Field(None, ge=6)
+    # Memory plus swap; -1 allows unlimited swap
+    memory_swap_mb: Optional[int] = Field(None, ge=-1)
+    pids: Optional[int] = Field(None, gt=0)
+    ulimits: Dict[str, UlimitSpec] = {}
+
+    @model_validator(mode='after')
+    def check_limits(self):
+        if self.memory_swap_mb not in (None, -1):
+            if self.memory_mb is None or self.memory_swap_mb < self.memory_mb:
+                raise ValueError("memory_swap_mb needs memory_mb and must not be below it")
+        for name, ulimit in self.ulimits.items():
+            if ulimit.soft > ulimit.hard:
+                raise ValueError(f"ulimit {name}: soft limit above hard limit")
+        return self
+
+def resources_json(resources: Optional[ResourceSpec]) -> Optional[str]:
+    if resources is None:
+        return None
+    return json.dumps(resources.model_dump(exclude_none=True, exclude_defaults=True))
+
 class Service(BaseModel):
     id: str
     name: str
@@ -406,243 +2536,2094 @@ class Service(BaseModel):
     env_vars: Dict[str, str] = {}
     volumes: List[str] = []
     health_check: Optional[str] = None
+    health_interval: Optional[float] = None
+    resources: Optional[ResourceSpec] = None
     enabled: bool = False
     icon: str = "Box"
     status: Optional[str] = "unknown"
     container_id: Optional[str] = None
+    health: Optional[Dict[str, Any]] = None
+
+class ServiceCreate(BaseModel):
+    name: str
+    category: str
+    image: str
+    tag: str = "latest"
+    description: Optional[str] = None
+    ports: List[str] = []
+    env_vars: Dict[str, str] = {}
+    volumes: List[str] = []
+    health_check: Optional[str] = None
+    # Seconds between probes of health_check; HEALTH_INTERVAL when unset
+    health_interval: Optional[float] = Field(None, gt=0)
+    resources: Optional[ResourceSpec] = None
+    icon: str = "Box"
+    depends_on: List[str] = []
+
+class ServiceImport(ServiceCreate):
+    id: Optional[str] = Field(None, min_length=1, max_length=100)
+    enabled: bool = False
+
+class ServiceBatch(BaseModel):
+    services: List[Any]
+    upsert: bool = True
+
+class BulkAction(BaseModel):
+    action: str
+    service_ids: List[str] = []
+    all_enabled: bool = False
+    parallelism: Optional[int] = None
+
+class HostCreate(BaseModel):
+    id: str = Field(..., min_length=1, max_length=100)
+    docker_url: str = Field(..., max_length=255, pattern=r'^(unix|tcp|http|https|ssh)://.+')
+    address: str = Field(..., min_length=1, max_length=255)
+    enabled: bool = True
+
+class Layout(BaseModel):
+    id: str
+    name: str
+    layout_data: List[Dict[str, Any]]
+    is_default: bool = False
+
+class LayoutCreate(BaseModel):
+    name: str
+    layout_data: List[Dict[str, Any]]
+    is_default: bool = False
+
+class ContainerAction(BaseModel):
+    action: str
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    candidates = [tag.strip().removeprefix('W/') for tag in header.split(',')]
+    return etag in candidates or '*' in candidates
+
+def cached_json_response(request: Request, body: bytes, etag: str) -> Response:
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+CATALOG_EVENTS = {"catalog_changed", "service_updated"}
+SERVICE_LIVE_FIELDS = ("status", "container_id", "health")
+SERVICE_COLUMNS = tuple(name for name in Service.model_fields if name not in SERVICE_LIVE_FIELDS)
+
+def parse_service_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """A services row with its JSON columns decoded; unselected columns are skipped."""
+    svc = {name: row[name] for name in SERVICE_COLUMNS if name in row}
+    if 'ports' in svc:
+        svc['ports'] = json.loads(svc['ports']) if svc['ports'] else []
+    if 'env_vars' in svc:
+        svc['env_vars'] = json.loads(svc['env_vars']) if svc['env_vars'] else {}
+    if 'volumes' in svc:
+        svc['volumes'] = json.loads(svc['volumes']) if svc['volumes'] else []
+    if 'resources' in svc:
+        svc['resources'] = json.loads(svc['resources']) if svc['resources'] else None
+    if 'enabled' in svc:
+        svc['enabled'] = bool(svc['enabled'])
+    return svc
+
+def encode_cursor(service_id: str) -> str:
+    return base64.urlsafe_b64encode(service_id.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> str:
+    try:
+        return base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    if not fields:
+        return None
+    selected = [name.strip() for name in fields.split(',') if name.strip()]
+    unknown = [name for name in selected if name not in Service.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    if 'id' not in selected:
+        selected.insert(0, 'id')
+    return selected
+
+async def query_services(columns: List[str], category: Optional[str], enabled: Optional[bool],
+                         after: Optional[str], limit: Optional[int]) -> List[Dict[str, Any]]:
+    """One page of services in id order, filtered in SQL."""
+    clauses, args = [], []
+    if category is not None:
+        clauses.append("category = %s")
+        args.append(category)
+    if enabled is not None:
+        clauses.append("enabled = %s")
+        args.append(enabled)
+    if after is not None:
+        clauses.append("id > %s")
+        args.append(after)
+    
+    sql = f"SELECT {', '.join(columns)} FROM services"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY id"
+    if limit is not None:
+        sql += " LIMIT %s"
+        args.append(limit)
+    
+    async with db_pool.acquire() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            await cursor.execute(sql, args)
+            rows = await cursor.fetchall()
+    return [parse_service_row(row) for row in rows]
+
+class CatalogCache:
+    """Parsed services and serialized layouts, reloaded only after a write.
+
+    Writes call invalidate(), which also tells other workers through the
+    event bus. invalidate() bumps a generation, and a load that started
+    under an older generation is returned to its caller but not kept. The
+    version is a content hash, so every worker reports the same version for
+    the same catalog.
+    """
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.generation = 0
+        self.services: Optional[List[Dict[str, Any]]] = None
+        self.listing: Optional[tuple] = None
+        self.layouts: Optional[tuple] = None
+        self.version: Optional[str] = None
+
+    def invalidate(self):
+        self.generation += 1
+        self.services = None
+        self.listing = None
+        self.layouts = None
+        self.version = None
+
+    async def changed(self, kind: str):
+        self.invalidate()
+        await broadcast_message({"type": "catalog_changed", "kind": kind})
+
+    async def _cached(self, attr: str, load):
+        value = getattr(self, attr)
+        if value is None:
+            async with self.lock:
+                value = getattr(self, attr)
+                if value is None:
+                    generation = self.generation
+                    value = await load()
+                    if generation == self.generation:
+                        setattr(self, attr, value)
+        return value
+
+    async def get_services(self) -> List[Dict[str, Any]]:
+        return await self._cached("services", self._load_services)
+
+    async def get_listing(self) -> tuple:
+        """(services, fragments, etag): each fragment is a service's JSON object without its closing brace."""
+        return await self._cached("listing", self._build_listing)
+
+    async def _build_listing(self) -> tuple:
+        services = await self._load_services()
+        fragments = [json.dumps(svc, separators=(",", ":"), default=str).encode()[:-1] for svc in services]
+        return services, fragments, make_etag(b"\n".join(fragments))
+
+    async def _load_services(self) -> List[Dict[str, Any]]:
+        async with db_pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute("SELECT * FROM services")
+                services = await cursor.fetchall()
+        
+        return [parse_service_row(svc) for svc in services]
+
+    async def get_layouts(self) -> tuple:
+        """(body, etag) of the serialized layouts list."""
+        return await self._cached("layouts", self._load_layouts)
+
+    async def _load_layouts(self) -> tuple:
+        async with db_pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute("SELECT * FROM layouts")
+                layouts = await cursor.fetchall()
+        
+        result = []
+        for layout in layouts:
+            result.append({
+                "id": layout['id'],
+                "name": layout['name'],
+                "layout_data": json.loads(layout['layout_data']),
+                "is_default": bool(layout['is_default']),
+            })
+        body = json.dumps(result, separators=(",", ":"), default=str).encode()
+        return body, make_etag(body)
+
+    async def get_version(self) -> str:
+        if self.version is None:
+            generation = self.generation
+            services = await self.get_services()
+            _, layouts_etag = await self.get_layouts()
+            digest = hashlib.blake2b(digest_size=8)
+            digest.update(json.dumps(services, sort_keys=True, default=str).encode())
+            digest.update(layouts_etag.encode())
+            if generation != self.generation:
+                return digest.hexdigest()
+            self.version = digest.hexdigest()
+        return self.version
+
+catalog_cache = CatalogCache()
+
+@api_router.get("/services")
+async def get_services(request: Request, category: Optional[str] = None, enabled: Optional[bool] = None,
+                       status: Optional[str] = None, fields: Optional[str] = None,
+                       limit: Optional[int] = None, cursor: Optional[str] = None):
+    """List services; filters run in SQL and the Docker lookup only runs for live fields.
+
+    With `limit`, the next page's cursor is returned in the X-Next-Cursor header.
+    """
+    if limit is not None and not 1 <= limit <= SERVICES_PAGE_MAX:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {SERVICES_PAGE_MAX}")
+    selected = parse_fields(fields)
+    live = [name for name in SERVICE_LIVE_FIELDS if selected is None or name in selected]
+    statuses = await get_container_statuses() if live or status is not None else {}
+    
+    def live_status(service_id: str) -> Dict[str, Any]:
+        return statuses.get(service_id, {"status": "stopped", "container_id": None})
+    
+    next_cursor = None
+    if category is None and enabled is None and limit is None and cursor is None and selected is None:
+        # Full listing: splice the live fields onto the cached catalog JSON
+        services, fragments, catalog_etag = await catalog_cache.get_listing()
+        items, tags = [], [catalog_etag.encode()]
+        for index, (svc, fragment) in enumerate(zip(services, fragments)):
+            state = live_status(svc['id'])
+            if status is not None and state['status'] != status:
+                continue
+            extra = json.dumps({"status": state['status'], "container_id": state.get('container_id'),
+                                "health": health_prober.get(svc['id'])}, separators=(",", ":"), default=str).encode()
+            items.append(fragment + b"," + extra[1:])
+            tags.append(b"%d%s" % (index, extra))
+        return cached_json_response(request, b"[" + b",".join(items) + b"]", make_etag(b"\n".join(tags)))
+    if category is None and enabled is None and limit is None and cursor is None:
+        services = await catalog_cache.get_services()
+        if status is not None:
+            services = [svc for svc in services if live_status(svc['id'])['status'] == status]
+    else:
+        columns = ['id'] + [name for name in SERVICE_COLUMNS if name != 'id' and (selected is None or name in selected)]
+        after = decode_cursor(cursor) if cursor else None
+        services = []
+        # A status filter can only be applied after the Docker lookup, so keep reading
+        # pages until this one is full or the table runs out.
+        while True:
+            want = None if limit is None else limit - len(services)
+            page = await query_services(columns, category, enabled, after, want)
+            for svc in page:
+                if status is None or live_status(svc['id'])['status'] == status:
+                    services.append(svc)
+            if limit is None or len(page) < want:
+                break
+            after = page[-1]['id']
+            if len(services) >= limit:
+                next_cursor = encode_cursor(after)
+                break
+    
+    result = []
+    for svc in services:
+        item = svc if selected is None else {name: svc[name] for name in selected if name in svc}
+        if live:
+            state = live_status(svc['id'])
+            extra = {"status": state['status'], "container_id": state.get('container_id'),
+                     "health": health_prober.get(svc['id'])}
+            item = {**item, **{name: extra[name] for name in live}}
+        result.append(item)
+    
+    body = json.dumps(result, separators=(",", ":"), default=str).encode()
+    response = cached_json_response(request, body, make_etag(body))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
+
+@api_router.get("/catalog/version")
+async def get_catalog_version():
+    return {"version": await catalog_cache.get_version()}
+
+@api_router.post("/services", response_model=Service)
+async def create_service(service: ServiceCreate):
+    service_id = service.name.lower().replace(' ', '-')
+    depends_on = list(dict.fromkeys(service.depends_on))
+    if service_id in depends_on:
+        raise HTTPException(status_code=400, detail="A service cannot depend on itself")
+    
+    async with db_pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            ids = [service_id, *depends_on]
+            await cursor.execute(f"SELECT id FROM services WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+            existing = {row[0] for row in await cursor.fetchall()}
+            if service_id in existing:
+                raise HTTPException(status_code=409, detail="Service already exists")
+            missing = [dep for dep in depends_on if dep not in existing]
+            if missing:
+                raise HTTPException(status_code=400, detail=f"Unknown dependencies: {', '.join(missing)}")
+            
+            await conn.begin()
+            try:
+                await cursor.execute(
+                    """INSERT INTO services (id, name, category, image, tag, description, ports, env_vars,
+                       volumes, health_check, health_interval, resources, enabled, icon)
+                       VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+                    (service_id, service.name, service.category, service.image, service.tag,
+                     service.description, json.dumps(service.ports), json.dumps(service.env_vars),
+                     json.dumps(service.volumes), service.health_check, service.health_interval,
+                     resources_json(service.resources), False, service.icon)
+                )
+                if depends_on:
+                    await cursor.executemany(
+                        "INSERT INTO service_dependencies (service_id, depends_on) VALUES (%s, %s)",
+                        [(service_id, dep) for dep in depends_on]
+                    )
+                await conn.commit()
+            except Exception as e:
+                await conn.rollback()
+                logger.error(f"Creating service {service_id} failed: {e}")
+                raise HTTPException(status_code=500, detail=f"Failed to create service: {str(e)}")
+    
+    await catalog_cache.changed("services")
+    return Service(id=service_id, **service.dict(), status="stopped")
+
+@api_router.patch("/services/{service_id}/enable")
+async def toggle_service(service_id: str, enabled: bool):
+    async with db_pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(
+                "UPDATE services SET enabled = %s WHERE id = %s",
+                (enabled, service_id)
+            )
+    
+    catalog_cache.invalidate()
+    await broadcast_message({"type": "service_updated", "service_id": service_id, "enabled": enabled})
+    return {"message": "Service updated", "service_id": service_id, "enabled": enabled}
+
+@api_router.put("/services/{service_id}/resources")
+async def set_service_resources(service_id: str, resources: ResourceSpec):
+    """Replace a service's limits; they apply the next time its container is created."""
+    async with db_pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute("UPDATE services SET resources = %s WHERE id = %s",
+                                 (resources_json(resources), service_id))
+            if cursor.rowcount == 0:
+                await cursor.execute("SELECT COUNT(*) FROM services WHERE id = %s", (service_id,))
+                if (await cursor.fetchone())[0] == 0:
+                    raise HTTPException(status_code=404, detail="Service not found")
+
+    await catalog_cache.changed("services")
+    return {"message": "Resources updated", "service_id": service_id,
+            "resources": resources.model_dump(exclude_none=True, exclude_defaults=True)}
+
+def validation_message(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in err['loc']) or 'row'}: {err['msg']}" for err in error.errors())
+
+@api_router.post("/services:batch")
+async def import_services(batch: ServiceBatch):
+    """Create or update many services in one transaction.
+
+    Invalid rows are reported by index and skipped; the rest are written with
+    multi-row upserts. `enabled` only applies to newly created services.
+    """
+    errors = []
+    valid: Dict[str, tuple] = {}
+    for index, row in enumerate(batch.services):
+        try:
+            service = ServiceImport.model_validate(row)
+        except ValidationError as e:
+            row_id = row.get('id') if isinstance(row, dict) else None
+            errors.append({"index": index, "id": row_id, "error": validation_message(e)})
+            continue
+        service_id = service.id or service.name.lower().replace(' ', '-')
+        if service_id in valid:
+            errors.append({"index": index, "id": service_id, "error": "Duplicate id in batch"})
+            continue
+        valid[service_id] = (index, service)
+    
+    async with db_pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute("SELECT id FROM services")
+            existing = {row[0] for row in await cursor.fetchall()}
+            
+            if not batch.upsert:
+                for service_id in [sid for sid in valid if sid in existing]:
+                    index, _ = valid.pop(service_id)
+                    errors.append({"index": index, "id": service_id, "error": "Service already exists"})
+            
+            # Dropping a row can orphan a dependency of another row, so repeat until stable
+            while True:
+                known = existing | valid.keys()
+                missing = {sid: [dep for dep in svc.depends_on if dep not in known] for sid, (_, svc) in valid.items()}
+                missing = {sid: deps for sid, deps in missing.items() if deps}
+                if not missing:
+                    break
+                for service_id, deps in missing.items():
+                    index, _ = valid.pop(service_id)
+                    errors.append({"index": index, "id": service_id, "error": f"Unknown dependencies: {', '.join(deps)}"})
+            
+            if valid:
+                rows = [(service_id, svc.name, svc.category, svc.image, svc.tag, svc.description,
+                         json.dumps(svc.ports), json.dumps(svc.env_vars), json.dumps(svc.volumes),
+                         svc.health_check, svc.health_interval, resources_json(svc.resources), svc.enabled, svc.icon)
+                        for service_id, (_, svc) in valid.items()]
+                edges = [(service_id, dep) for service_id, (_, svc) in valid.items() for dep in svc.depends_on]
+                ids = list(valid)
+                
+                await conn.begin()
+                try:
+                    await cursor.executemany(
+                        """INSERT INTO services (id, name, category, image, tag, description, ports, env_vars,
+                           volumes, health_check, health_interval, resources, enabled, icon)
+                           VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                           ON DUPLICATE KEY UPDATE name = VALUES(name), category = VALUES(category), image = VALUES(image),
+                           tag = VALUES(tag), description = VALUES(description), ports = VALUES(ports),
+                           env_vars = VALUES(env_vars), volumes = VALUES(volumes), health_check = VALUES(health_check),
+                           health_interval = VALUES(health_interval), resources = VALUES(resources), icon = VALUES(icon)""",
+                        rows
+                    )
+                    for start in range(0, len(ids), 1000):
+                        chunk = ids[start:start + 1000]
+                        await cursor.execute(
+                            f"DELETE FROM service_dependencies WHERE service_id IN ({', '.join(['%s'] * len(chunk))})",
+                            chunk
+                        )
+                    if edges:
+                        await cursor.executemany(
+                            "INSERT INTO service_dependencies (service_id, depends_on) VALUES (%s, %s)",
+                            edges
+                        )
+                    await conn.commit()
+                except Exception as e:
+                    await conn.rollback()
+                    logger.error(f"Service import failed: {e}")
+                    raise HTTPException(status_code=500, detail=f"Import failed: {str(e)}")
+    
+    if valid:
+        await catalog_cache.changed("services")
+    created = [sid for sid in valid if sid not in existing]
+    return {
+        "created": len(created),
+        "updated": len(valid) - len(created),
+        "failed": len(errors),
+        "errors": sorted(errors, key=lambda err: err['index']),
+    }
+
+async def iter_service_rows(category: Optional[str]):
+    """Services with their dependencies, read through a server-side cursor.
+
+    One row per edge, grouped here rather than with GROUP_CONCAT, which
+    silently truncates at group_concat_max_len.
+    """
+    sql = """SELECT s.*, d.depends_on AS depends_on FROM services s
+             LEFT JOIN service_dependencies d ON d.service_id = s.id"""
+    args = []
+    if category is not None:
+        sql += " WHERE s.category = %s"
+        args.append(category)
+    sql += " ORDER BY s.id, d.depends_on"
+    
+    svc = None
+    async with db_pool.acquire() as conn:
+        async with conn.cursor(aiomysql.SSDictCursor) as cursor:
+            await cursor.execute(sql, args)
+            while True:
+                rows = await cursor.fetchmany(SERVICES_EXPORT_BATCH)
+                if not rows:
+                    break
+                for row in rows:
+                    if svc is None or svc['id'] != row['id']:
+                        if svc is not None:
+                            yield svc
+                        svc = parse_service_row(row)
+                        svc['depends_on'] = []
+                    if row['depends_on']:
+                        svc['depends_on'].append(row['depends_on'])
+    if svc is not None:
+        yield svc
+
+def compose_service(svc: Dict[str, Any]) -> Dict[str, Any]:
+    entry = {"image": f"{svc['image']}:{svc['tag']}", "container_name": f"orch_{svc['id']}"}
+    if svc['ports']:
+        entry['ports'] = svc['ports']
+    if svc['env_vars']:
+        entry['environment'] = svc['env_vars']
+    if svc['volumes']:
+        entry['volumes'] = svc['volumes']
+    if svc['depends_on']:
+        entry['depends_on'] = svc['depends_on']
+    resources = svc.get('resources') or {}
+    if 'cpus' in resources:
+        entry['cpus'] = resources['cpus']
+    if 'cpuset' in resources:
+        entry['cpuset'] = resources['cpuset']
+    if 'memory_mb' in resources:
+        entry['mem_limit'] = f"{resources['memory_mb']}m"
+    if 'memory_swap_mb' in resources:
+        entry['memswap_limit'] = -1 if resources['memory_swap_mb'] == -1 else f"{resources['memory_swap_mb']}m"
+    if 'pids' in resources:
+        entry['pids_limit'] = resources['pids']
+    if resources.get('ulimits'):
+        entry['ulimits'] = resources['ulimits']
+    return entry
+
+async def iter_service_export(format: str, category: Optional[str]):
+    if format == "jsonl":
+        async for svc in iter_service_rows(category):
+            yield json.dumps(svc, default=str) + "\n"
+        return
+    
+    import yaml
+    
+    named_volumes = set()
+    yield "version: '3.8'\n\nservices:\n"
+    async for svc in iter_service_rows(category):
+        for volume in svc['volumes']:
+            source = volume.split(':')[0]
+            if ':' in volume and not source.startswith(('/', '.', '~')):
+                named_volumes.add(source)
+        block = yaml.safe_dump({svc['id']: compose_service(svc)}, sort_keys=False, default_flow_style=False)
+        yield "".join(f"  {line}\n" for line in block.splitlines())
+    if named_volumes:
+        yield "\n" + yaml.safe_dump({"volumes": {name: None for name in sorted(named_volumes)}}, default_flow_style=False)
+
+@api_router.get("/services:export")
+async def export_services(format: str = "jsonl", category: Optional[str] = None):
+    if format not in ("jsonl", "compose"):
+        raise HTTPException(status_code=400, detail="format must be jsonl or compose")
+    
+    media_type, filename = (("application/x-ndjson", "services.jsonl") if format == "jsonl"
+                            else ("application/x-yaml", "docker-compose.services.yml"))
+    return StreamingResponse(
+        iter_service_export(format, category),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+CONFIG_HASH_LABEL = "orch.config_hash"
+
+async def fetch_service(service_id: str) -> Dict[str, Any]:
+    async with db_pool.acquire() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            await cursor.execute("SELECT * FROM services WHERE id = %s", (service_id,))
+            service = await cursor.fetchone()
+    
+    if not service:
+        raise HTTPException(status_code=404, detail="Service not found")
+    return service
+
+def build_run_config(service: Dict[str, Any]) -> Dict[str, Any]:
+    ports_dict = {}
+    ports = json.loads(service['ports']) if service['ports'] else []
+    for port_mapping in ports:
+        if ':' in port_mapping:
+            host_port, container_port = port_mapping.split(':')
+            ports_dict[container_port] = host_port
+    
+    env_vars = json.loads(service['env_vars']) if service['env_vars'] else {}
+    volumes_list = json.loads(service['volumes']) if service['volumes'] else []
+    volumes_dict = {vol.split(':')[0]: {'bind': vol.split(':')[1], 'mode': 'rw'} for vol in volumes_list if ':' in vol}
+    
+    return {
+        "name": f"orch_{service['id']}",
+        "ports": ports_dict,
+        "environment": env_vars,
+        "volumes": volumes_dict,
+        "network_mode": "bridge",
+        **resource_limits(service_resources(service)),
+    }
+
+def resource_limits(resources: Dict[str, Any]) -> Dict[str, Any]:
+    """containers.run keyword arguments for a resource spec; empty when no limits are set."""
+    mib = 1024 * 1024
+    limits: Dict[str, Any] = {}
+    if resources.get('cpus'):
+        limits['nano_cpus'] = int(resources['cpus'] * 1e9)
+    if resources.get('cpuset'):
+        limits['cpuset_cpus'] = resources['cpuset']
+    if resources.get('memory_mb'):
+        limits['mem_limit'] = resources['memory_mb'] * mib
+    if resources.get('memory_swap_mb') is not None:
+        swap = resources['memory_swap_mb']
+        limits['memswap_limit'] = -1 if swap == -1 else swap * mib
+    if resources.get('pids'):
+        limits['pids_limit'] = resources['pids']
+    if resources.get('ulimits'):
+        limits['ulimits'] = [docker.types.Ulimit(name=name, soft=ulimit['soft'], hard=ulimit['hard'])
+                             for name, ulimit in sorted(resources['ulimits'].items())]
+    return limits
+
+def config_hash(service: Dict[str, Any], run_config: Dict[str, Any]) -> str:
+    """Hash of everything that requires a recreate when it changes."""
+    payload = {"image": f"{service['image']}:{service['tag']}", **run_config}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:16]
+
+class PortIndex:
+    """Host ports each service publishes, built from the catalog.
+
+    A start is checked against services already running or starting on
+    the same host, so a clash is reported with the other service's name
+    before Docker fails the bind.
+    """
+
+    def __init__(self):
+        self.claims: Dict[str, List[str]] = {}
+        self.source: Optional[List[Dict[str, Any]]] = None
+
+    async def refresh(self):
+        services = await catalog_cache.get_services()
+        if services is self.source:
+            return
+        claims: Dict[str, List[str]] = {}
+        for svc in services:
+            for mapping in svc['ports']:
+                if ':' in mapping:
+                    claims.setdefault(mapping.split(':')[0], []).append(svc['id'])
+        for port, service_ids in claims.items():
+            if len(service_ids) > 1:
+                logger.warning(f"Host port {port} is published by several services: {', '.join(sorted(service_ids))}")
+        self.claims, self.source = claims, services
+
+    def conflicts(self) -> Dict[str, List[str]]:
+        return {port: sorted(service_ids) for port, service_ids in self.claims.items() if len(service_ids) > 1}
+
+    async def check(self, service: Dict[str, Any], host_id: str):
+        await self.refresh()
+        statuses = None
+        for port in sorted(service_host_ports(service)):
+            for other in self.claims.get(port, ()):
+                if other == service['id'] or host_registry.host_for(other).id != host_id:
+                    continue
+                if other in admission.starting:
+                    raise HTTPException(status_code=409,
+                                        detail=f"Host port {port} on {host_id} is taken by {other}, which is starting")
+                if statuses is None:
+                    statuses = await get_container_statuses()
+                if statuses.get(other, {}).get('status') == 'running':
+                    raise HTTPException(status_code=409,
+                                        detail=f"Host port {port} on {host_id} is already published by {other}")
+
+port_index = PortIndex()
+
+class AdmissionController:
+    """Keeps declared CPU and memory reservations within each host's capacity.
+
+    Only declared limits are reserved; services without them start as
+    before. Reservations are released on stop and resynced from container
+    states, so crashes and restarts outside the API free capacity too.
+    Starts take `lock` around their port check and admission, so two
+    starts never both pass on the same port or the last free capacity.
+    """
+
+    def __init__(self):
+        self.reservations: Dict[str, tuple] = {}
+        self.totals: Dict[str, List[float]] = {}
+        # Admitted starts: None while in progress, then when they finished
+        self.starting: Dict[str, Optional[float]] = {}
+        self.lock = asyncio.Lock()
+        self.released = asyncio.Condition(self.lock)
+        self.waiting = 0
+        self.counters = {"admitted": 0, "rejected": 0, "queued": 0, "queue_timeouts": 0}
+
+    def demand(self, service: Dict[str, Any]) -> tuple:
+        resources = service_resources(service)
+        cpus = resources.get('cpus') or (cpuset_size(resources['cpuset']) if resources.get('cpuset') else 0.0)
+        return float(cpus), float((resources.get('memory_mb') or 0) * 1024 * 1024)
+
+    def capacity(self, host: Host) -> tuple:
+        return host.ncpu * ADMISSION_CPU_OVERCOMMIT, host.mem_total * ADMISSION_MEMORY_OVERCOMMIT
+
+    def fits(self, host: Host, cpus: float, memory: float, service_id: Optional[str] = None) -> bool:
+        if host.mem_total <= 0 or (not cpus and not memory):
+            # Capacity unknown until the host is first refreshed, or nothing declared
+            return True
+        reserved_cpus, reserved_memory = self.totals.get(host.id, (0.0, 0.0))
+        current = self.reservations.get(service_id)
+        if current is not None and current[0] == host.id:
+            reserved_cpus -= current[1]
+            reserved_memory -= current[2]
+        cpu_capacity, memory_capacity = self.capacity(host)
+        return (not cpus or reserved_cpus + cpus <= cpu_capacity) and (not memory or reserved_memory + memory <= memory_capacity)
+
+    def reserve(self, service_id: str, host_id: str, cpus: float, memory: float):
+        self._drop(service_id)
+        if not cpus and not memory:
+            return
+        self.reservations[service_id] = (host_id, cpus, memory)
+        totals = self.totals.setdefault(host_id, [0.0, 0.0])
+        totals[0] += cpus
+        totals[1] += memory
+
+    def _drop(self, service_id: str) -> bool:
+        current = self.reservations.pop(service_id, None)
+        if current is None:
+            return False
+        totals = self.totals[current[0]]
+        totals[0] -= current[1]
+        totals[1] -= current[2]
+        return True
+
+    async def release(self, service_id: str):
+        self.starting.pop(service_id, None)
+        if self._drop(service_id):
+            async with self.released:
+                self.released.notify_all()
+
+    def shortfall(self, host: Host, cpus: float, memory: float) -> str:
+        reserved_cpus, reserved_memory = self.totals.get(host.id, (0.0, 0.0))
+        cpu_capacity, memory_capacity = self.capacity(host)
+        return (f"Host {host.id} cannot hold {cpus:g} CPUs / {memory / (1024 * 1024):.0f} MB more: "
+                f"{reserved_cpus:g} of {cpu_capacity:g} CPUs and {reserved_memory / (1024 * 1024):.0f} "
+                f"of {memory_capacity / (1024 * 1024):.0f} MB reserved")
+
+    async def admit(self, service: Dict[str, Any], host: Host):
+        """Reserve the service's declared resources on `host`, waiting or failing when they do not fit.
+
+        The caller holds `lock`; a queued start gives it up while it waits.
+        """
+        service_id = service['id']
+        cpus, memory = self.demand(service)
+        if not self.fits(host, cpus, memory, service_id):
+            if ADMISSION_POLICY != "queue":
+                self.counters["rejected"] += 1
+                raise HTTPException(status_code=503, detail=self.shortfall(host, cpus, memory),
+                                    headers={"Retry-After": str(int(ADMISSION_SYNC_INTERVAL))})
+            self.counters["queued"] += 1
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self.released.wait_for(lambda: self.fits(host, cpus, memory, service_id)),
+                                       ADMISSION_QUEUE_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.counters["queue_timeouts"] += 1
+                raise HTTPException(status_code=503, detail=self.shortfall(host, cpus, memory))
+            finally:
+                self.waiting -= 1
+        self.starting[service_id] = None
+        self.reserve(service_id, host.id, cpus, memory)
+        self.counters["admitted"] += 1
+
+    def started(self, service_id: str):
+        # Keep the reservation until a sync has had time to see the container running
+        if service_id in self.starting:
+            self.starting[service_id] = time.monotonic()
+
+    def settling(self, service_id: str) -> bool:
+        if service_id not in self.starting:
+            return False
+        finished = self.starting[service_id]
+        return finished is None or time.monotonic() - finished < ADMISSION_SYNC_INTERVAL
+
+    async def sync(self):
+        """Match reservations to what is actually running."""
+        statuses = await get_container_statuses()
+        services = {svc['id']: svc for svc in await catalog_cache.get_services()}
+        running = {service_id for service_id, state in statuses.items() if state['status'] == 'running'}
+        for service_id in list(self.starting):
+            if service_id in running or not self.settling(service_id):
+                self.starting.pop(service_id)
+        for service_id in list(self.reservations):
+            if service_id not in running and service_id not in self.starting:
+                self._drop(service_id)
+        for service_id in running - self.reservations.keys():
+            if service_id in services:
+                self.reserve(service_id, host_registry.host_for(service_id).id, *self.demand(services[service_id]))
+        async with self.released:
+            self.released.notify_all()
+
+    async def run(self):
+        while True:
+            try:
+                if db_pool.pool is not None:
+                    await self.sync()
+            except Exception as e:
+                logger.warning(f"Admission sync failed: {e}")
+            await asyncio.sleep(ADMISSION_SYNC_INTERVAL)
+
+    def stats(self) -> Dict[str, Any]:
+        hosts = []
+        for host in host_registry.hosts.values():
+            reserved_cpus, reserved_memory = self.totals.get(host.id, (0.0, 0.0))
+            cpu_capacity, memory_capacity = self.capacity(host)
+            hosts.append({
+                "id": host.id,
+                "cpus_reserved": round(reserved_cpus, 2),
+                "cpus_capacity": round(cpu_capacity, 2),
+                "memory_reserved_mb": round(reserved_memory / (1024 * 1024), 1),
+                "memory_capacity_mb": round(memory_capacity / (1024 * 1024), 1),
+            })
+        return {
+            "policy": ADMISSION_POLICY,
+            **self.counters,
+            "waiting": self.waiting,
+            "starting": sorted(self.starting),
+            "hosts": hosts,
+            "reservations": {service_id: {"host_id": host_id, "cpus": cpus, "memory_mb": round(memory / (1024 * 1024), 1)}
+                             for service_id, (host_id, cpus, memory) in sorted(self.reservations.items())},
+        }
+
+admission = AdmissionController()
+
+async def find_container(service_id: str):
+    try:
+        return await host_registry.gateway_for(service_id).get_container(service_id)
+    except docker.errors.NotFound:
+        return None
+
+async def record_container_started(service_id: str, container_id: str, host_id: Optional[str] = None):
+    host_id = host_id or host_registry.host_for(service_id).id
+    async with db_pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(
+                """INSERT INTO containers (id, service_id, container_id, status, started_at, host_id)
+                   VALUES (%s, %s, %s, %s, %s, %s) ON DUPLICATE KEY UPDATE
+                   container_id=%s, status=%s, started_at=%s, host_id=%s""",
+                (service_id, service_id, container_id, 'running', datetime.now(), host_id,
+                 container_id, 'running', datetime.now(), host_id)
+            )
+    host_registry.placed(service_id, host_id)
+    host_registry.note_state(service_id, 'running', container_id)
+
+@api_router.post("/containers/{service_id}/start")
+async def start_container(service_id: str, wait: Optional[str] = None, timeout: float = 60):
+    try:
+        service = await fetch_service(service_id)
+        host = host_registry.place(service)
+        try:
+            gateway = host.gateway
+            try:
+                client = await gateway.client()
+            except Exception as docker_error:
+                logger.warning(f"Docker not available on host {host.id}: {docker_error}")
+                raise HTTPException(status_code=503, detail="Docker service not available. This demo requires Docker to be running.")
+            
+            run_config = build_run_config(service)
+            desired_hash = config_hash(service, run_config)
+            
+            container = await find_container(service_id)
+            if container is not None and container.status == 'running':
+                host_registry.placed(service_id, host.id)
+                return await wait_if_requested(service_id, wait, timeout,
+                                               {"message": "Container already running", "container_id": container.id,
+                                                "host_id": host.id})
+            
+            async with admission.lock:
+                await port_index.check(service, host.id)
+                await admission.admit(service, host)
+            issued_at = time.time()
+            try:
+                if container is not None and container.labels.get(CONFIG_HASH_LABEL) == desired_hash:
+                    # Same definition: reuse the stopped container instead of recreating it
+                    await gateway.run("start", container.start)
+                else:
+                    if container is not None:
+                        await gateway.run("remove", container.remove, force=True)
+                    image_ref = await host.images.ensure(service['image'], service['tag'])
+                    container = await gateway.run(
+                        "run",
+                        client.containers.run,
+                        image_ref,
+                        detach=True,
+                        labels={CONFIG_HASH_LABEL: desired_hash},
+                        **run_config
+                    )
+            except BaseException:
+                await admission.release(service_id)
+                raise
+            admission.started(service_id)
+        except BaseException:
+            # Nothing runs there, so hand back the host and its reservation
+            host_registry.unplace(service_id)
+            raise
+        host_registry.placed(service_id, host.id)
+        
+        await record_container_started(service_id, container.id, host.id)
+        await broadcast_message({"type": "container_started", "service_id": service_id, "container_id": container.id,
+                                 "host_id": host.id})
+        return await wait_if_requested(service_id, wait, timeout,
+                                       {"message": "Container started", "container_id": container.id, "host_id": host.id},
+                                       since=issued_at)
+    
+    except HTTPException:
+        raise
+    except (DatabaseBusy, DatabaseUnavailable):
+        raise
+    except DockerTimeout as e:
+        logger.error(f"Error starting container: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
+    except docker.errors.APIError as e:
+        logger.error(f"Docker API error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error starting container: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def wait_if_requested(service_id: str, wait: Optional[str], timeout: float, result: Dict[str, Any],
+                            since: Optional[float] = None) -> Dict[str, Any]:
+    if wait is None:
+        return result
+    if wait != "ready":
+        raise HTTPException(status_code=400, detail="wait must be 'ready'")
+    outcome = await await_service_state(service_id, "ready", timeout, since)
+    if not outcome['reached']:
+        raise HTTPException(status_code=504, detail=f"Service {service_id} not ready after {timeout}s")
+    return {**result, "ready": True, "ready_source": outcome['detail']['source'], "waited_ms": outcome['waited_ms']}
+
+@api_router.get("/containers/{service_id}/await")
+async def await_container_state(service_id: str, state: str = "ready", timeout: float = 30):
+    return await await_service_state(service_id, state, min(timeout, 300))
+
+@api_router.post("/containers/{service_id}/stop")
+async def stop_container(service_id: str, timeout: Optional[int] = None):
+    stop_timeout = DOCKER_STOP_TIMEOUT if timeout is None else timeout
+    try:
+        gateway = host_registry.gateway_for(service_id)
+        container = await gateway.get_container(service_id)
+        await gateway.run("stop", container.stop, timeout=stop_timeout, op_timeout=stop_timeout + 5.0)
+        host_registry.note_state(service_id, 'exited', container.id)
+        await admission.release(service_id)
+        
+        async with db_pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    "UPDATE containers SET status = %s, stopped_at = %s WHERE service_id = %s",
+                    ('stopped', datetime.now(), service_id)
+                )
+        
+        await broadcast_message({"type": "container_stopped", "service_id": service_id})
+        return {"message": "Container stopped", "service_id": service_id}
+    
+    except docker.errors.NotFound:
+        raise HTTPException(status_code=404, detail="Container not found")
+    except (DatabaseBusy, DatabaseUnavailable):
+        raise
+    except DockerTimeout as e:
+        logger.error(f"Error stopping container: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error stopping container: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.post("/containers/{service_id}/restart")
+async def restart_container(service_id: str, timeout: Optional[int] = None):
+    """Restart in place when the definition is unchanged, otherwise recreate.
+
+    Docker's stop, restart and remove calls return only once the container
+    has reached the new state, so no fixed sleep is needed between steps.
+    """
+    stop_timeout = DOCKER_STOP_TIMEOUT if timeout is None else timeout
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+    
+    def mark(step: str, since: float):
+        timings[step] = round((time.perf_counter() - since) * 1000, 1)
+    
+    try:
+        step = time.perf_counter()
+        service = await fetch_service(service_id)
+        container = await find_container(service_id)
+        mark("inspect", step)
+        
+        desired_hash = config_hash(service, build_run_config(service))
+        gateway = host_registry.gateway_for(service_id)
+        if container is not None and container.labels.get(CONFIG_HASH_LABEL) == desired_hash:
+            mode = "restart"
+            step = time.perf_counter()
+            await gateway.run("restart", container.restart, timeout=stop_timeout, op_timeout=stop_timeout + 30.0)
+            await gateway.run("get", container.reload)
+            mark("restart", step)
+            if container.status != 'running':
+                raise HTTPException(status_code=500, detail=f"Container is {container.status} after restart")
+            await record_container_started(service_id, container.id)
+            await broadcast_message({"type": "container_started", "service_id": service_id, "container_id": container.id})
+            container_id = container.id
+        else:
+            mode = "recreate"
+            if container is not None:
+                step = time.perf_counter()
+                await gateway.run("stop", container.stop, timeout=stop_timeout, op_timeout=stop_timeout + 5.0)
+                mark("stop", step)
+                step = time.perf_counter()
+                await gateway.run("remove", container.remove)
+                mark("remove", step)
+            step = time.perf_counter()
+            result = await start_container(service_id)
+            mark("create_start", step)
+            container_id = result["container_id"]
+        
+        return {"message": "Container restarted", "service_id": service_id, "container_id": container_id,
+                "mode": mode, "timings_ms": timings,
+                "total_ms": round((time.perf_counter() - started) * 1000, 1)}
+    except HTTPException:
+        raise
+    except (DatabaseBusy, DatabaseUnavailable):
+        raise
+    except DockerTimeout as e:
+        logger.error(f"Error restarting container: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error restarting container: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def dependency_waves(service_ids: List[str], edges: List[tuple]) -> List[List[str]]:
+    """Group services into waves; each wave only depends on earlier ones.
+
+    Edges to services outside `service_ids` are ignored.
+    """
+    wanted = set(service_ids)
+    pending = {service_id: set() for service_id in service_ids}
+    for service_id, depends_on in edges:
+        if service_id in wanted and depends_on in wanted:
+            pending[service_id].add(depends_on)
+    waves = []
+    while pending:
+        ready = sorted(service_id for service_id, deps in pending.items() if not deps)
+        if not ready:
+            raise HTTPException(status_code=400, detail=f"Dependency cycle between: {', '.join(sorted(pending))}")
+        waves.append(ready)
+        for service_id in ready:
+            del pending[service_id]
+        for deps in pending.values():
+            deps.difference_update(ready)
+    return waves
+
+async def run_bulk_action(action: str, waves: List[List[str]], edges: List[tuple], parallelism: int):
+    handlers = {"start": start_container, "stop": stop_container, "restart": restart_container}
+    limit = asyncio.Semaphore(parallelism)
+    failed = set()
+    started = time.perf_counter()
+    progress: asyncio.Queue = asyncio.Queue()
+
+    async def run_one(wave: int, service_id: str):
+        # For stop, waves run in reverse, so a service's dependents come first
+        blockers = {d for s, d in edges if s == service_id} if action != "stop" else {s for s, d in edges if d == service_id}
+        if blockers & failed:
+            failed.add(service_id)
+            await progress.put({"service_id": service_id, "wave": wave, "status": "skipped",
+                                "detail": f"dependency failed: {', '.join(sorted(blockers & failed))}"})
+            return
+        async with limit:
+            op_started = time.perf_counter()
+            try:
+                await handlers[action](service_id)
+                result = {"status": "ok"}
+            except HTTPException as e:
+                failed.add(service_id)
+                result = {"status": "error", "detail": e.detail}
+            except Exception as e:
+                failed.add(service_id)
+                result = {"status": "error", "detail": str(e)}
+            result.update(service_id=service_id, wave=wave,
+                          elapsed_ms=round((time.perf_counter() - op_started) * 1000, 1))
+            await progress.put(result)
+
+    async def run_waves():
+        for wave, service_ids in enumerate(waves):
+            await asyncio.gather(*(run_one(wave, service_id) for service_id in service_ids))
+        await progress.put(None)
+
+    task = asyncio.create_task(run_waves())
+    try:
+        while (item := await progress.get()) is not None:
+            yield json.dumps({"type": "progress", "action": action, **item}) + "\n"
+        total = sum(len(wave) for wave in waves)
+        yield json.dumps({"type": "summary", "action": action, "total": total,
+                          "failed": len(failed), "succeeded": total - len(failed),
+                          "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}) + "\n"
+    finally:
+        task.cancel()
+
+@api_router.post("/containers/bulk")
+async def bulk_container_action(request: BulkAction):
+    if request.action not in ("start", "stop", "restart"):
+        raise HTTPException(status_code=400, detail="action must be start, stop or restart")
+    
+    async with db_pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            if request.all_enabled:
+                await cursor.execute("SELECT id FROM services WHERE enabled = TRUE")
+            else:
+                await cursor.execute("SELECT id FROM services")
+            known = [row[0] for row in await cursor.fetchall()]
+            await cursor.execute("SELECT service_id, depends_on FROM service_dependencies")
+            edges = [tuple(row) for row in await cursor.fetchall()]
+    
+    service_ids = known if request.all_enabled else list(dict.fromkeys(request.service_ids))
+    unknown = set(service_ids) - set(known)
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Unknown services: {', '.join(sorted(unknown))}")
+    
+    waves = dependency_waves(service_ids, edges)
+    if request.action == "stop":
+        waves.reverse()
+    parallelism = max(1, request.parallelism or BULK_PARALLELISM)
+    return StreamingResponse(run_bulk_action(request.action, waves, edges, parallelism),
+                             media_type="application/x-ndjson")
+
+@api_router.get("/containers/{service_id}/logs")
+async def get_container_logs(service_id: str, tail: int = 100):
+    try:
+        gateway = host_registry.gateway_for(service_id)
+        container = await gateway.get_container(service_id)
+        logs = await gateway.run("logs", container.logs, tail=tail)
+        return {"logs": logs.decode('utf-8')}
+    except docker.errors.NotFound:
+        raise HTTPException(status_code=404, detail="Container not found")
+    except DockerTimeout as e:
+        logger.error(f"Error fetching logs: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error fetching logs: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _read_exact(raw, size: int) -> bytes:
+    data = b''
+    while len(data) < size:
+        chunk = raw.read(size - len(data))
+        if not chunk:
+            return b''
+        data += chunk
+    return data
+
+def open_log_stream(client, name: str, params: Dict[str, Any]):
+    # The high-level logs() API merges stdout and stderr, so read the raw
+    # multiplexed stream and decode the frame headers ourselves.
+    response = client.api._get(client.api._url("/containers/{0}/logs", name), params=params, stream=True)
+    client.api._raise_for_status(response)
+    return response
+
+def iter_log_frames(raw):
+    """Yield (stream, payload) for each frame of Docker's multiplexed log stream."""
+    while True:
+        header = _read_exact(raw, 8)
+        if not header:
+            return
+        size = int.from_bytes(header[4:8], 'big')
+        payload = _read_exact(raw, size) if size else b''
+        yield ('stderr' if header[0] == 2 else 'stdout'), payload
+
+def docker_since(ts: str) -> Optional[str]:
+    """An RFC3339Nano timestamp as the UNIX seconds.nanoseconds Docker's `since` expects, without float rounding."""
+    base, _, fraction = ts.rstrip('Z').partition('.')
+    try:
+        seconds = int(datetime.fromisoformat(base).replace(tzinfo=timezone.utc).timestamp())
+    except ValueError:
+        return None
+    return f"{seconds}.{(fraction + '000000000')[:9]}"
+
+def parse_log_cursor(cursor: str) -> tuple:
+    """(timestamp, lines already sent at that timestamp) from a resume cursor."""
+    ts, _, repeats = cursor.partition('~')
+    return ts, int(repeats) if repeats.isdigit() else 1
+
+async def stream_log_records(response, cursor: Optional[str], timestamps: bool, max_bytes: int):
+    """NDJSON log records read from `response` on a helper thread.
+
+    The thread blocks while the bounded queue is full, so memory stays
+    constant however fast Docker produces output. The final record carries
+    the cursor to resume from: the last timestamp sent plus how many lines
+    carried it, since Docker's `since` returns those lines again.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=LOGS_STREAM_BUFFER)
+    stopped = threading.Event()
+
+    def pump():
+        try:
+            for frame in iter_log_frames(response.raw):
+                if stopped.is_set():
+                    break
+                asyncio.run_coroutine_threadsafe(queue.put(frame), loop).result()
+        except Exception as e:
+            if not stopped.is_set():
+                logger.debug(f"Log stream ended: {e}")
+        finally:
+            if not stopped.is_set():
+                asyncio.run_coroutine_threadsafe(queue.put(None), loop)
+
+    threading.Thread(target=pump, name="log-stream", daemon=True).start()
+    sent = 0
+    truncated = False
+    last_ts, repeats = parse_log_cursor(cursor) if cursor else (None, 0)
+    cursor_ts, skip = last_ts, repeats
+    try:
+        while True:
+            frame = await queue.get()
+            if frame is None:
+                break
+            stream, payload = frame
+            text = payload.decode('utf-8', errors='replace').rstrip('\n')
+            ts, _, line = text.partition(' ')
+            if cursor_ts and ts < cursor_ts:
+                continue
+            if ts == last_ts and skip:
+                # Only the lines already sent at the cursor's timestamp are repeats
+                skip -= 1
+                continue
+            skip = 0
+            size = len(line.encode('utf-8'))
+            if sent + size > max_bytes:
+                truncated = True
+                break
+            sent += size
+            repeats = repeats + 1 if ts == last_ts else 1
+            last_ts = ts
+            record = {"stream": stream, "line": line}
+            if timestamps:
+                record["timestamp"] = ts
+            yield json.dumps(record, ensure_ascii=False) + "\n"
+        end_cursor = f"{last_ts}~{repeats}" if last_ts else None
+        yield json.dumps({"type": "end", "cursor": end_cursor, "bytes": sent, "truncated": truncated}) + "\n"
+    finally:
+        stopped.set()
+        # Closing the response unblocks a follow-mode read in the pump thread
+        with suppress(Exception):
+            response.close()
+        while not queue.empty():
+            queue.get_nowait()
+
+@api_router.get("/containers/{service_id}/logs/stream")
+async def stream_container_logs(
+    service_id: str,
+    follow: bool = False,
+    since: Optional[str] = None,
+    cursor: Optional[str] = None,
+    tail: str = "all",
+    timestamps: bool = True,
+    stdout: bool = True,
+    stderr: bool = True,
+    max_bytes: int = LOGS_MAX_BYTES,
+):
+    # Docker always sends timestamps so every record can serve as a resume cursor
+    params = {"stdout": int(stdout), "stderr": int(stderr), "timestamps": 1,
+              "follow": int(follow), "tail": tail}
+    if cursor:
+        params["since"] = docker_since(parse_log_cursor(cursor)[0])
+        if params["since"] is None:
+            raise HTTPException(status_code=400, detail=f"Invalid cursor: {cursor}")
+    elif since:
+        params["since"] = f"{parse_time_param(since):.9f}"
+    try:
+        gateway = host_registry.gateway_for(service_id)
+        client = await gateway.client()
+        response = await gateway.run("logs", open_log_stream, client, f"orch_{service_id}", params)
+    except docker.errors.NotFound:
+        raise HTTPException(status_code=404, detail="Container not found")
+    except DockerTimeout as e:
+        logger.error(f"Error streaming logs: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error streaming logs: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return StreamingResponse(
+        stream_log_records(response, cursor, timestamps, min(max_bytes, LOGS_MAX_BYTES)),
+        media_type="application/x-ndjson"
+    )
+
+LOG_BLOOM_SHIFT = 32 - LOG_BLOOM_BITS
+LOG_LINE_ENCODER = json.JSONEncoder(ensure_ascii=False)
+
+def trigram_slots(data: bytes) -> 'np.ndarray':
+    """Bloom slots of every byte trigram in `data`, which must already be lowercased."""
+    import numpy as np
+    
+    if len(data) < 3:
+        return np.empty(0, dtype=np.uint32)
+    raw = np.frombuffer(data, dtype=np.uint8).astype(np.uint32)
+    codes = (raw[:-2] << 16) | (raw[1:-1] << 8) | raw[2:]
+    return np.unique((codes * np.uint32(2654435761)) >> np.uint32(LOG_BLOOM_SHIFT))
+
+def trigram_bloom(data: bytes) -> bytes:
+    import numpy as np
+    
+    bits = np.zeros(1 << (LOG_BLOOM_BITS - 3), dtype=np.uint8)
+    slots = trigram_slots(data)
+    np.bitwise_or.at(bits, slots >> 3, (np.uint32(1) << (slots & 7)).astype(np.uint8))
+    return bits.tobytes()
+
+def parse_log_timestamp(ts: str) -> Optional[float]:
+    # Docker uses RFC3339Nano, which has more fractional digits than fromisoformat accepts
+    try:
+        base, _, fraction = ts.rstrip('Z').partition('.')
+        seconds = datetime.fromisoformat(base).replace(tzinfo=timezone.utc).timestamp()
+        return seconds + (float('0.' + fraction) if fraction else 0.0)
+    except ValueError:
+        return None
+
+def parse_time_param(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid time: {value}")
+    return (parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)).timestamp()
+
+def json_escaped(needle: bytes) -> bool:
+    # Such a needle looks different inside the JSON-encoded line, so neither the
+    # raw-line prefilter nor the segment bloom filter can be used for it
+    return any(ch in needle for ch in b'"\\') or any(ch < 0x20 for ch in needle)
+
+def match_log_lines(lines, needle: bytes, since: Optional[float], until: Optional[float], limit: int):
+    """Records among JSON-encoded log `lines` whose text contains `needle`."""
+    prefilter = needle and not json_escaped(needle)
+    found = []
+    for raw in lines:
+        if prefilter and needle not in raw.lower():
+            continue
+        record = json.loads(raw)
+        if since is not None and record['t'] < since or until is not None and record['t'] > until:
+            continue
+        if needle and needle not in record['line'].encode('utf-8').lower():
+            continue
+        found.append(record)
+        if len(found) >= limit:
+            break
+    return found
+
+class LogSegment:
+    """A sealed, gzip-compressed run of one container's log lines plus its index entry."""
+
+    def __init__(self, service_id: str, path: str, start: float, end: float, lines: int,
+                 raw_bytes: int, compressed_bytes: int, bloom: bytes):
+        self.service_id = service_id
+        self.path = path
+        self.start = start
+        self.end = end
+        self.lines = lines
+        self.raw_bytes = raw_bytes
+        self.compressed_bytes = compressed_bytes
+        self.bloom = bloom
+
+    def to_json(self) -> str:
+        return json.dumps({"service_id": self.service_id, "path": self.path, "start": self.start, "end": self.end,
+                           "lines": self.lines, "raw_bytes": self.raw_bytes, "compressed_bytes": self.compressed_bytes,
+                           "bloom": base64.b64encode(zlib.compress(self.bloom)).decode()})
+
+    @classmethod
+    def from_json(cls, text: str) -> 'LogSegment':
+        entry = json.loads(text)
+        entry['bloom'] = zlib.decompress(base64.b64decode(entry['bloom']))
+        return cls(**entry)
+
+    def may_contain(self, slots: Optional['np.ndarray']) -> bool:
+        if slots is None or not len(slots):
+            return True
+        import numpy as np
+        bits = np.frombuffer(self.bloom, dtype=np.uint8)
+        return bool(np.all(bits[slots >> 3] & (np.uint32(1) << (slots & 7)).astype(np.uint8)))
+
+    def scan(self, needle: bytes, since: Optional[float], until: Optional[float], limit: int):
+        with gzip.open(self.path, 'rb') as f:
+            return match_log_lines(f, needle, since, until, limit)
+
+class ActiveSegment:
+    """The in-memory tail of one container's log that has not been sealed yet."""
+
+    def __init__(self, service_id: str):
+        self.service_id = service_id
+        self.lines: List[bytes] = []
+        self.start: Optional[float] = None
+        self.end: Optional[float] = None
+        self.raw_bytes = 0
+        self.opened_at = time.monotonic()
+
+class LogTailer:
+    """Follows one container's log on a daemon thread and feeds it to the archive."""
+
+    def __init__(self, archive: 'LogArchive', service_id: str):
+        self.archive = archive
+        self.service_id = service_id
+        self.stopped = threading.Event()
+        self.response = None
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, gateway: DockerGateway, client) -> bool:
+        self.stopped.clear()
+        self.thread = gateway.start_stream(f"logs-{self.service_id}", self._pump, client)
+        return self.thread is not None
+
+    def stop(self):
+        self.stopped.set()
+        # Closing the response unblocks the follow-mode read
+        with suppress(Exception):
+            if self.response is not None:
+                self.response.close()
+
+    def _pump(self, client):
+        resume = self.archive.resume_point(self.service_id)
+        params = {"stdout": 1, "stderr": 1, "timestamps": 1, "follow": 1, "tail": "all"}
+        if resume is not None:
+            params["since"] = f"{resume:.9f}"
+        try:
+            self.response = open_log_stream(client, f"orch_{self.service_id}", params)
+            for stream, payload in iter_log_frames(self.response.raw):
+                if self.stopped.is_set():
+                    return
+                ts, _, line = payload.decode('utf-8', errors='replace').rstrip('\n').partition(' ')
+                t = parse_log_timestamp(ts)
+                if t is None or resume is not None and t <= resume:
+                    continue
+                self.archive.append(self.service_id, t, stream, line)
+        except Exception as e:
+            if not self.stopped.is_set():
+                logger.debug(f"Log tail for {self.service_id} ended: {e}")
+
+class LogArchive:
+    """Rotating, compressed on-disk archive of every orch_* container's logs.
+
+    Each container's lines collect in an active segment that is sealed into a
+    gzip file once it reaches LOG_SEGMENT_BYTES or LOG_SEGMENT_SECONDS. Each
+    sealed segment gets an index entry with its time range and a bloom filter
+    of the byte trigrams in its lines, so searches skip segments that cannot
+    match without decompressing them.
+
+    Only the worker holding the directory's writer lock tails and writes;
+    the others reload the index when it changes and search sealed segments.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.index_path = directory / 'index.jsonl'
+        self.leader = FileLeaderLock(directory / 'writer.lock')
+        self.index_version = None
+        self.lock = threading.Lock()
+        self.segments: List[LogSegment] = []
+        self.active: Dict[str, ActiveSegment] = {}
+        self.tailers: Dict[str, LogTailer] = {}
+        self.counters = {"lines": 0, "bytes": 0, "sealed": 0, "expired": 0}
+
+    def load(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.index_version = self._index_version()
+        segments = []
+        if self.index_path.exists():
+            with open(self.index_path) as f:
+                for text in f:
+                    try:
+                        segment = LogSegment.from_json(text)
+                    except (ValueError, KeyError, zlib.error) as e:
+                        logger.warning(f"Skipping bad log index entry: {e}")
+                        continue
+                    if os.path.exists(segment.path):
+                        segments.append(segment)
+        with self.lock:
+            self.segments = segments
+        logger.info(f"Log archive loaded {len(segments)} segments from {self.directory}")
+
+    def _index_version(self):
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def lead(self) -> bool:
+        """Pick up the leader's latest index, then try to become the leader."""
+        if self._index_version() != self.index_version:
+            self.load()
+        return self.leader.acquire()
+
+    def resume_point(self, service_id: str) -> Optional[float]:
+        with self.lock:
+            active = self.active.get(service_id)
+            if active is not None and active.end is not None:
+                return active.end
+            ends = [segment.end for segment in self.segments if segment.service_id == service_id]
+        return max(ends, default=None)
+
+    def append(self, service_id: str, t: float, stream: str, line: str):
+        # Hot path: encode only the line and splice the fixed fields in by hand
+        data = f'{{"t":{t!r},"stream":"{stream}","line":{LOG_LINE_ENCODER.encode(line)}}}'.encode('utf-8')
+        with self.lock:
+            active = self.active.get(service_id)
+            if active is None:
+                active = self.active[service_id] = ActiveSegment(service_id)
+            active.lines.append(data)
+            active.start = t if active.start is None else active.start
+            active.end = t
+            active.raw_bytes += len(data) + 1
+            self.counters["lines"] += 1
+            self.counters["bytes"] += len(data) + 1
+            full = active.raw_bytes >= LOG_SEGMENT_BYTES
+        if full:
+            self.seal(service_id)
+
+    def seal(self, service_id: str):
+        with self.lock:
+            active = self.active.pop(service_id, None)
+        if active is None or not active.lines:
+            return
+        
+        body = b'\n'.join(active.lines) + b'\n'
+        service_dir = self.directory / service_id
+        service_dir.mkdir(parents=True, exist_ok=True)
+        path = service_dir / f"{int(active.start * 1e9)}.jsonl.gz"
+        compressed = gzip.compress(body, compresslevel=LOG_COMPRESS_LEVEL)
+        tmp_path = path.with_suffix('.tmp')
+        tmp_path.write_bytes(compressed)
+        os.replace(tmp_path, path)
+        
+        segment = LogSegment(service_id, str(path), active.start, active.end, len(active.lines),
+                             len(body), len(compressed), trigram_bloom(body.lower()))
+        with self.lock:
+            self.segments.append(segment)
+            with open(self.index_path, 'a') as f:
+                f.write(segment.to_json() + '\n')
+            self.counters["sealed"] += 1
+
+    def seal_expired(self):
+        now = time.monotonic()
+        with self.lock:
+            expired = [service_id for service_id, active in self.active.items()
+                       if now - active.opened_at >= LOG_SEGMENT_SECONDS]
+        for service_id in expired:
+            self.seal(service_id)
+
+    def enforce_retention(self):
+        with self.lock:
+            total = sum(segment.compressed_bytes for segment in self.segments)
+            if total <= LOG_RETENTION_BYTES:
+                return
+            expired = []
+            for segment in sorted(self.segments, key=lambda s: s.end):
+                if total <= LOG_RETENTION_BYTES:
+                    break
+                expired.append(segment)
+                total -= segment.compressed_bytes
+            expired_paths = {segment.path for segment in expired}
+            self.segments = [segment for segment in self.segments if segment.path not in expired_paths]
+            tmp_path = self.index_path.with_suffix('.tmp')
+            with open(tmp_path, 'w') as f:
+                for segment in self.segments:
+                    f.write(segment.to_json() + '\n')
+            os.replace(tmp_path, self.index_path)
+            self.counters["expired"] += len(expired)
+        for path in expired_paths:
+            with suppress(OSError):
+                os.remove(path)
+
+    async def search(self, query: str, services: Optional[List[str]], since: Optional[float],
+                     until: Optional[float], limit: int):
+        """NDJSON matches in time order, followed by an end record with scan counts."""
+        needle = query.encode('utf-8').lower()
+        slots = trigram_slots(needle) if len(needle) >= 3 and not json_escaped(needle) else None
+        with self.lock:
+            sealed = list(self.segments)
+            active = [(a.service_id, list(a.lines), a.start, a.end) for a in self.active.values() if a.lines]
+        
+        candidates = []
+        skipped = 0
+        for segment in sealed:
+            if (services and segment.service_id not in services
+                    or since is not None and segment.end < since
+                    or until is not None and segment.start > until
+                    or not segment.may_contain(slots)):
+                skipped += 1
+                continue
+            candidates.append((segment.start, segment.service_id, segment))
+        for service_id, lines, start, end in active:
+            if (services and service_id not in services
+                    or since is not None and end < since
+                    or until is not None and start > until):
+                skipped += 1
+                continue
+            candidates.append((start, service_id, lines))
+        candidates.sort(key=lambda candidate: candidate[0])
+        
+        # Segments of different services overlap in time, so keep the earliest
+        # `limit` records across all of them; a segment starting after the
+        # last kept record cannot improve on them
+        found = []
+        scanned = 0
+        for start, service_id, source in candidates:
+            if len(found) >= limit and start > found[-1][1]['t']:
+                break
+            scanned += 1
+            if isinstance(source, LogSegment):
+                records = await asyncio.to_thread(source.scan, needle, since, until, limit)
+            else:
+                records = await asyncio.to_thread(match_log_lines, source, needle, since, until, limit)
+            found.extend((service_id, record) for record in records)
+            found.sort(key=lambda match: match[1]['t'])
+            del found[limit:]
+        
+        for service_id, record in found:
+            yield json.dumps({
+                    "service_id": service_id,
+                    "timestamp": datetime.fromtimestamp(record['t'], timezone.utc).isoformat(),
+                    "stream": record['stream'],
+                    "line": record['line'],
+                }, ensure_ascii=False) + "\n"
+        yield json.dumps({"type": "end", "matches": len(found), "segments_scanned": scanned,
+                          "segments_skipped": skipped, "truncated": len(found) >= limit}) + "\n"
+
+    async def ensure(self, service_id: str):
+        tailer = self.tailers.get(service_id)
+        if tailer and tailer.alive:
+            return
+        gateway = host_registry.gateway_for(service_id)
+        client = await gateway.stream_client()
+        tailer = LogTailer(self, service_id)
+        if tailer.start(gateway, client):
+            self.tailers[service_id] = tailer
+        else:
+            logger.debug(f"No stream slot free for {service_id} logs; retrying on the next scan")
+
+    def discard(self, service_id: str):
+        tailer = self.tailers.pop(service_id, None)
+        if tailer:
+            tailer.stop()
+
+    async def run(self):
+        await asyncio.to_thread(self.load)
+        while True:
+            try:
+                if self.leader.held or await asyncio.to_thread(self.lead):
+                    statuses = await get_container_statuses()
+                    running = {service_id for service_id, state in statuses.items() if state['status'] == 'running'}
+                    for service_id in running:
+                        await self.ensure(service_id)
+                    for service_id in set(self.tailers) - running:
+                        self.discard(service_id)
+                    await asyncio.to_thread(self.seal_expired)
+                    await asyncio.to_thread(self.enforce_retention)
+            except Exception as e:
+                logger.debug(f"Log archive scan failed: {e}")
+            await asyncio.sleep(STATS_SCAN_INTERVAL)
+
+    def shutdown(self):
+        for tailer in self.tailers.values():
+            tailer.stop()
+        for service_id in list(self.active):
+            with suppress(Exception):
+                self.seal(service_id)
+        self.leader.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "directory": str(self.directory),
+                "leader": self.leader.held,
+                "segments": len(self.segments),
+                "stored_bytes": sum(segment.compressed_bytes for segment in self.segments),
+                "archived_raw_bytes": sum(segment.raw_bytes for segment in self.segments),
+                "active_bytes": sum(active.raw_bytes for active in self.active.values()),
+                "tailers": sorted(service_id for service_id, tailer in self.tailers.items() if tailer.alive),
+                "ingested_lines": self.counters["lines"],
+                "ingested_bytes": self.counters["bytes"],
+                "sealed": self.counters["sealed"],
+                "expired": self.counters["expired"],
+            }
+
+log_archive = LogArchive(Path(LOG_ARCHIVE_DIR))
+
+@api_router.get("/logs/search")
+async def search_logs(q: str = "", services: Optional[str] = None, since: Optional[str] = None,
+                      until: Optional[str] = None, limit: int = LOG_SEARCH_MAX_RESULTS):
+    service_ids = [service_id.strip() for service_id in services.split(',') if service_id.strip()] if services else None
+    return StreamingResponse(
+        log_archive.search(q, service_ids, parse_time_param(since), parse_time_param(until),
+                           max(1, min(limit, LOG_SEARCH_MAX_RESULTS))),
+        media_type="application/x-ndjson"
+    )
+
+@api_router.get("/logs/archive")
+async def get_log_archive_stats():
+    return log_archive.stats()
+
+@api_router.get("/containers/{service_id}/stats")
+async def get_container_stats(service_id: str):
+    try:
+        if (await get_container_status(service_id))['status'] == 'running':
+            await stats_manager.ensure(service_id)
+    except Exception as e:
+        logger.error(f"Error fetching stats: {e}")
+    return format_stats(stats_manager.latest(service_id))
+
+@api_router.get("/containers/{service_id}/stats/history")
+async def get_container_stats_history(service_id: str, window: int = 300, points: int = 60):
+    series = stats_manager.history(service_id, window, points)
+    return {"service_id": service_id, "window": window, "points": [format_stats(sample) for sample in series]}
+
+@api_router.get("/metrics/history")
+async def get_metrics_history(services: Optional[str] = None, start: Optional[str] = None,
+                              end: Optional[str] = None, tier: Optional[str] = None):
+    """Per-service CPU/memory p50/p95 over a time range, from the rollup tiers.
 
-class ServiceCreate(BaseModel):
-    name: str
-    category: str
-    image: str
-    tag: str = "latest"
-    description: Optional[str] = None
-    ports: List[str] = []
-    env_vars: Dict[str, str] = {}
-    volumes: List[str] = []
-    health_check: Optional[str] = None
-    icon: str = "Box"
+    Percentiles are taken over bucket means of the chosen tier; max comes from
+    the per-bucket maxima. Without `tier`, the finest tier that still retains
+    `start` is used.
+    """
+    now = time.time()
+    end_ts = parse_time_param(end) or now
+    start_ts = parse_time_param(start) or end_ts - 86400
+    if start_ts >= end_ts:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    tiers = [name for name, _, _, _ in METRICS_TIERS]
+    if tier is not None and tier not in tiers:
+        raise HTTPException(status_code=400, detail=f"tier must be one of {', '.join(tiers)}")
+    tier = tier or metrics_history.choose_tier(start_ts, now)
+    service_ids = ([service_id.strip() for service_id in services.split(',') if service_id.strip()]
+                   if services else metrics_history.known_services(tier))
+    
+    started = time.perf_counter()
+    result = await asyncio.to_thread(metrics_history.summarize, tier, service_ids, start_ts, end_ts)
+    return {
+        "tier": tier,
+        "start": datetime.fromtimestamp(start_ts, timezone.utc).isoformat(),
+        "end": datetime.fromtimestamp(end_ts, timezone.utc).isoformat(),
+        "query_ms": round((time.perf_counter() - started) * 1000, 2),
+        "services": result,
+    }
 
-class Layout(BaseModel):
-    id: str
-    name: str
-    layout_data: List[Dict[str, Any]]
-    is_default: bool = False
+@api_router.get("/metrics/history/stats")
+async def get_metrics_history_stats():
+    return metrics_history.stats()
 
-class LayoutCreate(BaseModel):
-    name: str
-    layout_data: List[Dict[str, Any]]
-    is_default: bool = False
+async def get_container_status(service_id: str) -> Dict[str, Any]:
+    host = host_registry.host_for(service_id)
+    if host.id != LOCAL_HOST_ID:
+        return host_registry.remote_state(service_id, host)
+    if container_states.synced:
+        return container_states.get(service_id)
+    try:
+        container = await docker_gateway.get_container(service_id)
+        return {"status": container.status, "container_id": container.id}
+    except docker.errors.NotFound:
+        return {"status": "stopped", "container_id": None}
+    except Exception as e:
+        logger.debug(f"Docker not available or container not found: {e}")
+        return {"status": "stopped", "container_id": None}
 
-class ContainerAction(BaseModel):
-    action: str
+async def get_container_statuses() -> Dict[str, Dict[str, Any]]:
+    if container_states.synced:
+        return {**container_states.states, **host_registry.remote_states()}
+    try:
+        return {**await docker_gateway.list_container_states(), **host_registry.remote_states()}
+    except Exception as e:
+        logger.debug(f"Docker not available for status listing: {e}")
+        return host_registry.remote_states()
+
+@api_router.get("/services/{service_id}/health")
+async def get_service_health(service_id: str):
+    target = health_prober.targets.get(service_id)
+    if target is None:
+        raise HTTPException(status_code=404, detail="Service is not being probed")
+    return {"service_id": service_id, **target.summary(), "history": list(target.history)}
 
-@api_router.get("/services", response_model=List[Service])
-async def get_services():
+@api_router.get("/images")
+async def get_images():
+    return [state.to_dict() for state in image_manager.images.values()]
+
+@api_router.post("/images/{service_id}/pull")
+async def pull_service_image(service_id: str):
     async with db_pool.acquire() as conn:
         async with conn.cursor(aiomysql.DictCursor) as cursor:
-            await cursor.execute("SELECT * FROM services")
-            services = await cursor.fetchall()
-            
-            result = []
-            for svc in services:
-                svc_dict = dict(svc)
-                svc_dict['ports'] = json.loads(svc_dict['ports']) if svc_dict['ports'] else []
-                svc_dict['env_vars'] = json.loads(svc_dict['env_vars']) if svc_dict['env_vars'] else {}
-                svc_dict['volumes'] = json.loads(svc_dict['volumes']) if svc_dict['volumes'] else []
-                svc_dict['enabled'] = bool(svc_dict['enabled'])
-                
-                status = await get_container_status(svc_dict['id'])
-                svc_dict['status'] = status['status']
-                svc_dict['container_id'] = status.get('container_id')
-                
-                result.append(svc_dict)
-            
-            return result
-
-@api_router.post("/services", response_model=Service)
-async def create_service(service: ServiceCreate):
-    service_id = service.name.lower().replace(' ', '-')
+            await cursor.execute("SELECT image, tag FROM services WHERE id = %s", (service_id,))
+            service = await cursor.fetchone()
     
-    async with db_pool.acquire() as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute(
-                """INSERT INTO services (id, name, category, image, tag, description, ports, env_vars, 
-                   volumes, health_check, enabled, icon) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
-                (service_id, service.name, service.category, service.image, service.tag,
-                 service.description, json.dumps(service.ports), json.dumps(service.env_vars),
-                 json.dumps(service.volumes), service.health_check, False, service.icon)
-            )
+    if not service:
+        raise HTTPException(status_code=404, detail="Service not found")
     
-    return Service(id=service_id, **service.dict(), status="stopped")
+    state = image_manager.get(service['image'], service['tag'])
+    task = asyncio.ensure_future(image_manager.pull(service['image'], service['tag']))
+    # Failures are logged and recorded on the image state
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    return {"message": "Pull started", **state.to_dict()}
 
-@api_router.patch("/services/{service_id}/enable")
-async def toggle_service(service_id: str, enabled: bool):
-    async with db_pool.acquire() as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute(
-                "UPDATE services SET enabled = %s WHERE id = %s",
-                (enabled, service_id)
-            )
-    
-    await broadcast_message({"type": "service_updated", "service_id": service_id, "enabled": enabled})
-    return {"message": "Service updated", "service_id": service_id, "enabled": enabled}
+@api_router.get("/health")
+async def get_liveness():
+    return {"status": "ok"}
 
-@api_router.post("/containers/{service_id}/start")
-async def start_container(service_id: str):
+@api_router.get("/hosts")
+async def get_hosts():
+    return host_registry.stats()
+
+@api_router.post("/hosts")
+async def create_host(host: HostCreate):
+    if host.id == LOCAL_HOST_ID:
+        raise HTTPException(status_code=400, detail=f"'{LOCAL_HOST_ID}' is reserved for the local daemon")
     try:
-        try:
-            client = docker.from_env()
-        except Exception as docker_error:
-            logger.warning(f"Docker not available: {docker_error}")
-            raise HTTPException(status_code=503, detail="Docker service not available. This demo requires Docker to be running.")
-        
         async with db_pool.acquire() as conn:
             async with conn.cursor(aiomysql.DictCursor) as cursor:
-                await cursor.execute("SELECT * FROM services WHERE id = %s", (service_id,))
-                service = await cursor.fetchone()
-                
-                if not service:
-                    raise HTTPException(status_code=404, detail="Service not found")
-                
-                ports_dict = {}
-                ports = json.loads(service['ports']) if service['ports'] else []
-                for port_mapping in ports:
-                    if ':' in port_mapping:
-                        host_port, container_port = port_mapping.split(':')
-                        ports_dict[container_port] = host_port
-                
-                env_vars = json.loads(service['env_vars']) if service['env_vars'] else {}
-                volumes_list = json.loads(service['volumes']) if service['volumes'] else []
-                volumes_dict = {vol.split(':')[0]: {'bind': vol.split(':')[1], 'mode': 'rw'} for vol in volumes_list if ':' in vol}
-                
-                container = client.containers.run(
-                    f"{service['image']}:{service['tag']}",
-                    detach=True,
-                    name=f"orch_{service_id}",
-                    ports=ports_dict,
-                    environment=env_vars,
-                    volumes=volumes_dict,
-                    network_mode="bridge"
-                )
-                
                 await cursor.execute(
-                    """INSERT INTO containers (id, service_id, container_id, status, started_at) 
-                       VALUES (%s, %s, %s, %s, %s) ON DUPLICATE KEY UPDATE 
-                       container_id=%s, status=%s, started_at=%s""",
-                    (service_id, service_id, container.id, 'running', datetime.now(),
-                     container.id, 'running', datetime.now())
+                    """INSERT INTO hosts (id, docker_url, address, enabled) VALUES (%s, %s, %s, %s)
+                       ON DUPLICATE KEY UPDATE docker_url=%s, address=%s, enabled=%s""",
+                    (host.id, host.docker_url, host.address, host.enabled,
+                     host.docker_url, host.address, host.enabled)
                 )
-        
-        await broadcast_message({"type": "container_started", "service_id": service_id, "container_id": container.id})
-        return {"message": "Container started", "container_id": container.id}
-    
-    except docker.errors.APIError as e:
-        logger.error(f"Docker API error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+                await cursor.execute("SELECT id, docker_url, address, enabled FROM hosts")
+                rows = await cursor.fetchall()
+    except (DatabaseBusy, DatabaseUnavailable):
+        raise
     except Exception as e:
-        logger.error(f"Error starting container: {e}")
+        logger.error(f"Error registering host: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    
+    host_registry.sync(rows)
+    # An unreachable daemon is still registered; it reports healthy: false and its error
+    await host_registry.refresh_host(host_registry.hosts[host.id])
+    return host_registry.hosts[host.id].to_dict(host_registry.services_on(host.id))
 
-@api_router.post("/containers/{service_id}/stop")
-async def stop_container(service_id: str):
-    try:
-        client = docker.from_env()
-        container = client.containers.get(f"orch_{service_id}")
-        container.stop()
+@api_router.delete("/hosts/{host_id}")
+async def delete_host(host_id: str):
+    if host_id == LOCAL_HOST_ID or host_id not in host_registry.hosts:
+        raise HTTPException(status_code=404, detail="Host not found")
+    placed = host_registry.services_on(host_id)
+    if placed:
+        raise HTTPException(status_code=409, detail=f"Host still has services placed on it: {', '.join(placed)}")
+    async with db_pool.acquire() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            await cursor.execute("DELETE FROM hosts WHERE id = %s", (host_id,))
+            await cursor.execute("SELECT id, docker_url, address, enabled FROM hosts")
+            rows = await cursor.fetchall()
+    host_registry.sync(rows)
+    return {"message": "Host removed", "id": host_id}
+
+@api_router.get("/admission")
+async def get_admission():
+    return admission.stats()
+
+@api_router.get("/ports")
+async def get_port_allocations():
+    await port_index.refresh()
+    return {"allocations": {port: sorted(service_ids) for port, service_ids in sorted(port_index.claims.items())},
+            "conflicts": port_index.conflicts()}
+
+@api_router.get("/ready")
+async def get_readiness():
+    ready = db_state["connected"]
+    body = {
+        "ready": ready,
+        "database": db_state,
+        "docker": {"healthy": docker_gateway.healthy},
+        "event_states_synced": container_states.synced,
+    }
+    return JSONResponse(status_code=200 if ready else 503, content=body)
+
+@api_router.get("/db/metrics")
+async def get_db_metrics():
+    return {
+        "pool": db_pool.stats(),
+        "slow_query_ms": MYSQL_SLOW_QUERY_MS,
+        **db_metrics.counters,
+        "acquire_wait": db_metrics.acquire_wait.summary(),
+        "statements": {name: histogram.summary() for name, histogram in sorted(db_metrics.statements.items())},
+    }
+
+DRIFT_KINDS = ("status_mismatch", "missing", "untracked", "died")
+
+RUNNING_STATUSES = ('running', 'restarting')
+
+def diff_container_states(rows, actual: Dict[str, Dict[str, Any]], now: datetime):
+    """Compare services/containers rows with Docker state.
+
+    rows are (service_id, enabled, recorded container_id, recorded status).
+    Returns the containers upserts, drift counts by kind and the enabled
+    services that died since the last pass: recorded as running but no
+    longer running. A recorded exited/removed container that is still dead
+    matches; the pass that noticed it already counted it.
+    """
+    updates, died = [], []
+    drift = dict.fromkeys(DRIFT_KINDS, 0)
+    for service_id, enabled, recorded_id, recorded_status in rows:
+        state = actual.get(service_id)
+        if state is None:
+            if recorded_status is not None and recorded_status not in ('removed', 'stopped'):
+                drift['missing'] += 1
+                updates.append((service_id, service_id, None, 'removed', now))
+        elif recorded_status is None:
+            drift['untracked'] += 1
+            updates.append((service_id, service_id, state['container_id'], state['status'],
+                            None if state['status'] == 'running' else now))
+        elif recorded_status != state['status'] or recorded_id != state['container_id']:
+            if not (recorded_status == 'stopped' and state['status'] in ('exited', 'created')):
+                drift['status_mismatch'] += 1
+                updates.append((service_id, service_id, state['container_id'], state['status'],
+                                None if state['status'] == 'running' else now))
         
+        running = state is not None and state['status'] in RUNNING_STATUSES
+        if enabled and not running and recorded_status in RUNNING_STATUSES:
+            drift['died'] += 1
+            died.append(service_id)
+    return updates, drift, died
+
+class Reconciler:
+    """Keeps the containers table in line with Docker and optionally revives dead services.
+
+    Each pass reads desired and recorded state in one query and actual state
+    in one Docker list call (or the event-fed cache), then writes every
+    correction in a single transaction. Restarts are limited by a global
+    token bucket and a per-service exponential backoff. With several
+    workers only the holder of the reconciler lock runs passes.
+    """
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.last_drift = dict.fromkeys(DRIFT_KINDS, 0)
+        self.drift_total = dict.fromkeys(DRIFT_KINDS, 0)
+        self.counters = {"passes": 0, "failures": 0, "rows_updated": 0,
+                         "restarts": 0, "restart_failures": 0, "restarts_throttled": 0}
+        self.last_run: Optional[float] = None
+        self.last_duration_ms = 0.0
+        self.tokens = RECONCILE_RESTARTS_PER_MINUTE
+        self.tokens_at = time.monotonic()
+        self.backoff: Dict[str, tuple] = {}
+        self.restarting: Dict[str, asyncio.Task] = {}
+        self.leader = DatabaseLeaderLock("orch_reconciler")
+
+    async def actual_states(self) -> Dict[str, Dict[str, Any]]:
+        if container_states.synced:
+            return {**container_states.states, **host_registry.remote_states()}
+        return {**await docker_gateway.list_container_states(), **host_registry.remote_states()}
+
+    async def reconcile(self) -> Dict[str, Any]:
+        started = time.perf_counter()
+        actual = await self.actual_states()
         async with db_pool.acquire() as conn:
             async with conn.cursor() as cursor:
                 await cursor.execute(
-                    "UPDATE containers SET status = %s, stopped_at = %s WHERE service_id = %s",
-                    ('stopped', datetime.now(), service_id)
+                    """SELECT s.id, s.enabled, c.container_id, c.status FROM services s
+                       LEFT JOIN containers c ON c.service_id = s.id"""
                 )
+                rows = await cursor.fetchall()
+                
+                updates, drift, died = diff_container_states(rows, actual, datetime.now())
+                if updates:
+                    await conn.begin()
+                    try:
+                        await cursor.executemany(
+                            """INSERT INTO containers (id, service_id, container_id, status, stopped_at)
+                               VALUES (%s, %s, %s, %s, %s) ON DUPLICATE KEY UPDATE
+                               container_id = VALUES(container_id), status = VALUES(status),
+                               stopped_at = COALESCE(VALUES(stopped_at), stopped_at)""",
+                            updates
+                        )
+                        await conn.commit()
+                    except Exception:
+                        await conn.rollback()
+                        raise
         
-        await broadcast_message({"type": "container_stopped", "service_id": service_id})
-        return {"message": "Container stopped", "service_id": service_id}
-    
-    except docker.errors.NotFound:
-        raise HTTPException(status_code=404, detail="Container not found")
-    except Exception as e:
-        logger.error(f"Error stopping container: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        enabled = {row[0] for row in rows if row[1]}
+        for service_id in list(self.backoff):
+            state = actual.get(service_id)
+            if service_id not in enabled or (state and state['status'] == 'running'):
+                self.backoff.pop(service_id)
+        if RECONCILE_RESTART:
+            # New deaths, plus earlier ones whose restart has not stuck yet
+            for service_id in dict.fromkeys([*died, *self.backoff]):
+                self.schedule_restart(service_id)
+        
+        self.last_duration_ms = (time.perf_counter() - started) * 1000
+        self.latency.observe(self.last_duration_ms)
+        self.last_run = time.time()
+        self.last_drift = drift
+        for kind, count in drift.items():
+            self.drift_total[kind] += count
+        self.counters["passes"] += 1
+        self.counters["rows_updated"] += len(updates)
+        if updates:
+            logger.info(f"Reconciled {len(updates)} container rows: {drift}")
+        return {"duration_ms": round(self.last_duration_ms, 2), "rows_updated": len(updates),
+                "drift": drift, "died": died}
 
-@api_router.post("/containers/{service_id}/restart")
-async def restart_container(service_id: str):
-    try:
-        await stop_container(service_id)
-        await asyncio.sleep(1)
-        await start_container(service_id)
-        return {"message": "Container restarted", "service_id": service_id}
-    except Exception as e:
-        logger.error(f"Error restarting container: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    def take_token(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(RECONCILE_RESTARTS_PER_MINUTE,
+                          self.tokens + (now - self.tokens_at) * RECONCILE_RESTARTS_PER_MINUTE / 60)
+        self.tokens_at = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
 
-@api_router.get("/containers/{service_id}/logs")
-async def get_container_logs(service_id: str, tail: int = 100):
-    try:
-        client = docker.from_env()
-        container = client.containers.get(f"orch_{service_id}")
-        logs = container.logs(tail=tail).decode('utf-8')
-        return {"logs": logs}
-    except docker.errors.NotFound:
-        raise HTTPException(status_code=404, detail="Container not found")
-    except Exception as e:
-        logger.error(f"Error fetching logs: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    def schedule_restart(self, service_id: str):
+        if service_id in self.restarting:
+            return
+        delay, not_before = self.backoff.get(service_id, (RECONCILE_RESTART_BACKOFF / 2, 0.0))
+        if time.monotonic() < not_before:
+            return
+        if not self.take_token():
+            self.counters["restarts_throttled"] += 1
+            return
+        delay = min(delay * 2, RECONCILE_RESTART_MAX_BACKOFF)
+        self.backoff[service_id] = (delay, time.monotonic() + delay)
+        self.restarting[service_id] = asyncio.create_task(self.restart(service_id))
 
-@api_router.get("/containers/{service_id}/stats")
-async def get_container_stats(service_id: str):
-    try:
-        client = docker.from_env()
-        container = client.containers.get(f"orch_{service_id}")
-        stats = container.stats(stream=False)
-        
-        cpu_delta = stats['cpu_stats']['cpu_usage']['total_usage'] - stats['precpu_stats']['cpu_usage']['total_usage']
-        system_delta = stats['cpu_stats']['system_cpu_usage'] - stats['precpu_stats']['system_cpu_usage']
-        cpu_percent = (cpu_delta / system_delta) * 100.0 if system_delta > 0 else 0.0
-        
-        mem_usage = stats['memory_stats']['usage']
-        mem_limit = stats['memory_stats']['limit']
-        mem_percent = (mem_usage / mem_limit) * 100.0 if mem_limit > 0 else 0.0
-        
+    async def restart(self, service_id: str):
+        try:
+            logger.warning(f"Reconciler restarting {service_id}, which died while enabled")
+            await start_container(service_id)
+            self.counters["restarts"] += 1
+        except Exception as e:
+            self.counters["restart_failures"] += 1
+            logger.error(f"Reconciler failed to restart {service_id}: {e}")
+        finally:
+            self.restarting.pop(service_id, None)
+
+    async def run(self):
+        try:
+            while True:
+                try:
+                    if await self.leader.acquire():
+                        await self.reconcile()
+                except Exception as e:
+                    self.counters["failures"] += 1
+                    logger.warning(f"Reconcile pass failed: {e}")
+                await asyncio.sleep(RECONCILE_INTERVAL)
+        finally:
+            self.leader.close()
+
+    def stats(self) -> Dict[str, Any]:
         return {
-            "cpu_percent": round(cpu_percent, 2),
-            "memory_usage_mb": round(mem_usage / (1024 * 1024), 2),
-            "memory_percent": round(mem_percent, 2)
+            "interval": RECONCILE_INTERVAL,
+            "restart_enabled": RECONCILE_RESTART,
+            "last_run": self.last_run,
+            "last_duration_ms": round(self.last_duration_ms, 2),
+            "duration": self.latency.summary(),
+            "last_drift": self.last_drift,
+            "drift_total": self.drift_total,
+            **self.counters,
+            "leader": self.leader.stats(),
+            "restarting": sorted(self.restarting),
         }
-    except docker.errors.NotFound:
-        return {"cpu_percent": 0, "memory_usage_mb": 0, "memory_percent": 0}
-    except Exception as e:
-        logger.error(f"Error fetching stats: {e}")
-        return {"cpu_percent": 0, "memory_usage_mb": 0, "memory_percent": 0}
 
-async def get_container_status(service_id: str) -> Dict[str, Any]:
+reconciler = Reconciler()
+
+@api_router.get("/reconcile")
+async def get_reconcile_stats():
+    return reconciler.stats()
+
+@api_router.post("/reconcile")
+async def run_reconcile():
     try:
-        client = docker.from_env()
-        container = client.containers.get(f"orch_{service_id}")
-        return {"status": container.status, "container_id": container.id}
-    except docker.errors.NotFound:
-        return {"status": "stopped", "container_id": None}
+        return await reconciler.reconcile()
+    except (DatabaseBusy, DatabaseUnavailable):
+        raise
     except Exception as e:
-        logger.debug(f"Docker not available or container not found: {e}")
-        return {"status": "stopped", "container_id": None}
+        logger.error(f"Error reconciling containers: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.get("/layouts", response_model=List[Layout])
-async def get_layouts():
-    async with db_pool.acquire() as conn:
-        async with conn.cursor(aiomysql.DictCursor) as cursor:
-            await cursor.execute("SELECT * FROM layouts")
-            layouts = await cursor.fetchall()
-            
-            result = []
-            for layout in layouts:
-                layout_dict = dict(layout)
-                layout_dict['layout_data'] = json.loads(layout_dict['layout_data'])
-                layout_dict['is_default'] = bool(layout_dict['is_default'])
-                result.append(layout_dict)
-            
-            return result
+@api_router.get("/docker/health")
+async def get_docker_health():
+    return docker_gateway.stats()
+
+@api_router.get("/layouts")
+async def get_layouts(request: Request):
+    body, etag = await catalog_cache.get_layouts()
+    return cached_json_response(request, body, etag)
 
 @api_router.post("/layouts", response_model=Layout)
 async def create_layout(layout: LayoutCreate):
@@ -656,29 +4637,710 @@ async def create_layout(layout: LayoutCreate):
                 (layout_id, layout.name, json.dumps(layout.layout_data), layout.is_default)
             )
     
+    await catalog_cache.changed("layouts")
     return Layout(id=layout_id, **layout.dict())
 
+class ClientConnection:
+    """A WebSocket client with its own bounded outbound queue and writer task.
+
+    Broadcasts go through the queue; stats frames go through a single
+    latest-value slot so they merge instead of piling up.
+    """
+
+    def __init__(self, websocket: WebSocket, max_queue: int, policy: str):
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.policy = policy
+        self.queue: deque = deque()
+        self.latest: Optional[str] = None
+        self.wake = asyncio.Event()
+        self.closed = False
+        self.task: Optional[asyncio.Task] = None
+        self.closer: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.dropped = 0
+        self.merged = 0
+        self.last_send_ms = 0.0
+        self.max_send_ms = 0.0
+        self.total_send_ms = 0.0
+
+    def enqueue(self, text: str) -> bool:
+        if self.closed:
+            return False
+        if len(self.queue) >= self.max_queue:
+            if self.policy == 'disconnect':
+                logger.warning("Disconnecting slow WebSocket client")
+                self.close(WS_CLOSE_TRY_AGAIN_LATER)
+                return False
+            self.queue.popleft()
+            self.dropped += 1
+            broadcaster.dropped += 1
+        self.queue.append(text)
+        self.wake.set()
+        return True
+
+    def offer_latest(self, text: str):
+        if not self.closed:
+            # A newer stats frame replaces an unsent one; nothing is lost, so it is not a drop
+            if self.latest is not None:
+                self.merged += 1
+                broadcaster.merged += 1
+            self.latest = text
+            self.wake.set()
+
+    async def writer(self):
+        try:
+            while not self.closed:
+                await self.wake.wait()
+                self.wake.clear()
+                while self.queue or self.latest is not None:
+                    if self.queue:
+                        text = self.queue.popleft()
+                    else:
+                        text, self.latest = self.latest, None
+                    started = time.perf_counter()
+                    await asyncio.wait_for(self.websocket.send_text(text), WS_SEND_TIMEOUT)
+                    elapsed = (time.perf_counter() - started) * 1000
+                    self.sent += 1
+                    self.last_send_ms = elapsed
+                    self.total_send_ms += elapsed
+                    self.max_send_ms = max(self.max_send_ms, elapsed)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.info(f"Evicting WebSocket client: {e!r}")
+            with suppress(Exception):
+                await self.websocket.close()
+        finally:
+            self.closed = True
+            broadcaster.connections.discard(self)
+
+    def close(self, code: Optional[int] = None):
+        """Stop sending; with a close code the socket itself is closed too."""
+        self.closed = True
+        self.queue.clear()
+        self.latest = None
+        broadcaster.connections.discard(self)
+        if self.task:
+            self.task.cancel()
+        if code is not None and self.closer is None:
+            self.closer = asyncio.create_task(self._close_socket(code))
+
+    async def _close_socket(self, code: int):
+        with suppress(Exception):
+            await asyncio.wait_for(self.websocket.close(code=code), WS_SEND_TIMEOUT)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": len(self.queue),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "merged": self.merged,
+            "last_send_ms": round(self.last_send_ms, 3),
+            "avg_send_ms": round(self.total_send_ms / self.sent, 3) if self.sent else 0.0,
+            "max_send_ms": round(self.max_send_ms, 3),
+        }
+
+class Broadcaster:
+    """Fans messages out to every connected client without waiting on any of them."""
+
+    def __init__(self):
+        self.connections = set()
+        self.broadcasts = 0
+        # Process-wide totals; they keep counting after the clients disconnect
+        self.dropped = 0
+        self.merged = 0
+        self.last_broadcast_ms = 0.0
+        self.latency = LatencyHistogram()
+
+    def connect(self, websocket: WebSocket) -> ClientConnection:
+        connection = ClientConnection(websocket, WS_QUEUE_SIZE, WS_SLOW_CLIENT_POLICY)
+        connection.task = asyncio.create_task(connection.writer())
+        self.connections.add(connection)
+        return connection
+
+    def publish(self, message: Dict[str, Any]):
+        started = time.perf_counter()
+        text = json.dumps(message, separators=(",", ":"), ensure_ascii=False, default=str)
+        for connection in list(self.connections):
+            connection.enqueue(text)
+        self.broadcasts += 1
+        self.last_broadcast_ms = (time.perf_counter() - started) * 1000
+        self.latency.observe(self.last_broadcast_ms)
+
+    def stats(self) -> Dict[str, Any]:
+        clients = [connection.stats() for connection in self.connections]
+        return {
+            "connections": len(clients),
+            "broadcasts": self.broadcasts,
+            "last_broadcast_ms": round(self.last_broadcast_ms, 3),
+            "queue_depth_total": sum(c['queue_depth'] for c in clients),
+            "queue_depth_max": max((c['queue_depth'] for c in clients), default=0),
+            "dropped_total": self.dropped,
+            "merged_total": self.merged,
+            "send_ms_max": max((c['max_send_ms'] for c in clients), default=0.0),
+            "slowest_clients": sorted(clients, key=lambda c: c['avg_send_ms'], reverse=True)[:10],
+        }
+
+broadcaster = Broadcaster()
+
+class EventBus:
+    """Delivers broadcasts to the clients of every worker, not just this one.
+
+    Events are wrapped in an envelope carrying a unique id and a per-origin
+    sequence number. Receivers drop ids they have already seen and events
+    older than the last one delivered for the same origin and service, so
+    each service's events reach clients once and in order.
+    """
+
+    def __init__(self):
+        self.origin = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.seq = 0
+        self.seen_ids: set = set()
+        self.seen_order: deque = deque()
+        self.last_seq: Dict[tuple, int] = {}
+        self.counters = {"published": 0, "received": 0, "duplicates": 0, "out_of_order": 0}
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def publish(self, message: Dict[str, Any]):
+        self.seq += 1
+        envelope = {"id": uuid.uuid4().hex, "origin": self.origin, "seq": self.seq, "message": message}
+        self.counters["published"] += 1
+        self.deliver(envelope)
+        await self.send(json.dumps(envelope, separators=(",", ":"), default=str).encode())
+
+    async def send(self, data: bytes):
+        pass
+
+    def receive(self, data: bytes):
+        try:
+            envelope = json.loads(data)
+        except ValueError:
+            logger.warning("Dropping malformed event bus message")
+            return
+        if envelope.get('origin') == self.origin:
+            return
+        self.counters["received"] += 1
+        self.deliver(envelope)
+
+    def deliver(self, envelope: Dict[str, Any]):
+        event_id = envelope['id']
+        if event_id in self.seen_ids:
+            self.counters["duplicates"] += 1
+            return
+        self.seen_ids.add(event_id)
+        self.seen_order.append(event_id)
+        if len(self.seen_order) > 10000:
+            self.seen_ids.discard(self.seen_order.popleft())
+
+        key = (envelope['origin'], envelope['message'].get('service_id'))
+        if envelope['seq'] <= self.last_seq.get(key, 0):
+            self.counters["out_of_order"] += 1
+            return
+        self.last_seq[key] = envelope['seq']
+        if envelope['origin'] != self.origin and envelope['message'].get('type') in CATALOG_EVENTS:
+            catalog_cache.invalidate()
+        broadcaster.publish(envelope['message'])
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": EVENT_BUS, "origin": self.origin, **self.counters}
+
+class Outbox:
+    """Events waiting for one destination, sent in order by a single task.
+
+    put() never waits, so a stalled peer cannot hold up the request that
+    published the event. When the outbox is full the oldest event is dropped.
+    """
+
+    def __init__(self, flush, counters: Dict[str, int]):
+        self.flush = flush
+        self.counters = counters
+        self.queue: deque = deque()
+        self.wake = asyncio.Event()
+        self.task = asyncio.create_task(self.run())
+
+    def put(self, data: bytes):
+        if len(self.queue) >= EVENT_BUS_OUTBOX_SIZE:
+            self.queue.popleft()
+            self.counters["dropped"] += 1
+        self.queue.append(data)
+        self.wake.set()
+
+    async def run(self):
+        while True:
+            await self.wake.wait()
+            self.wake.clear()
+            while self.queue:
+                batch = list(self.queue)
+                self.queue.clear()
+                await self.flush(batch)
+
+    def close(self):
+        self.task.cancel()
+
+class UnixSocketEventBus(EventBus):
+    """Backplane for several workers on one host.
+
+    Every worker listens on a Unix stream socket in a shared directory and
+    keeps one connection open to each peer, writing newline-delimited events.
+    Each peer has its own outbox, so one connection carries its events in
+    order. The directory is rescanned for new peers at most every
+    EVENT_BUS_PEER_SCAN seconds.
+    """
+
+    def __init__(self, directory: str):
+        super().__init__()
+        self.directory = Path(directory)
+        self.path = self.directory / f"{self.origin}.sock"
+        self.server = None
+        self.peers: Dict[Path, Outbox] = {}
+        self.writers: Dict[Path, asyncio.StreamWriter] = {}
+        self.scanned_at = 0.0
+        self.incoming: set = set()
+        self.counters.update(dropped=0)
+
+    async def start(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.server = await asyncio.start_unix_server(self.handle_peer, path=str(self.path), limit=2 ** 20)
+        logger.info(f"Event bus listening on {self.path}")
+
+    async def handle_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.incoming.add(writer)
+        try:
+            while line := await reader.readline():
+                self.receive(line)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self.incoming.discard(writer)
+            writer.close()
+
+    def scan_peers(self):
+        now = time.monotonic()
+        if now - self.scanned_at < EVENT_BUS_PEER_SCAN:
+            return
+        self.scanned_at = now
+        found = {peer for peer in self.directory.glob("*.sock") if peer != self.path}
+        for peer in set(self.peers) - found:
+            self.forget(peer)
+        for peer in found - set(self.peers):
+            self.peers[peer] = Outbox(functools.partial(self.flush_to, peer), self.counters)
+
+    async def send(self, data: bytes):
+        self.scan_peers()
+        for outbox in self.peers.values():
+            outbox.put(data)
+
+    async def flush_to(self, peer: Path, batch: List[bytes]):
+        try:
+            writer = self.writers.get(peer)
+            if writer is None or writer.is_closing():
+                _, writer = await asyncio.wait_for(asyncio.open_unix_connection(str(peer)), WS_SEND_TIMEOUT)
+                self.writers[peer] = writer
+            writer.write(b"".join(data + b"\n" for data in batch))
+            await asyncio.wait_for(writer.drain(), WS_SEND_TIMEOUT)
+        except (ConnectionRefusedError, FileNotFoundError):
+            # A worker that exited without cleaning up its socket
+            self.forget(peer)
+            with suppress(OSError):
+                peer.unlink()
+        except (OSError, asyncio.TimeoutError) as e:
+            self.counters["dropped"] += len(batch)
+            with suppress(Exception):
+                self.writers.pop(peer).close()
+            logger.warning(f"Event bus peer {peer.name} dropped: {e!r}")
+
+    def forget(self, peer: Path):
+        outbox = self.peers.pop(peer, None)
+        if outbox is not None:
+            outbox.close()
+        writer = self.writers.pop(peer, None)
+        if writer is not None:
+            writer.close()
+
+    async def close(self):
+        for peer in list(self.peers):
+            self.forget(peer)
+        for writer in list(self.incoming):
+            writer.close()
+        if self.server:
+            self.server.close()
+        with suppress(OSError):
+            self.path.unlink()
+
+class RedisEventBus(EventBus):
+    """Backplane over Redis pub/sub for workers on several hosts.
+
+    The subscription runs in the background and reconnects with backoff, so
+    an unreachable Redis never blocks startup; until it is back, events only
+    reach this worker's own clients.
+    """
+
+    def __init__(self, url: str, channel: str):
+        super().__init__()
+        self.url = url
+        self.channel = channel
+        self.redis = None
+        self.task: Optional[asyncio.Task] = None
+        self.outbox: Optional[Outbox] = None
+        self.connected = False
+        self.counters.update(connects=0, reconnects=0, unsent=0, dropped=0)
+
+    async def start(self):
+        try:
+            import redis.asyncio as aioredis
+        except ImportError:
+            raise RuntimeError("EVENT_BUS=redis requires the 'redis' package")
+        self.redis = aioredis.from_url(self.url)
+        self.outbox = Outbox(self.flush, self.counters)
+        self.task = asyncio.create_task(self.listen())
+
+    async def listen(self):
+        delay = 1.0
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                if self.counters["connects"] > 0:
+                    # Catalog changes published while we were away were missed
+                    self.counters["reconnects"] += 1
+                    catalog_cache.invalidate()
+                self.counters["connects"] += 1
+                self.connected = True
+                delay = 1.0
+                logger.info(f"Event bus subscribed to {self.channel} on {self.url}")
+                async for item in pubsub.listen():
+                    if item.get('type') == 'message':
+                        self.receive(item['data'])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Event bus lost Redis at {self.url}: {e}; retrying in {delay:.0f}s")
+            finally:
+                self.connected = False
+                with suppress(Exception):
+                    await pubsub.reset()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, EVENT_BUS_RETRY_MAX)
+
+    async def send(self, data: bytes):
+        if not self.connected:
+            # Don't wait on connection timeouts for every broadcast during an outage
+            self.counters["unsent"] += 1
+            return
+        self.outbox.put(data)
+
+    async def flush(self, batch: List[bytes]):
+        for data in batch:
+            try:
+                await self.redis.publish(self.channel, data)
+            except Exception as e:
+                self.counters["unsent"] += 1
+                logger.warning(f"Event bus publish to Redis failed: {e}")
+
+    async def close(self):
+        if self.task:
+            self.task.cancel()
+        if self.outbox:
+            self.outbox.close()
+        if self.redis:
+            await self.redis.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "connected": self.connected}
+
+def create_event_bus() -> EventBus:
+    if EVENT_BUS == 'unix':
+        return UnixSocketEventBus(EVENT_BUS_SOCKET_DIR)
+    if EVENT_BUS == 'redis':
+        return RedisEventBus(REDIS_URL, EVENT_BUS_CHANNEL)
+    return EventBus()
+
+event_bus = create_event_bus()
+
+class StatsSubscription:
+    """Pushes one batched stats frame per tick for the services a socket subscribed to.
+
+    Frames go into the connection's latest-value slot, so a client that
+    cannot keep up only ever has the newest frame pending.
+    """
+
+    def __init__(self, connection: ClientConnection):
+        self.connection = connection
+        self.service_ids: List[str] = []
+        self.interval = WS_STATS_MIN_INTERVAL
+        self.task: Optional[asyncio.Task] = None
+
+    async def subscribe(self, service_ids: List[str], interval: float):
+        self.service_ids = list(dict.fromkeys(service_ids))[:WS_STATS_MAX_SERVICES]
+        self.interval = max(float(interval), WS_STATS_MIN_INTERVAL)
+        statuses = await get_container_statuses()
+        for service_id in self.service_ids:
+            if (statuses.get(service_id) or {}).get('status') == 'running':
+                with suppress(Exception):
+                    await stats_manager.ensure(service_id)
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def cancel(self):
+        self.service_ids = []
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    async def run(self):
+        while self.service_ids:
+            started = time.monotonic()
+            frame = {
+                "type": "stats",
+                "timestamp": time.time(),
+                "stats": {service_id: format_stats(stats_manager.latest(service_id)) for service_id in self.service_ids},
+            }
+            if self.connection.closed:
+                return
+            self.connection.offer_latest(json.dumps(frame, separators=(",", ":")))
+            await asyncio.sleep(max(self.interval - (time.monotonic() - started), 0))
+
+async def reply_when_reached(connection: ClientConnection, message: Dict[str, Any]):
+    try:
+        result = await await_service_state(str(message.get('service_id')), message.get('state', 'ready'),
+                                           min(float(message.get('timeout', 30)), 300))
+    except Exception as e:
+        result = {"service_id": message.get('service_id'), "reached": False, "error": str(e)}
+    connection.enqueue(json.dumps({"type": "await_result", "request_id": message.get('request_id'), **result}, default=str))
+
+async def handle_client_message(subscription: StatsSubscription, data: str):
+    try:
+        message = json.loads(data)
+    except ValueError:
+        logger.info(f"Received: {data}")
+        return
+    if not isinstance(message, dict):
+        return
+    if message.get('type') == 'subscribe':
+        await subscription.subscribe(message.get('service_ids') or [], message.get('interval', WS_STATS_MIN_INTERVAL))
+    elif message.get('type') == 'unsubscribe':
+        subscription.cancel()
+    elif message.get('type') == 'await':
+        asyncio.create_task(reply_when_reached(subscription.connection, message))
+    else:
+        logger.info(f"Received: {data}")
+
 @api_router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
-    active_connections.append(websocket)
+    connection = broadcaster.connect(websocket)
+    subscription = StatsSubscription(connection)
     
     try:
         while True:
             data = await websocket.receive_text()
-            logger.info(f"Received: {data}")
+            await handle_client_message(subscription, data)
     except WebSocketDisconnect:
-        active_connections.remove(websocket)
         logger.info("Client disconnected")
+    finally:
+        subscription.cancel()
+        connection.close()
+
+@api_router.get("/ws/stats")
+async def get_websocket_stats():
+    return broadcaster.stats()
+
+@api_router.get("/events/bus")
+async def get_event_bus_stats():
+    return event_bus.stats()
+
+async def broadcast_message(message: Dict[str, Any], local: bool = False):
+    # State derived from this worker's own Docker subscription is seen by every
+    # worker, so it only needs to reach local clients.
+    if local:
+        broadcaster.publish(message)
+        return
+    try:
+        await event_bus.publish(message)
+    except Exception as e:
+        logger.error(f"Error publishing event: {e}")
+
+class RequestMetrics:
+    """Per-route latency and response counts, labelled by route template."""
+
+    def __init__(self):
+        self.latency: Dict[tuple, LatencyHistogram] = {}
+        self.responses: Dict[tuple, int] = {}
+        self.route_paths: Dict[Any, str] = {}
+
+    def route(self, endpoint) -> str:
+        # Templates rather than raw paths keep label cardinality bounded
+        if endpoint is None:
+            return "unmatched"
+        path = self.route_paths.get(endpoint)
+        if path is None:
+            self.route_paths = {route.endpoint: route.path for route in app.routes if hasattr(route, 'endpoint')}
+            path = self.route_paths.get(endpoint, "unmatched")
+        return path
+
+    def observe(self, scope, status: int, elapsed_ms: float):
+        key = (scope["method"], self.route(scope.get("endpoint")))
+        histogram = self.latency.get(key)
+        if histogram is None:
+            histogram = self.latency[key] = LatencyHistogram()
+        histogram.observe(elapsed_ms)
+        response_key = key + (status,)
+        self.responses[response_key] = self.responses.get(response_key, 0) + 1
+
+request_metrics = RequestMetrics()
+
+class RequestMetricsMiddleware:
+    """Plain ASGI middleware; avoids BaseHTTPMiddleware's per-request task overhead."""
 
-async def broadcast_message(message: Dict[str, Any]):
-    for connection in active_connections:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        status = 500
+        
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+        
         try:
-            await connection.send_json(message)
-        except Exception as e:
-            logger.error(f"Error broadcasting message: {e}")
+            await self.app(scope, receive, send_with_status)
+        finally:
+            request_metrics.observe(scope, status, (time.perf_counter() - started) * 1000)
+
+def prometheus_escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def prometheus_value(value) -> str:
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+def prometheus_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{prometheus_escape(value)}"' for key, value in labels.items()) + "}"
+
+def prometheus_metric(lines: List[str], name: str, kind: str, help_text: str, samples):
+    """Append one metric family; samples are (labels, value) pairs."""
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        lines.append(f"{name}{prometheus_labels(labels)} {prometheus_value(value)}")
+
+def prometheus_histogram(lines: List[str], name: str, help_text: str, series):
+    """Append a histogram family from (labels, LatencyHistogram) pairs, converted to seconds."""
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for labels, histogram in series:
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{prometheus_labels({**labels, 'le': f'{bound / 1000:g}'})} {cumulative}")
+        lines.append(f"{name}_bucket{prometheus_labels({**labels, 'le': '+Inf'})} {histogram.count}")
+        lines.append(f"{name}_sum{prometheus_labels(labels)} {prometheus_value(histogram.total / 1000)}")
+        lines.append(f"{name}_count{prometheus_labels(labels)} {histogram.count}")
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    prometheus_histogram(lines, "orchestrator_http_request_duration_seconds", "HTTP request latency by route.",
+                         [({"method": method, "route": route}, histogram)
+                          for (method, route), histogram in request_metrics.latency.items()])
+    prometheus_metric(lines, "orchestrator_http_responses_total", "counter", "HTTP responses by route and status.",
+                      [({"method": method, "route": route, "status": status}, count)
+                       for (method, route, status), count in request_metrics.responses.items()])
+    
+    prometheus_histogram(lines, "orchestrator_docker_call_duration_seconds", "Docker SDK call latency by operation.",
+                         [({"op": op}, histogram) for op, histogram in docker_gateway.latency.items()])
+    prometheus_metric(lines, "orchestrator_docker_call_failures_total", "counter", "Failed Docker SDK calls.",
+                      [({"op": op, "reason": reason}, count) for (op, reason), count in docker_gateway.failures.items()])
+    prometheus_metric(lines, "orchestrator_docker_healthy", "gauge", "Whether the Docker daemon answers pings.",
+                      [({}, int(docker_gateway.healthy))])
+    hosts = list(host_registry.hosts.values())
+    prometheus_metric(lines, "orchestrator_host_healthy", "gauge", "Whether the last refresh of a Docker host worked.",
+                      [({"host": host.id}, int(host.healthy)) for host in hosts])
+    prometheus_metric(lines, "orchestrator_host_cpu_free_ratio", "gauge", "CPU headroom per Docker host.",
+                      [({"host": host.id}, host.cpu_free) for host in hosts])
+    prometheus_metric(lines, "orchestrator_host_memory_free_bytes", "gauge", "Memory headroom per Docker host.",
+                      [({"host": host.id}, host.mem_free) for host in hosts])
+    prometheus_metric(lines, "orchestrator_host_services", "gauge", "Services placed on each Docker host.",
+                      [({"host": host.id}, len(host_registry.services_on(host.id))) for host in hosts])
+    prometheus_metric(lines, "orchestrator_admission_reserved_cpus", "gauge", "Declared CPUs reserved per host.",
+                      [({"host": host_id}, totals[0]) for host_id, totals in admission.totals.items()])
+    prometheus_metric(lines, "orchestrator_admission_reserved_memory_bytes", "gauge", "Declared memory reserved per host.",
+                      [({"host": host_id}, totals[1]) for host_id, totals in admission.totals.items()])
+    prometheus_metric(lines, "orchestrator_admission_decisions_total", "counter", "Container starts by admission outcome.",
+                      [({"outcome": outcome}, admission.counters[outcome])
+                       for outcome in ("admitted", "rejected", "queued", "queue_timeouts")])
+    
+    pool = db_pool.stats()
+    if pool is not None:
+        prometheus_metric(lines, "orchestrator_db_pool_connections", "gauge", "MySQL pool connections by state.",
+                          [({"state": "in_use"}, pool['in_use']), ({"state": "idle"}, pool['idle'])])
+        prometheus_metric(lines, "orchestrator_db_pool_max_connections", "gauge", "MySQL pool maxsize.",
+                          [({}, pool['maxsize'])])
+    prometheus_histogram(lines, "orchestrator_db_acquire_wait_seconds", "Time spent waiting for a pooled connection.",
+                         [({}, db_metrics.acquire_wait)])
+    prometheus_metric(lines, "orchestrator_db_acquire_timeouts_total", "counter", "Pool acquires that timed out.",
+                      [({}, db_metrics.counters['acquire_timeouts'])])
+    prometheus_histogram(lines, "orchestrator_db_query_duration_seconds", "MySQL statement latency.",
+                         [({"statement": name}, histogram) for name, histogram in db_metrics.statements.items()])
+    prometheus_metric(lines, "orchestrator_db_slow_queries_total", "counter", "Statements over the slow-query threshold.",
+                      [({}, db_metrics.counters['slow_queries'])])
+    
+    prometheus_metric(lines, "orchestrator_websocket_connections", "gauge", "Connected WebSocket clients.",
+                      [({}, len(broadcaster.connections))])
+    prometheus_metric(lines, "orchestrator_websocket_dropped_messages_total", "counter", "Messages dropped for slow clients.",
+                      [({}, broadcaster.dropped)])
+    prometheus_metric(lines, "orchestrator_websocket_merged_stats_total", "counter",
+                      "Unsent stats frames replaced by a newer one.", [({}, broadcaster.merged)])
+    prometheus_histogram(lines, "orchestrator_broadcast_duration_seconds", "Time to fan one message out to all clients.",
+                         [({}, broadcaster.latency)])
+    
+    samples = [(service_id, ring.latest()) for service_id, ring in list(stats_manager.rings.items())]
+    samples = [(service_id, sample) for service_id, sample in samples if sample]
+    prometheus_metric(lines, "orchestrator_container_cpu_percent", "gauge", "Container CPU usage.",
+                      [({"service": service_id}, sample['cpu_percent']) for service_id, sample in samples])
+    prometheus_metric(lines, "orchestrator_container_memory_bytes", "gauge", "Container memory usage.",
+                      [({"service": service_id}, sample['memory_usage']) for service_id, sample in samples])
+    prometheus_metric(lines, "orchestrator_container_memory_limit_bytes", "gauge", "Container memory limit.",
+                      [({"service": service_id}, sample['memory_limit']) for service_id, sample in samples])
+    prometheus_histogram(lines, "orchestrator_reconcile_duration_seconds", "Duration of a reconcile pass.",
+                         [({}, reconciler.latency)])
+    prometheus_metric(lines, "orchestrator_reconcile_drift", "gauge", "Drift found by the last reconcile pass.",
+                      [({"kind": kind}, count) for kind, count in reconciler.last_drift.items()])
+    prometheus_metric(lines, "orchestrator_reconcile_drift_total", "counter", "Drift found by all reconcile passes.",
+                      [({"kind": kind}, count) for kind, count in reconciler.drift_total.items()])
+    prometheus_metric(lines, "orchestrator_reconcile_restarts_total", "counter", "Restarts issued by the reconciler.",
+                      [({"result": "ok"}, reconciler.counters['restarts']),
+                       ({"result": "failed"}, reconciler.counters['restart_failures']),
+                       ({"result": "throttled"}, reconciler.counters['restarts_throttled'])])
+    archive = log_archive.stats()
+    prometheus_metric(lines, "orchestrator_log_archive_ingested_bytes_total", "counter", "Log bytes shipped to the archive.",
+                      [({}, archive['ingested_bytes'])])
+    prometheus_metric(lines, "orchestrator_log_archive_stored_bytes", "gauge", "Compressed bytes held in sealed segments.",
+                      [({}, archive['stored_bytes'])])
+    prometheus_metric(lines, "orchestrator_log_archive_segments", "gauge", "Sealed log segments.",
+                      [({}, archive['segments'])])
+    prometheus_metric(lines, "orchestrator_service_healthy", "gauge", "Last health probe result per service.",
+                      [({"service": service_id}, int(target.healthy))
+                       for service_id, target in health_prober.targets.items() if target.healthy is not None])
+    return "\n".join(lines) + "\n"
+
+@api_router.get("/metrics")
+async def get_metrics():
+    return Response(content=render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 app.include_router(api_router)
+app.add_api_route("/metrics", get_metrics, include_in_schema=False)
 
 app.add_middleware(
     CORSMiddleware,
@@ -686,16 +5348,44 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
+app.add_middleware(RequestMetricsMiddleware)
+
+@app.exception_handler(DatabaseBusy)
+@app.exception_handler(DatabaseUnavailable)
+async def database_busy_handler(request: Request, exc: Exception):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
 
 @app.on_event("startup")
 async def startup():
-    await init_mysql()
+    await event_bus.start()
+    # Neither MySQL nor Docker blocks startup; /api/ready reports when they are up
+    background_tasks.append(asyncio.create_task(connect_database()))
+    background_tasks.append(asyncio.create_task(docker_gateway.health_loop()))
+    background_tasks.append(asyncio.create_task(container_states.run(DockerEventSource(docker_gateway))))
+    background_tasks.append(asyncio.create_task(host_registry.run()))
+    background_tasks.append(asyncio.create_task(admission.run()))
+    background_tasks.append(asyncio.create_task(stats_manager.run()))
+    background_tasks.append(asyncio.create_task(image_manager.run()))
+    background_tasks.append(asyncio.create_task(health_prober.run()))
+    background_tasks.append(asyncio.create_task(reconciler.run()))
+    if LOG_ARCHIVE_ENABLED:
+        background_tasks.append(asyncio.create_task(log_archive.run()))
+    if METRICS_HISTORY_ENABLED:
+        background_tasks.append(asyncio.create_task(metrics_history.run()))
     logger.info("Application started")
 
 @app.on_event("shutdown")
 async def shutdown():
-    if db_pool:
-        db_pool.close()
-        await db_pool.wait_closed()
+    for task in background_tasks:
+        task.cancel()
+    db_pool.close()
+    await db_pool.wait_closed()
+    stats_manager.shutdown()
+    log_archive.shutdown()
+    metrics_history.shutdown()
+    await event_bus.close()
+    host_registry.shutdown()
+    docker_gateway.shutdown()
     logger.info("Application shutdown")
\ No newline at end of file
@@ -1,32 +1,13 @@
-import { useState, useEffect } from 'react';
-import axios from 'axios';
-import { API_URL } from '../App';
 import * as Icons from 'lucide-react';
 import { Play, Square, RotateCw, Activity } from 'lucide-react';
 import { Button } from './ui/button';
 import { Badge } from './ui/badge';
 
-const ServiceCard = ({ service, onToggle, onStart, onStop, onRestart, onClick }) => {
-  const [stats, setStats] = useState({ cpu_percent: 0, memory_usage_mb: 0, memory_percent: 0 });
-  const Icon = Icons[service.icon] || Icons.Box;
-
-  useEffect(() => {
-    if (service.status === 'running') {
-      const fetchStats = async () => {
-        try {
-          const response = await axios.get(`${API_URL}/containers/${service.id}/stats`);
-          setStats(response.data);
-        } catch (error) {
-          console.error('Error fetching stats:', error);
-        }
-      };
-
-      fetchStats();
-      const interval = setInterval(fetchStats, 10000);
+const EMPTY_STATS = { cpu_percent: 0, memory_usage_mb: 0, memory_percent: 0 };
 
-      return () => clearInterval(interval);
-    }
-  }, [service.status, service.id]);
+// Stats frames come from the Dashboard's single websocket subscription
+const ServiceCard = ({ service, stats = EMPTY_STATS, onToggle, onStart, onStop, onRestart, onClick }) => {
+  const Icon = Icons[service.icon] || Icons.Box;
 
   const getStatusColor = (status) => {
     switch (status) {
@@ -10,19 +10,26 @@ import { Play, Square, RotateCw, Activity, Terminal, Info } from 'lucide-react';
 import * as Icons from 'lucide-react';
 import { toast } from 'sonner';
 
-const ServiceDetailsModal = ({ service, onClose }) => {
+const ServiceDetailsModal = ({ service, stats: liveStats, onClose }) => {
   const [logs, setLogs] = useState('');
-  const [stats, setStats] = useState({ cpu_percent: 0, memory_usage_mb: 0, memory_percent: 0 });
+  const [polledStats, setPolledStats] = useState({ cpu_percent: 0, memory_usage_mb: 0, memory_percent: 0 });
+  const stats = liveStats || polledStats;
+  const hasLiveStats = Boolean(liveStats);
 
   useEffect(() => {
     if (service && service.status === 'running') {
       fetchLogs();
+    }
+  }, [service]);
+
+  useEffect(() => {
+    // The Dashboard subscription pushes frames for the open service; poll only without them
+    if (service && service.status === 'running' && !hasLiveStats) {
       fetchStats();
-      
       const statsInterval = setInterval(fetchStats, 5000);
       return () => clearInterval(statsInterval);
     }
-  }, [service]);
+  }, [service, hasLiveStats]);
 
   const fetchLogs = async () => {
     if (!service) return;
@@ -38,7 +45,7 @@ const ServiceDetailsModal = ({ service, onClose }) => {
     if (!service) return;
     try {
       const response = await axios.get(`${API_URL}/containers/${service.id}/stats`);
-      setStats(response.data);
+      setPolledStats(response.data);
     } catch (error) {
       console.error('Error fetching stats:', error);
     }
@@ -6,7 +6,7 @@ import { Maximize2, Minimize2, Info, ExternalLink } from 'lucide-react';
 import { Button } from './ui/button';
 import { Badge } from './ui/badge';
 
-const ServicePanel = ({ service, isMaximized, onMaximize, onViewDetails }) => {
+const ServicePanel = ({ service, stats, isMaximized, onMaximize, onViewDetails }) => {
   const [loading, setLoading] = useState(true);
   const Icon = Icons[service.icon] || Icons.Box;
   
@@ -140,9 +140,15 @@ const ServicePanel = ({ service, isMaximized, onMaximize, onViewDetails }) => {
       {/* Footer with quick info */}
       {!isMaximized && (
         <div className="p-2 border-t border-white/5 bg-black/20 flex items-center justify-between text-xs flex-shrink-0">
-          <span className="text-zinc-500">
-            {service.status === 'running' || hasIframe ? 'Active' : 'Ready to start'}
-          </span>
+          {service.status === 'running' && stats ? (
+            <span className="text-zinc-400 font-mono" data-testid={`panel-stats-${service.id}`}>
+              CPU {stats.cpu_percent.toFixed(1)}% · {stats.memory_usage_mb.toFixed(0)}MB
+            </span>
+          ) : (
+            <span className="text-zinc-500">
+              {service.status === 'running' || hasIframe ? 'Active' : 'Ready to start'}
+            </span>
+          )}
           {hasIframe && (
             <a 
               href={serviceUrl} 
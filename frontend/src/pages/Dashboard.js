@@ -19,6 +19,8 @@ const Dashboard = () => {
   const [filteredServices, setFilteredServices] = useState([]);
   const [layouts, setLayouts] = useState({});
   const [websocket, setWebsocket] = useState(null);
+  const [socketOpen, setSocketOpen] = useState(false);
+  const [stats, setStats] = useState({});
   const [showAddModal, setShowAddModal] = useState(false);
   const [selectedService, setSelectedService] = useState(null);
   const [refreshKey, setRefreshKey] = useState(0);
@@ -59,15 +61,23 @@ const Dashboard = () => {
     
     ws.onopen = () => {
       console.log('WebSocket connected');
+      setSocketOpen(true);
       toast.success('Connected to orchestration server');
     };
     
     ws.onmessage = (event) => {
       const data = JSON.parse(event.data);
-      console.log('WebSocket message:', data);
       
-      if (data.type === 'service_updated' || data.type === 'container_started' || data.type === 'container_stopped') {
+      if (data.type === 'stats') {
+        setStats(prev => ({ ...prev, ...data.stats }));
+      } else if (data.type === 'service_updated' || data.type === 'container_started' || data.type === 'container_stopped') {
         fetchServices();
+      } else if (data.type === 'container_state') {
+        setServices(prev => prev.map(s => (
+          s.id === data.service_id
+            ? { ...s, status: data.state.status, container_id: data.state.container_id }
+            : s
+        )));
       }
     };
     
@@ -77,6 +87,7 @@ const Dashboard = () => {
     
     ws.onclose = () => {
       console.log('WebSocket disconnected');
+      setSocketOpen(false);
     };
     
     setWebsocket(ws);
@@ -107,6 +118,26 @@ const Dashboard = () => {
     setFilteredServices(filtered);
   }, [services, searchQuery, categoryFilter]);
 
+  const categories = ['all', ...new Set(services.map(s => s.category))];
+  const displayServices = maximizedPanel 
+    ? filteredServices.filter(s => s.id === maximizedPanel)
+    : filteredServices;
+
+  // One subscription covers every visible running panel plus the open details modal
+  const subscribedIds = [...new Set([
+    ...displayServices.filter(s => s.status === 'running').map(s => s.id),
+    ...(selectedService && selectedService.status === 'running' ? [selectedService.id] : []),
+  ])].sort().join(',');
+
+  useEffect(() => {
+    if (!websocket || !socketOpen) return;
+    if (subscribedIds) {
+      websocket.send(JSON.stringify({ type: 'subscribe', service_ids: subscribedIds.split(','), interval: 2 }));
+    } else {
+      websocket.send(JSON.stringify({ type: 'unsubscribe' }));
+    }
+  }, [websocket, socketOpen, subscribedIds]);
+
   const generateLayout = () => {
     if (maximizedPanel) {
       return [{
@@ -164,11 +195,6 @@ const Dashboard = () => {
     setMaximizedPanel(maximizedPanel === serviceId ? null : serviceId);
   };
 
-  const categories = ['all', ...new Set(services.map(s => s.category))];
-  const displayServices = maximizedPanel 
-    ? filteredServices.filter(s => s.id === maximizedPanel)
-    : filteredServices;
-
   return (
     <div className="min-h-screen relative" data-testid="dashboard-container">
       <Sidebar 
@@ -293,6 +319,7 @@ const Dashboard = () => {
               <div key={service.id} data-testid={`service-panel-${service.id}`}>
                 <ServicePanel
                   service={service}
+                  stats={stats[service.id]}
                   isMaximized={maximizedPanel === service.id}
                   onMaximize={() => handleMaximizePanel(service.id)}
                   onViewDetails={() => setSelectedService(service)}
@@ -314,6 +341,7 @@ const Dashboard = () => {
 
       <ServiceDetailsModal
         service={selectedService}
+        stats={selectedService ? stats[selectedService.id] : undefined}
         onClose={() => setSelectedService(null)}
       />
     </div>
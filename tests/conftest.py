@@ -0,0 +1,321 @@
+import asyncio
+import collections
+import json
+import queue
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+
+GiB = 1024 ** 3
+
+
+class FakeContainer:
+    def __init__(self, daemon, name, image, ports, labels=None):
+        self.daemon = daemon
+        self.name = name
+        self.image = image
+        self.ports = ports or {}
+        self.labels = labels or {}
+        self.id = f"{daemon.name}-{name}"
+        self.status = "running"
+
+    def start(self):
+        self.status = "running"
+
+    def stop(self, timeout=None):
+        # Blocks the calling thread like a real stop waiting for the process to exit
+        time.sleep(self.daemon.stop_delay)
+        self.status = "exited"
+        self.daemon.stops.append((self.name, timeout))
+
+    def restart(self, timeout=None):
+        self.status = "running"
+
+    def remove(self, force=False):
+        self.daemon.containers_.pop(self.name, None)
+
+    def reload(self):
+        pass
+
+    def logs(self, tail=100):
+        return f"logs from {self.daemon.name}\n".encode()
+
+
+class FakeContainers:
+    def __init__(self, daemon):
+        self.daemon = daemon
+
+    def get(self, name):
+        self.daemon.calls["get"] += 1
+        if name not in self.daemon.containers_:
+            raise server.docker.errors.NotFound(name)
+        return self.daemon.containers_[name]
+
+    def run(self, image, detach, labels, name, ports, **kwargs):
+        container = FakeContainer(self.daemon, name, image, ports, labels)
+        self.daemon.containers_[name] = container
+        self.daemon.runs.append((name, kwargs))
+        return container
+
+
+class FakeAPI:
+    def __init__(self, daemon):
+        self.daemon = daemon
+
+    def containers(self, all=False, filters=None):
+        self.daemon.calls["list"] += 1
+        time.sleep(self.daemon.list_delay)
+        return [{"Names": ["/" + c.name], "State": c.status, "Id": c.id,
+                 "Ports": [{"PublicPort": int(p)} for p in c.ports.values()]}
+                for c in list(self.daemon.containers_.values())] + self.daemon.foreign
+
+    def images(self):
+        return [{"RepoTags": [tag]} for tag in self.daemon.tags]
+
+    def pull(self, image, tag, stream, decode):
+        self.daemon.tags.add(f"{image}:{tag}")
+        self.daemon.pulls.append(image)
+        return iter([{"status": "done"}])
+
+    def inspect_container(self, name):
+        container = self.daemon.containers_[name]
+        return {"Id": container.id, "State": {"Status": container.status}}
+
+    def stats(self, name, stream=True, decode=True):
+        # Streams the canned documents, then holds the connection open until released
+        self.daemon.calls["stats"] += 1
+        yield from self.daemon.stats_docs
+        self.daemon.stats_hold.wait()
+
+    def inspect_image(self, ref):
+        if ref not in self.daemon.tags:
+            raise server.docker.errors.ImageNotFound(ref)
+        return {"RepoDigests": self.daemon.digests.get(ref, [])}
+
+
+class FakeEventStream:
+    """Blocking iterator like the one docker-py's events() returns."""
+
+    def __init__(self):
+        self.events = queue.Queue()
+        self.closed = False
+
+    def __iter__(self):
+        while True:
+            event = self.events.get()
+            if event is None:
+                return
+            yield event
+
+    def push(self, event):
+        self.events.put(event)
+
+    def close(self):
+        self.closed = True
+        self.events.put(None)
+
+
+class FakeDocker:
+    """Stands in for docker.DockerClient; calls block the worker thread like the real client."""
+
+    def __init__(self, name="local", ncpu=4, mem=8 * GiB, tags=(), foreign_ports=(), stop_delay=0.0, list_delay=0.0):
+        self.name = name
+        self.ncpu = ncpu
+        self.mem = mem
+        self.tags = set(tags)
+        self.stop_delay = stop_delay
+        self.list_delay = list_delay
+        self.containers_ = {}
+        self.runs = []
+        self.pulls = []
+        self.stops = []
+        self.calls = collections.Counter()
+        self.event_streams = []
+        self.stats_docs = []
+        self.digests = {}
+        self.stats_hold = threading.Event()
+        self.stats_hold.set()
+        self.foreign = [{"Names": ["/other"], "State": "running", "Id": "other",
+                         "Ports": [{"PublicPort": port} for port in foreign_ports]}] if foreign_ports else []
+        self.api = FakeAPI(self)
+        self.containers = FakeContainers(self)
+
+    def add(self, service_id, ports=None, status="running"):
+        container = FakeContainer(self, f"orch_{service_id}", "img:1", ports)
+        container.status = status
+        self.containers_[container.name] = container
+        return container
+
+    def events(self, decode=True, filters=None):
+        stream = FakeEventStream()
+        self.event_streams.append(stream)
+        return stream
+
+    def info(self):
+        return {"NCPU": self.ncpu, "MemTotal": self.mem}
+
+    def ping(self):
+        return True
+
+    def close(self):
+        pass
+
+
+class FakeCursor:
+    def __init__(self, db, dict_rows):
+        self.db = db
+        self.dict_rows = dict_rows
+        self.rows = []
+        self.rowcount = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def execute(self, query, args=None):
+        if self.db.query_delay:
+            await asyncio.sleep(self.db.query_delay)
+        query = " ".join(query.split())
+        self.db.executed.append((query, args))
+        rows = self.db.respond(query, args)
+        self.rows = [row if self.dict_rows else tuple(row.values()) for row in rows]
+        self.rowcount = len(self.rows) if query.startswith("SELECT") else 1
+        return self.rowcount
+
+    async def executemany(self, query, args):
+        for row in args:
+            await self.execute(query, row)
+
+    async def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    async def fetchall(self):
+        return list(self.rows)
+
+    async def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self, *cursors):
+        return FakeCursor(self.db, bool(cursors))
+
+    async def begin(self):
+        self.db.executed.append(("BEGIN", None))
+
+    async def commit(self):
+        self.db.executed.append(("COMMIT", None))
+
+    async def rollback(self):
+        self.db.executed.append(("ROLLBACK", None))
+
+
+class FakeDatabase:
+    """An aiomysql pool look-alike answering the services queries from memory."""
+
+    def __init__(self, services=(), maxsize=10, query_delay=0.0):
+        self.services = {svc["id"]: svc for svc in services}
+        self.results = {}
+        self.executed = []
+        self.query_delay = query_delay
+        self.minsize = 1
+        self.maxsize = maxsize
+        self.size = maxsize
+        self.free = asyncio.Queue()
+        for _ in range(maxsize):
+            self.free.put_nowait(FakeConnection(self))
+
+    @property
+    def freesize(self):
+        return self.free.qsize()
+
+    def respond(self, query, args):
+        for prefix, rows in self.results.items():
+            if query.startswith(prefix):
+                return rows(args) if callable(rows) else rows
+        if query.startswith("SELECT id FROM services WHERE id IN"):
+            return [{"id": service_id} for service_id in args if service_id in self.services]
+        if query.startswith("SELECT * FROM services WHERE id = %s"):
+            service = self.services.get(args[0])
+            return [service] if service else []
+        if query.startswith("SELECT * FROM services"):
+            return list(self.services.values())
+        return []
+
+    def statements(self, prefix):
+        return [(query, args) for query, args in self.executed if query.startswith(prefix)]
+
+    async def acquire(self):
+        return await self.free.get()
+
+    def release(self, conn):
+        self.free.put_nowait(conn)
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+
+def service_row(service_id, ports=(), image="img", tag="1", health_check=None, resources=None, **fields):
+    return {"id": service_id, "name": service_id, "category": "test", "image": image, "tag": tag,
+            "description": "", "ports": json.dumps(list(ports)), "env_vars": None, "volumes": None,
+            "health_check": health_check, "resources": json.dumps(resources) if resources else None,
+            "enabled": True, "icon": None, **fields}
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def fake_docker(monkeypatch):
+    daemon = FakeDocker()
+    gateway = server.DockerGateway(server.DOCKER_MAX_WORKERS, server.DOCKER_LIFECYCLE_CONCURRENCY,
+                                   server.DOCKER_POOL_SIZE)
+    gateway.docker_client = daemon
+    gateway.stream_docker_client = daemon
+    gateway.healthy = True
+    monkeypatch.setattr(server, "docker_gateway", gateway)
+    monkeypatch.setattr(server, "image_manager", server.ImageManager(gateway, server.IMAGE_PULL_CONCURRENCY))
+    registry = server.HostRegistry()
+    monkeypatch.setattr(server, "host_registry", registry)
+    monkeypatch.setattr(server, "container_states", server.ContainerStateCache())
+    monkeypatch.setattr(server, "admission", server.AdmissionController())
+    monkeypatch.setattr(server, "port_index", server.PortIndex())
+    yield daemon
+    gateway.shutdown()
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    db = FakeDatabase()
+    monkeypatch.setattr(server, "db_pool", server.InstrumentedPool(db, server.MYSQL_ACQUIRE_TIMEOUT))
+    monkeypatch.setattr(server, "catalog_cache", server.CatalogCache())
+    return db
+
+
+@pytest.fixture
+def broadcasts(monkeypatch):
+    sent = []
+
+    async def broadcast_message(message, local=False):
+        sent.append(message)
+
+    monkeypatch.setattr(server, "broadcast_message", broadcast_message)
+    return sent
@@ -0,0 +1,125 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+import server
+from tests.conftest import service_row
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def local(fake_docker, fake_db, broadcasts):
+    # A 4-CPU, 8 GiB local daemon with known capacity
+    await server.host_registry.refresh()
+    return fake_docker
+
+
+async def start(service_id):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test") as http:
+        return await http.post(f"/api/containers/{service_id}/start")
+
+
+async def stop(service_id):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test") as http:
+        return await http.post(f"/api/containers/{service_id}/stop")
+
+
+async def test_start_beyond_capacity_is_rejected(local, fake_db):
+    fake_db.services["big"] = service_row("big", resources={"cpus": 3})
+    fake_db.services["more"] = service_row("more", resources={"cpus": 2})
+    assert (await start("big")).status_code == 200
+    response = await start("more")
+    assert response.status_code == 503
+    assert "3 of 4 CPUs" in response.json()["detail"]
+    assert response.headers["Retry-After"]
+    assert server.admission.stats()["rejected"] == 1
+
+
+async def test_queued_start_waits_for_a_stop(local, fake_db, monkeypatch):
+    monkeypatch.setattr(server, "ADMISSION_POLICY", "queue")
+    fake_db.services["big"] = service_row("big", resources={"cpus": 3})
+    fake_db.services["more"] = service_row("more", resources={"cpus": 2})
+    fake_db.services["small"] = service_row("small", resources={"memory_mb": 64})
+    assert (await start("big")).status_code == 200
+
+    queued = asyncio.create_task(start("more"))
+    await asyncio.sleep(0.05)
+    assert not queued.done() and server.admission.waiting == 1
+    # A start that fits is not held up behind the queued one
+    assert (await asyncio.wait_for(start("small"), 2)).status_code == 200
+
+    assert (await stop("big")).status_code == 200
+    response = await asyncio.wait_for(queued, 2)
+    assert response.status_code == 200
+    assert set(server.admission.reservations) == {"more", "small"}
+
+
+async def test_reservation_survives_a_sync_before_the_state_cache_catches_up(local, fake_db, monkeypatch):
+    monkeypatch.setattr(server, "ADMISSION_SYNC_INTERVAL", 0.05)
+    fake_db.services["web"] = service_row("web", resources={"cpus": 2})
+    server.container_states.synced = True
+    assert (await start("web")).status_code == 200
+
+    # The start event has not reached the cache yet
+    await server.admission.sync()
+    assert "web" in server.admission.reservations
+
+    server.container_states.states["web"] = {"service_id": "web", "status": "running", "container_id": "id-web"}
+    await server.admission.sync()
+    assert "web" in server.admission.reservations and not server.admission.starting
+
+    # A crash outside the API frees the capacity on the next pass
+    server.container_states.states["web"]["status"] = "exited"
+    await server.admission.sync()
+    assert "web" not in server.admission.reservations
+
+
+async def test_start_that_never_shows_up_running_is_dropped(local, fake_db, monkeypatch):
+    monkeypatch.setattr(server, "ADMISSION_SYNC_INTERVAL", 0.05)
+    fake_db.services["web"] = service_row("web", resources={"cpus": 2})
+    server.container_states.synced = True
+    assert (await start("web")).status_code == 200
+    await asyncio.sleep(0.06)
+    await server.admission.sync()
+    assert "web" not in server.admission.reservations and not server.admission.starting
+
+
+async def test_concurrent_starts_on_one_port(local, fake_db):
+    fake_db.services["web"] = service_row("web", ports=["8080:80"])
+    fake_db.services["api"] = service_row("api", ports=["8080:80"])
+    run = local.containers.run
+
+    def slow_run(*args, **kwargs):
+        time.sleep(0.1)
+        return run(*args, **kwargs)
+
+    local.containers.run = slow_run
+    responses = await asyncio.gather(start("web"), start("api"))
+    assert sorted(response.status_code for response in responses) == [200, 409]
+    assert len(local.runs) == 1
+
+
+async def test_port_index_reports_conflicts(local, fake_db):
+    fake_db.services["web"] = service_row("web", ports=["8080:80"])
+    fake_db.services["api"] = service_row("api", ports=["8080:80", "9000:9000"])
+    await server.port_index.refresh()
+    assert server.port_index.conflicts() == {"8080": ["api", "web"]}
+    assert server.port_index.claims["9000"] == ["api"]
+
+
+async def test_seed_limits_only_fresh_rows(fake_db, monkeypatch):
+    monkeypatch.setattr(server, "seeded_services", set())
+    monkeypatch.setattr(server.os, "cpu_count", lambda: 1)
+    # An existing install already has code-server; keycloak and nextcloud are new
+    fake_db.services["code-server"] = service_row("code-server")
+    conn = await fake_db.acquire()
+    async with conn.cursor() as cursor:
+        await server.seed_services(cursor)
+        await server.seed_service_resources(cursor)
+    updates = {args[1]: json.loads(args[0]) for _, args in fake_db.statements("UPDATE services SET resources")}
+    assert set(updates) == {"nextcloud", "keycloak"}
+    assert updates["nextcloud"]["cpus"] == 1.0 and updates["nextcloud"]["memory_mb"] == 1024
@@ -0,0 +1,64 @@
+import json
+
+import httpx
+import pytest
+
+import server
+from tests.conftest import service_row
+
+pytestmark = pytest.mark.anyio
+
+
+def client():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test")
+
+
+async def test_load_racing_a_write_is_not_kept(fake_db):
+    cache = server.catalog_cache
+    fake_db.services["web"] = service_row("web", name="before")
+
+    def write_during_load(args):
+        # Another request writes and invalidates while this SELECT is in flight
+        rows = [dict(row) for row in fake_db.services.values()]
+        fake_db.services["web"] = service_row("web", name="after")
+        cache.invalidate()
+        return rows
+
+    fake_db.results["SELECT * FROM services"] = write_during_load
+    assert [svc["name"] for svc in await cache.get_services()] == ["before"]
+    assert cache.services is None
+    await cache.get_version()
+    assert cache.version is None
+
+    del fake_db.results["SELECT * FROM services"]
+    assert [svc["name"] for svc in await cache.get_services()] == ["after"]
+    assert cache.services is not None
+
+
+async def test_listing_reuses_the_serialized_catalog(fake_docker, fake_db, broadcasts):
+    fake_db.services["db"] = service_row("db", ["5432:5432"])
+    fake_db.services["web"] = service_row("web", ["8080:80"])
+    fake_docker.add("web")
+
+    async with client() as http:
+        first = await http.get("/api/services")
+        second = await http.get("/api/services")
+        unchanged = await http.get("/api/services", headers={"If-None-Match": first.headers["etag"]})
+        fake_docker.add("db")
+        changed = await http.get("/api/services", headers={"If-None-Match": first.headers["etag"]})
+        running = await http.get("/api/services", params={"status": "running"})
+
+    assert len(fake_db.statements("SELECT * FROM services")) == 1
+    expected = [{**server.parse_service_row(fake_db.services[sid]), "status": status,
+                 "container_id": container_id, "health": None}
+                for sid, status, container_id in (("db", "stopped", None), ("web", "running", "local-orch_web"))]
+    assert first.content == json.dumps(expected, separators=(",", ":"), default=str).encode()
+    assert second.headers["etag"] == first.headers["etag"]
+    assert unchanged.status_code == 304
+    assert changed.status_code == 200 and changed.headers["etag"] != first.headers["etag"]
+    assert [svc["id"] for svc in running.json()] == ["db", "web"]
+
+    server.catalog_cache.invalidate()
+    async with client() as http:
+        await http.get("/api/services")
+    assert len(fake_db.statements("SELECT * FROM services")) == 2
@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+def event(action, service_id, when=1700000000, **attributes):
+    return {"Type": "container", "Action": action, "time": when,
+            "Actor": {"ID": f"id-{service_id}", "Attributes": {"name": f"orch_{service_id}", **attributes}}}
+
+
+async def until(predicate, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "condition not reached"
+        await asyncio.sleep(0.005)
+
+
+async def test_queue_source_snapshot_then_events(broadcasts):
+    cache = server.ContainerStateCache()
+    source = server.QueueEventSource({"web": {"status": "running", "container_id": "id-web"}})
+    task = asyncio.create_task(cache.run(source))
+    try:
+        await until(lambda: cache.synced)
+        assert cache.get("web")["status"] == "running"
+
+        source.push(event("die", "web", exitCode="137"))
+        source.push(event("start", "db"))
+        source.push({"Type": "container", "Action": "start", "Actor": {"Attributes": {"name": "unrelated"}}})
+        await until(lambda: cache.get("db")["status"] == "running")
+        assert cache.get("web")["status"] == "exited"
+        assert cache.get("web")["exit_code"] == 137
+        assert "unrelated" not in cache.states
+
+        source.push(event("destroy", "web"))
+        await until(lambda: "web" not in cache.states)
+        assert cache.get("web")["status"] == "stopped"
+
+        diffs = [m for m in broadcasts if m["type"] == "container_state"]
+        assert [(m["service_id"], m["changes"].get("status")) for m in diffs] == [
+            ("web", "running"), ("web", "exited"), ("db", "running"), ("web", "stopped")]
+
+        source.disconnect()
+        await until(lambda: not cache.synced)
+    finally:
+        task.cancel()
+
+
+async def test_failed_snapshot_closes_event_stream(broadcasts):
+    class FailingSource(server.QueueEventSource):
+        closed = 0
+
+        async def snapshot(self):
+            raise RuntimeError("daemon went away")
+
+        async def subscribe(self):
+            events = await super().subscribe()
+            source = self
+
+            class Events:
+                def __aiter__(self):
+                    return events
+
+                async def aclose(self):
+                    source.closed += 1
+                    await events.aclose()
+
+            return Events()
+
+    cache = server.ContainerStateCache()
+    source = FailingSource()
+    task = asyncio.create_task(cache.run(source))
+    try:
+        await until(lambda: source.closed == 1)
+        assert not cache.synced
+    finally:
+        task.cancel()
+
+
+async def test_docker_source_closes_stream_when_snapshot_fails(fake_docker, broadcasts, monkeypatch):
+    def fail(*args, **kwargs):
+        raise server.docker.errors.APIError("list failed")
+
+    monkeypatch.setattr(fake_docker.api, "containers", fail)
+    cache = server.ContainerStateCache()
+    task = asyncio.create_task(cache.run(server.DockerEventSource(server.docker_gateway)))
+    try:
+        await until(lambda: fake_docker.event_streams and fake_docker.event_streams[0].closed)
+    finally:
+        task.cancel()
+
+
+async def test_docker_source_streams_events(fake_docker, broadcasts):
+    fake_docker.add("web")
+    cache = server.ContainerStateCache()
+    task = asyncio.create_task(cache.run(server.DockerEventSource(server.docker_gateway)))
+    try:
+        await until(lambda: cache.synced)
+        assert cache.get("web")["status"] == "running"
+        fake_docker.event_streams[0].push(event("die", "web", exitCode="0"))
+        await until(lambda: cache.get("web")["status"] == "exited")
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    assert fake_docker.event_streams[0].closed
+
+
+async def test_health_resets_when_the_container_stops_or_restarts(broadcasts):
+    cache = server.ContainerStateCache()
+    await cache.apply_event(event("start", "web"))
+    await cache.apply_event(event("health_status: healthy", "web"))
+    assert cache.get("web")["health"] == "healthy"
+
+    await cache.apply_event(event("die", "web", exitCode="1"))
+    assert cache.get("web")["health"] == "starting"
+    await cache.apply_event(event("start", "web"))
+    assert cache.get("web")["health"] == "starting"
+    await cache.apply_event(event("health_status: healthy", "web"))
+    await cache.apply_event(event("restart", "web"))
+    assert cache.get("web")["health"] == "starting"
+
+    # Without a HEALTHCHECK there is nothing to reset
+    await cache.apply_event(event("start", "db"))
+    await cache.apply_event(event("die", "db", exitCode="0"))
+    assert cache.get("db")["health"] is None
+
+    await cache.apply_event(event("create", "web"))
+    assert cache.get("web")["health"] is None
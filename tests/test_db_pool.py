@@ -0,0 +1,108 @@
+import asyncio
+import statistics
+import time
+
+import httpx
+import pytest
+
+import server
+from tests.conftest import FakeDatabase, service_row
+
+pytestmark = pytest.mark.anyio
+
+
+def client():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test")
+
+
+class SlowPool:
+    """Hands out a connection after `delay`, even when the waiter was cancelled meanwhile."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.released = []
+
+    async def acquire(self):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            # The handshake finished anyway; the connection is ours to give back
+            await asyncio.sleep(0)
+        return object()
+
+    def release(self, conn):
+        self.released.append(conn)
+
+
+async def test_connection_arriving_after_the_timeout_is_released():
+    pool = SlowPool(0.2)
+    db = server.InstrumentedPool(pool, 0.05)
+    with pytest.raises(server.DatabaseBusy):
+        async with db.acquire():
+            pass
+    await asyncio.sleep(0.05)
+    assert len(pool.released) == 1
+
+
+async def test_cancelled_waiter_does_not_leak_its_connection():
+    pool = SlowPool(0.2)
+    db = server.InstrumentedPool(pool, 5)
+
+    async def use():
+        async with db.acquire():
+            pass
+
+    task = asyncio.create_task(use())
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    await asyncio.sleep(0.01)
+    assert len(pool.released) == 1
+
+
+async def test_pool_exhaustion_sheds_load_with_503(monkeypatch, fake_docker):
+    """200 concurrent page reads on a 5-connection pool with 50 ms queries."""
+    db = FakeDatabase([service_row(f"svc{i}", category="tool") for i in range(20)], maxsize=5, query_delay=0.05)
+    monkeypatch.setattr(server, "db_pool", server.InstrumentedPool(db, 0.25))
+    timeouts_before = server.db_metrics.counters["acquire_timeouts"]
+
+    async def page(http):
+        started = time.perf_counter()
+        response = await http.get("/api/services", params={"category": "tool", "fields": "id"})
+        return response, time.perf_counter() - started
+
+    started = time.perf_counter()
+    async with client() as http:
+        results = await asyncio.gather(*(page(http) for _ in range(200)))
+    elapsed = time.perf_counter() - started
+
+    codes = [response.status_code for response, _ in results]
+    served = sorted(latency for response, latency in results if response.status_code == 200)
+    shed = [response for response, _ in results if response.status_code == 503]
+    assert set(codes) <= {200, 503}
+    assert served and shed
+    assert all(response.headers["retry-after"] == "1" for response in shed)
+    assert server.db_metrics.counters["acquire_timeouts"] - timeouts_before == len(shed)
+    # Rejections come after the acquire timeout, not after the whole queue drains
+    assert elapsed < 1.5, f"{len(served)} served, {len(shed)} shed in {elapsed * 1000:.0f}ms"
+    assert statistics.median(served) < 0.3
+    # Every connection is back in the pool afterwards
+    await asyncio.sleep(0.05)
+    assert db.freesize == db.maxsize
+
+
+@pytest.mark.parametrize("method, path, body", [
+    ("POST", "/api/containers/web/start", None),
+    ("POST", "/api/containers/web/stop", None),
+    ("POST", "/api/containers/web/restart", None),
+    ("POST", "/api/hosts", {"id": "remote", "docker_url": "tcp://10.0.0.2:2375", "address": "10.0.0.2"}),
+])
+async def test_container_routes_report_a_missing_database_as_503(monkeypatch, fake_docker, broadcasts,
+                                                                 method, path, body):
+    fake_docker.add("web")
+    monkeypatch.setattr(server, "db_pool", server.InstrumentedPool(None, 1))
+    async with client() as http:
+        response = await http.request(method, path, json=body)
+    assert response.status_code == 503
+    assert response.json()["detail"] == "Database is not connected yet"
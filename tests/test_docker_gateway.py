@@ -0,0 +1,95 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+
+import server
+from tests.conftest import FakeDocker, service_row
+
+pytestmark = pytest.mark.anyio
+
+
+def client():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test")
+
+
+async def test_stop_passes_docker_timeout_through(fake_docker, fake_db, broadcasts):
+    fake_docker.add("web")
+    async with client() as http:
+        response = await http.post("/api/containers/web/stop", params={"timeout": 3})
+    assert response.status_code == 200
+    assert fake_docker.stops == [("orch_web", 3)]
+
+
+async def test_services_p99_under_concurrent_stops(fake_docker, fake_db, broadcasts):
+    """Twenty stops that each hold a Docker thread for half a second must not stall the API."""
+    fake_docker.stop_delay = 0.5
+    for i in range(20):
+        fake_db.services[f"svc{i}"] = service_row(f"svc{i}", [f"{9000 + i}:80"])
+        fake_docker.add(f"svc{i}")
+
+    async with client() as http:
+        stops = asyncio.gather(*(http.post(f"/api/containers/svc{i}/stop") for i in range(20)))
+        stops = asyncio.ensure_future(stops)
+        latencies = []
+        while not stops.done():
+            started = time.perf_counter()
+            response = await http.get("/api/services")
+            latencies.append(time.perf_counter() - started)
+            assert response.status_code == 200
+        results = await stops
+
+    assert [r.status_code for r in results] == [200] * 20
+    assert len(fake_docker.stops) == 20
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    assert len(latencies) >= 20
+    assert p99 < 0.1, f"p99 {p99 * 1000:.1f}ms over {len(latencies)} requests"
+
+
+async def test_client_is_reused_and_streams_get_their_own(monkeypatch):
+    clients = []
+
+    def from_env(max_pool_size):
+        clients.append((FakeDocker(), max_pool_size))
+        return clients[-1][0]
+
+    monkeypatch.setattr(server.docker, "from_env", from_env)
+    gateway = server.DockerGateway(4, 2, server.DOCKER_POOL_SIZE)
+    try:
+        first = await gateway.client()
+        for _ in range(50):
+            assert await gateway.client() is first
+        stream_client = await gateway.stream_client()
+        assert stream_client is not first
+        assert await gateway.stream_client() is stream_client
+        assert [size for _, size in clients] == [server.DOCKER_POOL_SIZE, server.DOCKER_STREAM_LIMIT]
+        assert gateway.stats()["connects"] == 1
+        assert gateway.stats()["reuses"] == 50
+
+        gateway.invalidate()
+        assert await gateway.client() is not first
+        assert gateway.stats()["reconnects"] == 1
+    finally:
+        gateway.shutdown()
+
+
+def test_stream_threads_are_bounded(monkeypatch):
+    monkeypatch.setattr(server, "DOCKER_STREAM_LIMIT", 3)
+    gateway = server.DockerGateway(4, 2, server.DOCKER_POOL_SIZE)
+    release = threading.Event()
+    try:
+        threads = [gateway.start_stream(f"stream-{i}", release.wait) for i in range(5)]
+        assert sum(thread is not None for thread in threads) == 3
+        assert gateway.stats()["streams"] == 3
+        assert gateway.stats()["streams_rejected"] == 2
+
+        release.set()
+        for thread in filter(None, threads):
+            thread.join(1)
+        assert gateway.stats()["streams"] == 0
+        assert gateway.start_stream("again", lambda: None) is not None
+    finally:
+        gateway.shutdown()
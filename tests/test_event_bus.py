@@ -0,0 +1,206 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import types
+from pathlib import Path
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+BACKEND = Path(__file__).resolve().parent.parent / "backend"
+
+
+class FakeBroker:
+    def __init__(self):
+        self.down = False
+        self.subscribers = []
+
+    def drop_connections(self):
+        for queue in self.subscribers:
+            queue.put_nowait(ConnectionError("Connection reset by peer"))
+        self.subscribers.clear()
+
+
+class FakePubSub:
+    def __init__(self, broker):
+        self.broker = broker
+        self.queue = asyncio.Queue()
+
+    async def subscribe(self, channel):
+        if self.broker.down:
+            raise ConnectionError("Connection refused")
+        self.broker.subscribers.append(self.queue)
+
+    async def listen(self):
+        while True:
+            item = await self.queue.get()
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    async def reset(self):
+        if self.queue in self.broker.subscribers:
+            self.broker.subscribers.remove(self.queue)
+
+
+class FakeRedis:
+    def __init__(self, broker):
+        self.broker = broker
+
+    def pubsub(self):
+        return FakePubSub(self.broker)
+
+    async def publish(self, channel, data):
+        if self.broker.down:
+            raise ConnectionError("Connection refused")
+        for queue in self.broker.subscribers:
+            queue.put_nowait({"type": "message", "data": data})
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    broker = FakeBroker()
+    module = types.ModuleType("redis.asyncio")
+    module.from_url = lambda url: FakeRedis(broker)
+    package = types.ModuleType("redis")
+    package.asyncio = module
+    monkeypatch.setitem(sys.modules, "redis", package)
+    monkeypatch.setitem(sys.modules, "redis.asyncio", module)
+    return broker
+
+
+async def until(predicate, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "condition not reached"
+        await asyncio.sleep(0.01)
+
+
+async def test_redis_bus_starts_without_redis_and_reconnects(fake_redis, monkeypatch):
+    delivered = []
+    monkeypatch.setattr(server.broadcaster, "publish", delivered.append)
+    fake_redis.down = True
+    bus = server.RedisEventBus("redis://unreachable:6379/0", "events")
+    peer = server.RedisEventBus("redis://unreachable:6379/0", "events")
+    await bus.start()
+    try:
+        assert not bus.connected
+        # Local clients still get events while Redis is away
+        await bus.publish({"type": "container_started", "service_id": "web"})
+        assert [m["service_id"] for m in delivered] == ["web"]
+        assert bus.stats()["unsent"] == 1
+
+        fake_redis.down = False
+        await until(lambda: bus.connected)
+        peer.redis, peer.connected = FakeRedis(fake_redis), True
+        peer.outbox = server.Outbox(peer.flush, peer.counters)
+        await peer.publish({"type": "container_started", "service_id": "db"})
+        await until(lambda: len(delivered) == 3)
+
+        fake_redis.drop_connections()
+        await until(lambda: not bus.connected)
+        await until(lambda: bus.connected)
+        await peer.publish({"type": "container_stopped", "service_id": "db"})
+        await until(lambda: len(delivered) == 5)
+        assert bus.stats()["reconnects"] == 1
+        assert [m["type"] for m in delivered if m["service_id"] == "db"] == [
+            "container_started", "container_started", "container_stopped", "container_stopped"]
+    finally:
+        await bus.close()
+        await peer.close()
+
+
+async def test_unix_bus_keeps_order_under_concurrent_publishes(tmp_path, monkeypatch):
+    delivered = []
+    monkeypatch.setattr(server.broadcaster, "publish", delivered.append)
+    sender, receiver = server.UnixSocketEventBus(str(tmp_path)), server.UnixSocketEventBus(str(tmp_path))
+    await sender.start()
+    await receiver.start()
+    try:
+        await asyncio.gather(*(sender.publish({"type": "container_state", "service_id": "web", "n": n})
+                               for n in range(500)))
+        await until(lambda: receiver.counters["received"] == 500)
+        assert receiver.counters["out_of_order"] == 0
+        assert len(sender.writers) == 1
+    finally:
+        await sender.close()
+        await receiver.close()
+
+
+async def test_stalled_peer_does_not_block_publish(tmp_path, monkeypatch):
+    monkeypatch.setattr(server.broadcaster, "publish", lambda message: None)
+    monkeypatch.setattr(server, "EVENT_BUS_OUTBOX_SIZE", 100)
+    accepted = []
+
+    async def never_read(reader, writer):
+        accepted.append(writer)
+
+    stalled = await asyncio.start_unix_server(never_read, path=str(tmp_path / "stalled.sock"))
+    bus = server.UnixSocketEventBus(str(tmp_path))
+    await bus.start()
+    try:
+        payload = "x" * 4096
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for n in range(5000):
+            await bus.publish({"type": "container_state", "service_id": "web", "n": n, "payload": payload})
+        assert loop.time() - started < 1.0
+        await until(lambda: bus.counters["dropped"] > 0)
+    finally:
+        await bus.close()
+        stalled.close()
+
+
+WORKER = """
+import asyncio, json, sys
+sys.path.insert(0, sys.argv[1])
+import server
+
+received = []
+server.broadcaster.publish = received.append
+
+async def main(workers, count):
+    bus = server.event_bus
+    await bus.start()
+    while len(list(bus.directory.glob("*.sock"))) < workers:
+        await asyncio.sleep(0.01)
+    for n in range(count):
+        await bus.publish({"type": "container_state", "service_id": bus.origin, "n": n})
+    deadline = asyncio.get_running_loop().time() + 20
+    while len(received) < workers * count and asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.2)
+    print(json.dumps({"origin": bus.origin, "received": received, "stats": bus.stats()}))
+    await bus.close()
+
+asyncio.run(main(int(sys.argv[2]), int(sys.argv[3])))
+"""
+
+
+def test_unix_bus_across_worker_processes(tmp_path):
+    workers, count = 3, 200
+    env = {**os.environ, "EVENT_BUS": "unix", "EVENT_BUS_SOCKET_DIR": str(tmp_path / "bus")}
+    procs = [subprocess.Popen([sys.executable, "-c", WORKER, str(BACKEND), str(workers), str(count)],
+                              env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+             for _ in range(workers)]
+    results = [json.loads(proc.communicate(timeout=60)[0]) for proc in procs]
+
+    origins = {result["origin"] for result in results}
+    assert len(origins) == workers
+    for result in results:
+        by_origin = {}
+        for message in result["received"]:
+            by_origin.setdefault(message["service_id"], []).append(message["n"])
+        # Every worker's events arrive once each and in publish order
+        assert set(by_origin) == origins
+        assert all(sequence == list(range(count)) for sequence in by_origin.values())
+        assert result["stats"]["received"] == (workers - 1) * count
+    assert not list((tmp_path / "bus").glob("*.sock"))
@@ -0,0 +1,57 @@
+import json
+
+import httpx
+import pytest
+
+import server
+from tests.conftest import service_row
+
+pytestmark = pytest.mark.anyio
+
+
+def client():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test")
+
+
+@pytest.fixture
+def graph(fake_db, monkeypatch):
+    # Small fetch batches so one service's edges span several fetchmany() calls
+    monkeypatch.setattr(server, "SERVICES_EXPORT_BATCH", 7)
+    deps = [f"dependency-service-{i:03d}" for i in range(120)]
+    edges = {"app": deps, "web": ["app", "db"], "db": []}
+    for service_id in ["db", "web", "app", *deps]:
+        fake_db.services[service_id] = service_row(service_id, category="core" if service_id in edges else "lib")
+
+    def joined(args):
+        rows = []
+        for service_id in sorted(fake_db.services):
+            row = fake_db.services[service_id]
+            if args and row["category"] != args[0]:
+                continue
+            rows += [{**row, "depends_on": dep} for dep in sorted(edges.get(service_id, []))] or [
+                {**row, "depends_on": None}]
+        return rows
+
+    fake_db.results["SELECT s.*, d.depends_on AS depends_on"] = joined
+    return edges
+
+
+async def test_export_keeps_every_dependency(fake_db, graph):
+    assert len(",".join(graph["app"])) > 1024
+    async with client() as http:
+        response = await http.get("/api/services:export", params={"category": "core"})
+    assert response.status_code == 200
+    services = [json.loads(line) for line in response.text.splitlines()]
+    assert [svc["id"] for svc in services] == ["app", "db", "web"]
+    assert {svc["id"]: svc["depends_on"] for svc in services} == {
+        "app": sorted(graph["app"]), "db": [], "web": ["app", "db"]}
+    query, _ = fake_db.statements("SELECT s.*")[0]
+    assert "GROUP_CONCAT" not in query
+
+
+async def test_compose_export_lists_dependencies(fake_db, graph):
+    async with client() as http:
+        response = await http.get("/api/services:export", params={"format": "compose", "category": "core"})
+    assert response.status_code == 200
+    assert response.text.count("dependency-service-") == 120
+    assert "  web:\n" in response.text
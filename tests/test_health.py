@@ -0,0 +1,150 @@
+import asyncio
+import collections
+
+import httpx
+import pytest
+
+import server
+from tests.conftest import service_row
+
+pytestmark = pytest.mark.anyio
+
+
+class StubServer:
+    """Minimal HTTP/1.1 server: /ok answers 200, /fail answers 503, keeping connections alive."""
+
+    def __init__(self):
+        self.hits = collections.Counter()
+        self.connections = 0
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.server.close()
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.port}{path}"
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                request = await reader.readuntil(b"\r\n\r\n")
+                path = request.split(b" ", 2)[1].decode()
+                self.hits[path] += 1
+                status = "200 OK" if path == "/ok" else "503 Service Unavailable"
+                writer.write(f"HTTP/1.1 {status}\r\nContent-Length: 0\r\n\r\n".encode())
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+@pytest.fixture
+async def prober(monkeypatch):
+    prober = server.HealthProber()
+    prober.client = httpx.AsyncClient(timeout=1)
+    monkeypatch.setattr(server, "health_prober", prober)
+    yield prober
+    await prober.client.aclose()
+
+
+async def test_probe_records_results_and_backs_off(prober, broadcasts):
+    async with StubServer() as stub:
+        ok = server.HealthTarget("ok", stub.url("/ok"), 10)
+        failing = server.HealthTarget("failing", stub.url("/fail"), 10)
+        for _ in range(3):
+            await prober.probe(ok)
+            await prober.probe(failing)
+
+    assert ok.healthy is True and ok.failures == 0
+    assert failing.healthy is False and failing.failures == 3
+    summary = failing.summary()
+    assert summary["last_error"] == "HTTP 503"
+    assert summary["success_rate"] == 0
+    assert ok.summary()["latency_ms"]["p50"] is not None
+    # Exponential backoff: 10s * 2**3, within jitter
+    due_in = failing.next_due - asyncio.get_running_loop().time()
+    assert 80 * (1 - server.HEALTH_JITTER) - 1 <= due_in <= 80 * (1 + server.HEALTH_JITTER)
+    assert [m["service_id"] for m in broadcasts] == ["ok", "failing"]
+
+
+async def test_probe_always_clears_in_flight(prober, monkeypatch, broadcasts):
+    target = server.HealthTarget("bad", "http://127.0.0.1:1healthz", 10)
+    target.in_flight = True
+    await prober.probe(target)
+    assert target.in_flight is False
+    assert target.failures == 1
+    assert target.history[-1]["error"].startswith("InvalidURL")
+
+    async def broken_broadcast(message, local=False):
+        raise RuntimeError("bus down")
+
+    monkeypatch.setattr(server, "broadcast_message", broken_broadcast)
+    target.in_flight = True
+    target.healthy = True
+    with pytest.raises(RuntimeError):
+        await prober.probe(target)
+    assert target.in_flight is False
+    assert target.next_due > 0
+
+
+def test_health_url_adds_the_leading_slash():
+    service = service_row("web", ["8080:80"], health_check="healthz")
+    assert server.health_url(service).endswith(":8080/healthz")
+
+
+async def test_hundreds_of_targets_share_one_client(prober, monkeypatch, broadcasts):
+    async def no_refresh():
+        pass
+
+    monkeypatch.setattr(prober, "refresh_targets", no_refresh)
+    monkeypatch.setattr(server, "HEALTH_MAX_CONCURRENCY", 20)
+    prober.slots = asyncio.Semaphore(20)
+    async with StubServer() as stub:
+        for i in range(300):
+            target = server.HealthTarget(f"svc{i}", stub.url("/ok" if i % 3 else "/fail"), 60)
+            target.next_due = 0
+            prober.targets[target.service_id] = target
+        runner = asyncio.create_task(prober.run())
+        try:
+            for _ in range(200):
+                if all(target.history for target in prober.targets.values()):
+                    break
+                await asyncio.sleep(0.05)
+        finally:
+            runner.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await runner
+
+    assert sum(stub.hits.values()) == 300
+    # Probes reuse kept-alive connections instead of opening one per target
+    assert stub.connections <= 20
+    assert sum(target.healthy is True for target in prober.targets.values()) == 200
+    assert not any(target.in_flight for target in prober.targets.values())
+    assert not prober.tasks
+
+
+async def test_refresh_uses_per_service_intervals(prober, fake_db, monkeypatch):
+    fake_db.results["SELECT id, ports, health_check, health_interval FROM services"] = [
+        {"id": "fast", "ports": '["8080:80"]', "health_check": "/ok", "health_interval": 2.0},
+        {"id": "default", "ports": '["8081:80"]', "health_check": "/ok", "health_interval": None},
+        {"id": "stopped", "ports": '["8082:80"]', "health_check": "/ok", "health_interval": 5.0},
+    ]
+
+    async def statuses():
+        return {"fast": {"status": "running"}, "default": {"status": "running"}}
+
+    monkeypatch.setattr(server, "get_container_statuses", statuses)
+    await prober.refresh_targets()
+    assert {sid: target.interval for sid, target in prober.targets.items()} == {
+        "fast": 2.0, "default": server.HEALTH_INTERVAL}
+
+    fake_db.results["SELECT id, ports, health_check, health_interval FROM services"][1]["health_interval"] = 30.0
+    target = prober.targets["default"]
+    await prober.refresh_targets()
+    assert prober.targets["default"] is target and target.interval == 30.0
@@ -0,0 +1,44 @@
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+NGINX = "nginx@sha256:" + "a" * 64
+MIRROR = "registry.example.com/mirror/nginx@sha256:" + "b" * 64
+
+
+def test_repo_digest_matches_the_requested_repo():
+    info = {"RepoDigests": [MIRROR, NGINX]}
+    assert server.repo_digest(info, "nginx") == NGINX
+    assert server.repo_digest(info, "docker.io/library/nginx") == NGINX
+    assert server.repo_digest(info, "registry.example.com/mirror/nginx") == MIRROR
+    assert server.repo_digest(info, "quay.io/other/nginx") is None
+    assert server.repo_digest({"RepoDigests": None}, "nginx") is None
+
+
+async def test_ensure_pins_the_matching_digest_only_when_enabled(monkeypatch, fake_docker, broadcasts):
+    fake_docker.tags.add("nginx:1.25")
+    fake_docker.digests["nginx:1.25"] = [MIRROR, NGINX]
+
+    assert await server.image_manager.ensure("nginx", "1.25") == "nginx:1.25"
+    monkeypatch.setattr(server, "IMAGE_PIN_DIGESTS", True)
+    assert await server.image_manager.ensure("nginx", "1.25") == NGINX
+    assert server.image_manager.get("nginx", "1.25").digest == NGINX
+    assert fake_docker.pulls == []
+
+
+async def test_warm_up_pulls_cold_images_and_refreshes_latest(fake_docker, fake_db, broadcasts):
+    fake_docker.tags.update({"redis:7", "grafana/grafana:latest"})
+    fake_db.results["SELECT DISTINCT image, tag FROM services"] = [
+        {"image": "redis", "tag": "7"},
+        {"image": "grafana/grafana", "tag": "latest"},
+        {"image": "postgres", "tag": "16"},
+    ]
+
+    await server.image_manager.warm_enabled()
+    assert sorted(fake_docker.pulls) == ["grafana/grafana", "postgres"]
+    assert server.image_manager.get("postgres", "16").state == "warm"
+
+    await server.image_manager.warm_enabled()
+    assert sorted(fake_docker.pulls) == ["grafana/grafana", "grafana/grafana", "postgres"]
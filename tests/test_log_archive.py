@@ -0,0 +1,152 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+# Raw bytes archived by the search benchmark; raise it (e.g. to 4 GiB) for a full-size run
+BENCH_BYTES = int(os.environ.get("LOG_SEARCH_BENCH_BYTES", 16 * 1024 * 1024))
+
+
+async def search(archive, query, services=None, since=None, until=None, limit=100):
+    records = [json.loads(chunk) async for chunk in archive.search(query, services, since, until, limit)]
+    return records[:-1], records[-1]
+
+
+def test_one_writer_per_directory(tmp_path):
+    first, second = server.LogArchive(tmp_path), server.LogArchive(tmp_path)
+    first.load()
+    second.load()
+    assert first.lead()
+    assert not second.lead()
+
+    first.append("web", 100.0, "stdout", "hello")
+    first.seal("web")
+    # The follower picks up the leader's new index entry on its next try
+    assert not second.lead()
+    assert [segment.service_id for segment in second.segments] == ["web"]
+
+    first.shutdown()
+    assert second.lead()
+    second.append("web", 200.0, "stdout", "again")
+    second.seal("web")
+    with open(tmp_path / "index.jsonl") as f:
+        assert len(f.readlines()) == 2
+    second.shutdown()
+
+
+async def test_search_merges_services_by_record_time(tmp_path):
+    archive = server.LogArchive(tmp_path)
+    archive.load()
+    # Segments that overlap in time: web covers 100-104, db covers 101-103
+    for t in range(100, 105):
+        archive.append("web", float(t), "stdout", f"web line {t}")
+    for t in range(101, 104):
+        archive.append("db", t + 0.5, "stdout", f"db line {t}")
+    archive.seal("web")
+    archive.seal("db")
+    archive.append("db", 99.0, "stderr", "db line early")
+
+    records, end = await search(archive, "line")
+    assert [r["line"] for r in records] == [
+        "db line early", "web line 100", "web line 101", "db line 101", "web line 102",
+        "db line 102", "web line 103", "db line 103", "web line 104"]
+    assert end["matches"] == 9 and not end["truncated"]
+
+    records, end = await search(archive, "line", limit=3)
+    assert [r["line"] for r in records] == ["db line early", "web line 100", "web line 101"]
+    assert end["truncated"]
+
+
+class BlockingRaw:
+    """A log stream that stays open until released, like a follow-mode read."""
+
+    def __init__(self, release):
+        self.release = release
+
+    def read(self, size):
+        self.release.wait()
+        return b""
+
+
+class BlockingResponse:
+    def __init__(self, release):
+        self.raw = BlockingRaw(release)
+
+    def close(self):
+        pass
+
+
+async def test_tailers_share_the_stream_budget(tmp_path, fake_docker, monkeypatch):
+    release = threading.Event()
+    opened = []
+
+    def open_log_stream(client, name, params):
+        opened.append(name)
+        return BlockingResponse(release)
+
+    monkeypatch.setattr(server, "open_log_stream", open_log_stream)
+    server.docker_gateway.stream_slots = threading.BoundedSemaphore(1)
+    archive = server.LogArchive(tmp_path)
+    archive.load()
+    try:
+        await archive.ensure("web")
+        await archive.ensure("db")
+        assert list(archive.tailers) == ["web"]
+        assert server.docker_gateway.stats()["streams"] == 1
+        assert server.docker_gateway.counters["streams_rejected"] == 1
+    finally:
+        release.set()
+        archive.shutdown()
+    deadline = time.monotonic() + 2
+    while server.docker_gateway.active_streams and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert server.docker_gateway.active_streams == 0
+    assert opened == ["orch_web"]
+
+
+async def test_search_benchmark(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "LOG_SEGMENT_BYTES", 1024 * 1024)
+    monkeypatch.setattr(server, "LOG_COMPRESS_LEVEL", 1)
+    archive = server.LogArchive(tmp_path)
+    archive.load()
+    services = [f"svc-{i}" for i in range(8)]
+    t = 1_700_000_000.0
+    written = 0
+    i = 0
+    while written < BENCH_BYTES:
+        service_id = services[i % len(services)]
+        line = f"GET /api/items/{i} 200 {i % 997}ms user={i % 50} request-id={i:012x}"
+        archive.append(service_id, t + i * 0.001, "stdout", line)
+        written += len(line) + 40
+        i += 1
+    needle_at = t + (i // 2) * 0.001
+    archive.append("svc-3", needle_at, "stderr", "panic: connection reset by peer")
+    for service_id in services:
+        archive.seal(service_id)
+    segments = len(archive.segments)
+
+    started = time.perf_counter()
+    records, end = await search(archive, "connection reset")
+    rare_ms = (time.perf_counter() - started) * 1000
+    assert [r["line"] for r in records] == ["panic: connection reset by peer"]
+    # The bloom filters leave only the segment holding the needle (plus the odd false positive)
+    assert end["segments_scanned"] <= max(2, segments // 20), end
+
+    started = time.perf_counter()
+    records, end = await search(archive, "GET /api", limit=1000)
+    common_ms = (time.perf_counter() - started) * 1000
+    assert len(records) == 1000 and end["truncated"]
+    assert [r["timestamp"] for r in records] == sorted(r["timestamp"] for r in records)
+    # The earliest 1000 lines sit in the first segment of each service
+    assert end["segments_scanned"] <= len(services) + 1, end
+
+    mb_per_s = written / 1e6 / (rare_ms / 1000)
+    assert rare_ms < 500 and common_ms < 1000, (
+        f"search over {written / 1e6:.0f} MB in {segments} segments: rare {rare_ms:.0f} ms "
+        f"({mb_per_s:.0f} MB/s effective), common {common_ms:.0f} ms")
@@ -0,0 +1,83 @@
+import io
+import json
+
+import httpx
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+def frames(*lines, stream=1):
+    data = b""
+    for line in lines:
+        payload = (line + "\n").encode()
+        data += bytes([stream, 0, 0, 0]) + len(payload).to_bytes(4, "big") + payload
+    return data
+
+
+class FakeLogResponse:
+    def __init__(self, data):
+        self.raw = io.BytesIO(data)
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+async def collect(response, cursor=None, max_bytes=1 << 20):
+    records = [json.loads(chunk) async for chunk in server.stream_log_records(response, cursor, True, max_bytes)]
+    return records[:-1], records[-1]
+
+
+T1 = "2024-01-01T00:00:00.100000000Z"
+T2 = "2024-01-01T00:00:00.200000000Z"
+T3 = "2024-01-01T00:00:00.300000000Z"
+
+
+async def test_cursor_counts_lines_sharing_the_last_timestamp():
+    response = FakeLogResponse(frames(f"{T1} a", f"{T2} b", f"{T2} c"))
+    records, end = await collect(response)
+    assert [r["line"] for r in records] == ["a", "b", "c"]
+    assert end["cursor"] == f"{T2}~2"
+    assert response.closed
+
+
+async def test_resume_skips_only_lines_already_sent_at_the_cursor():
+    # The first read stops after "b"; "c" shares b's timestamp and must not be lost
+    records, end = await collect(FakeLogResponse(frames(f"{T1} a", f"{T2} b", f"{T2} c")), max_bytes=2)
+    assert [r["line"] for r in records] == ["a", "b"]
+    assert end == {"type": "end", "cursor": f"{T2}~1", "bytes": 2, "truncated": True}
+
+    # Docker's since is inclusive, so the resumed stream starts with b again
+    records, end = await collect(FakeLogResponse(frames(f"{T2} b", f"{T2} c", f"{T3} d")), cursor=end["cursor"])
+    assert [r["line"] for r in records] == ["c", "d"]
+    assert end["cursor"] == f"{T3}~1"
+
+    records, end = await collect(FakeLogResponse(frames(f"{T3} d")), cursor=end["cursor"])
+    assert records == [] and end["cursor"] == f"{T3}~1"
+
+
+def test_docker_since_keeps_nanoseconds():
+    assert server.docker_since("2024-01-01T00:00:00.123456789Z") == "1704067200.123456789"
+    assert server.docker_since("2024-01-01T00:00:01Z") == "1704067201.000000000"
+    assert server.docker_since("garbage") is None
+
+
+async def test_stream_endpoint_sends_unix_since(fake_docker, monkeypatch):
+    opened = []
+
+    def open_log_stream(client, name, params):
+        opened.append(params)
+        return FakeLogResponse(frames(f"{T1} a"))
+
+    monkeypatch.setattr(server, "open_log_stream", open_log_stream)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test") as http:
+        ok = await http.get("/api/containers/web/logs/stream", params={"cursor": f"{T1}~3"})
+        since = await http.get("/api/containers/web/logs/stream", params={"since": "2024-01-01T00:00:00Z"})
+        bad = await http.get("/api/containers/web/logs/stream", params={"cursor": "not-a-time"})
+
+    assert ok.status_code == 200 and since.status_code == 200
+    assert [p["since"] for p in opened] == ["1704067200.100000000", "1704067200.000000000"]
+    assert bad.status_code == 400
@@ -0,0 +1,43 @@
+import time
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+REQUESTS = 20_000
+
+
+async def endpoint_app(scope, receive, send):
+    scope["endpoint"] = server.get_services
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def per_request_us(app) -> float:
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    best = float("inf")
+    for _ in range(3):
+        started = time.perf_counter()
+        for _ in range(REQUESTS):
+            await app({"type": "http", "method": "GET", "path": "/api/services"}, receive, send)
+        best = min(best, (time.perf_counter() - started) / REQUESTS * 1e6)
+    return best
+
+
+async def test_request_metrics_middleware_overhead(monkeypatch):
+    monkeypatch.setattr(server, "request_metrics", server.RequestMetrics())
+    bare = await per_request_us(endpoint_app)
+    wrapped = await per_request_us(server.RequestMetricsMiddleware(endpoint_app))
+    overhead = wrapped - bare
+    assert overhead < 25, f"middleware adds {overhead:.1f}us per request ({bare:.1f}us bare)"
+
+    key = ("GET", "/api/services")
+    assert server.request_metrics.responses[key + (200,)] == 3 * REQUESTS
+    assert server.request_metrics.latency[key].count == 3 * REQUESTS
@@ -0,0 +1,71 @@
+import time
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+# An hour boundary, so every tier's buckets line up with the test's
+T0 = 1_699_999_200.0
+
+
+def sample(ts, cpu, memory):
+    return {"ts": ts, "cpu_percent": cpu, "memory_usage": memory, "memory_limit": 1 << 30,
+            "net_rx": 0.0, "net_tx": 0.0, "blk_read": 0.0, "blk_write": 0.0}
+
+
+@pytest.fixture
+def rings(monkeypatch):
+    manager = server.StatsManager(64)
+    monkeypatch.setattr(server, "stats_manager", manager)
+    monkeypatch.setattr(server, "METRICS_FLUSH_INTERVAL", 0.0)
+    return manager.rings
+
+
+def feed(rings, service_ids, bucket_start, per_bucket=10):
+    for n, service_id in enumerate(service_ids):
+        ring = rings.setdefault(service_id, server.StatsRing(64))
+        for i in range(per_bucket):
+            ring.append(sample(bucket_start + i * 10 / per_bucket, 10.0 + n % 50, (100 + i) * 1024 * 1024))
+
+
+async def test_only_one_worker_records(tmp_path, rings):
+    leader, follower = server.MetricsHistory(tmp_path), server.MetricsHistory(tmp_path)
+    feed(rings, ["web"], T0)
+    await leader.step(T0 + 10)
+    await follower.step(T0 + 10)
+    assert leader.stats()["leader"] and not follower.stats()["leader"]
+    assert follower.counters["ticks"] == 0
+
+    # Each bucket is on disk once, and every worker reads it from there
+    summary = follower.summarize("10s", ["web"], T0 - 10, T0 + 20)
+    assert summary["web"]["points"] == 1 and summary["web"]["samples"] == 10
+
+    leader.shutdown()
+    feed(rings, ["web"], T0 + 10)
+    await follower.step(T0 + 20)
+    assert follower.stats()["leader"]
+    assert follower.summarize("10s", ["web"], T0 - 10, T0 + 30)["web"]["points"] == 2
+    follower.shutdown()
+
+
+async def test_ingest_benchmark(tmp_path, rings):
+    services = [f"svc-{i}" for i in range(500)]
+    history = server.MetricsHistory(tmp_path)
+    timings = []
+    # Five minutes of 10 s buckets for 500 containers, flushed every bucket
+    for k in range(30):
+        bucket_start = T0 + k * 10
+        feed(rings, services, bucket_start)
+        started = time.perf_counter()
+        await history.step(bucket_start + 10)
+        timings.append((time.perf_counter() - started) * 1000)
+    history.shutdown()
+
+    summary = history.summarize("1m", services[:3], T0, T0 + 300)
+    assert summary["svc-1"]["points"] == 5 and summary["svc-1"]["samples"] == 300
+    assert summary["svc-1"]["cpu_percent"]["avg"] == 11.0
+    timings.sort()
+    p50, worst = timings[len(timings) // 2], timings[-1]
+    assert p50 < 250, f"ingest step for {len(services)} services: p50 {p50:.1f} ms, max {worst:.1f} ms"
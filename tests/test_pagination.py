@@ -0,0 +1,98 @@
+import bisect
+import re
+import statistics
+import time
+
+import httpx
+import pytest
+
+import server
+from tests.conftest import service_row
+
+pytestmark = pytest.mark.anyio
+
+SERVICE_COUNT = 10_000
+CATEGORIES = ("database", "storage", "tool", "automation")
+
+
+def client():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test")
+
+
+def keyset_pages(fake_db):
+    """Answers query_services' SELECT like MySQL would, walking the rows in id order."""
+    rows = sorted(fake_db.services.values(), key=lambda row: row["id"])
+    ids = [row["id"] for row in rows]
+
+    def respond(args):
+        query, _ = fake_db.executed[-1]
+        args = list(args)
+        assert "OFFSET" not in query
+        filters = [(name, args.pop(0)) for name in re.findall(r"(category|enabled) = %s", query)]
+        start = bisect.bisect_right(ids, args.pop(0)) if "id > %s" in query else 0
+        limit = args.pop(0) if "LIMIT %s" in query else None
+        page = []
+        for row in rows[start:]:
+            if all(row[name] == value for name, value in filters):
+                page.append(row)
+                if len(page) == limit:
+                    break
+        return page
+
+    return respond
+
+
+@pytest.fixture
+def big_catalog(fake_docker, fake_db):
+    for i in range(SERVICE_COUNT):
+        service_id = f"svc{i:05d}"
+        fake_db.services[service_id] = service_row(service_id, category=CATEGORIES[i % len(CATEGORIES)],
+                                                   enabled=i % 3 == 0)
+    fake_db.results["SELECT id,"] = keyset_pages(fake_db)
+    return fake_db
+
+
+async def walk(http, params):
+    ids, timings, cursor = [], [], None
+    while True:
+        started = time.perf_counter()
+        response = await http.get("/api/services", params={**params, **({"cursor": cursor} if cursor else {})})
+        timings.append(time.perf_counter() - started)
+        assert response.status_code == 200
+        ids += [svc["id"] for svc in response.json()]
+        cursor = response.headers.get("x-next-cursor")
+        if not cursor:
+            return ids, timings
+
+
+@pytest.mark.parametrize("params", [
+    {},
+    {"category": "storage"},
+    {"category": "tool", "enabled": "true"},
+], ids=["all", "category", "category-enabled"])
+async def test_keyset_pages_through_10k_services(big_catalog, params):
+    expected = sorted(sid for sid, row in big_catalog.services.items()
+                      if row["category"] == params.get("category", row["category"])
+                      and ("enabled" not in params or row["enabled"]))
+    async with client() as http:
+        ids, timings = await walk(http, {"limit": 500, "fields": "id,name,status", **params})
+
+    assert ids == expected
+    assert len(timings) == -(-len(expected) // 500) + (len(expected) % 500 == 0)
+    # One SQL page per request and no deep-page slowdown
+    assert len(big_catalog.statements("SELECT id,")) == len(timings)
+    third = max(len(timings) // 3, 1)
+    early, late = statistics.median(timings[:third]), statistics.median(timings[-third:])
+    assert late < early * 3 + 0.01, f"first pages {early * 1000:.1f}ms, last pages {late * 1000:.1f}ms"
+    assert max(timings) < 0.5
+
+
+async def test_page_queries_match_the_indexes(big_catalog):
+    async with client() as http:
+        await http.get("/api/services", params={"limit": 10, "category": "tool"})
+        await http.get("/api/services", params={"limit": 10, "category": "tool", "enabled": "true"})
+    queries = [query.split(" FROM services ")[1] for query, _ in big_catalog.statements("SELECT id,")]
+    # (category, id) and (category, enabled, id) cover the filter and the ORDER BY
+    assert queries == ["WHERE category = %s ORDER BY id LIMIT %s",
+                       "WHERE category = %s AND enabled = %s ORDER BY id LIMIT %s"]
+    assert "index services for filtered pagination" in [name for _, name, _ in server.MIGRATIONS]
@@ -0,0 +1,134 @@
+import time
+
+import httpx
+import pytest
+
+import server
+from tests.conftest import GiB, FakeDocker, service_row
+
+pytestmark = pytest.mark.anyio
+
+
+def add_host(registry, host_id, ncpu=4, mem=8 * GiB, **daemon_args):
+    daemon = FakeDocker(name=host_id, ncpu=ncpu, mem=mem, **daemon_args)
+    gateway = server.DockerGateway(2, 2, 2, base_url=f"tcp://{host_id}:2375")
+    gateway.docker_client = gateway.stream_docker_client = daemon
+    gateway.healthy = True
+    registry.hosts[host_id] = server.Host(host_id, gateway, server.ImageManager(gateway, 1), f"10.0.0.{len(registry.hosts)}",
+                                          gateway.base_url)
+    return daemon
+
+
+@pytest.fixture
+async def cluster(fake_docker, fake_db, broadcasts):
+    registry = server.host_registry
+    daemons = {"h1": add_host(registry, "h1"), "h2": add_host(registry, "h2")}
+    await registry.refresh()
+    # Loaded local daemon and h1, so placement prefers h2
+    registry.hosts[server.LOCAL_HOST_ID].cpu_free = 0.1
+    registry.hosts["h1"].cpu_free = 0.5
+    yield daemons
+    registry.shutdown()
+
+
+async def start(service_id):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test") as http:
+        return await http.post(f"/api/containers/{service_id}/start")
+
+
+async def test_start_runs_on_the_roomiest_host(cluster, fake_db):
+    fake_db.services["web"] = service_row("web", ports=["8080:80"], image="nginx", tag="1.25")
+    response = await start("web")
+    assert response.status_code == 200, response.text
+    assert response.json()["host_id"] == "h2"
+    assert "orch_web" in cluster["h2"].containers_ and not cluster["h1"].containers_
+    assert cluster["h2"].pulls == ["nginx"]
+    registry = server.host_registry
+    assert registry.placements["web"] == "h2" and not registry.pending
+
+    # Status comes from the host's own view without rebuilding every remote state
+    def remote_states():
+        raise AssertionError("remote_states() rebuilt for a single service")
+
+    registry.remote_states = remote_states
+    assert (await server.get_container_status("web"))["status"] == "running"
+    assert (await server.get_container_status("other"))["status"] == "stopped"
+
+
+async def test_failed_start_hands_back_the_host(cluster, fake_db):
+    fake_db.services["web"] = service_row("web", ports=["8080:80"], resources={"memory_mb": 2048})
+
+    def refuse(*args, **kwargs):
+        raise server.docker.errors.APIError("no space left on device")
+
+    cluster["h2"].containers.run = refuse
+    registry = server.host_registry
+    h2 = registry.hosts["h2"]
+    free_before = h2.mem_free
+
+    response = await start("web")
+    assert response.status_code == 500
+    assert "web" not in registry.placements and not registry.pending
+    assert "8080" not in h2.used_ports and h2.mem_free == free_before
+    assert registry.counters["abandoned"] == 1
+    assert not server.admission.stats()["reservations"]
+
+
+async def test_rejected_start_keeps_the_previous_placement(cluster, fake_db):
+    fake_db.services["web"] = service_row("web", ports=["8080:80"])
+    fake_db.services["api"] = service_row("api", ports=["8080:80"])
+    registry = server.host_registry
+    # web runs on h2, but no refresh has listed its port yet
+    registry.placements["web"] = "h2"
+    registry.hosts["h2"].states["web"] = {"status": "running", "container_id": "h2-orch_web"}
+    # api last ran on h1, which is down, and the local daemon is out too
+    registry.placements["api"] = "h1"
+    registry.hosts["h1"].healthy = False
+    registry.hosts[server.LOCAL_HOST_ID].healthy = False
+
+    response = await start("api")
+    assert response.status_code == 409, response.text
+    assert registry.placements["api"] == "h1" and not registry.pending
+    assert "8080" not in registry.hosts["h2"].used_ports
+    assert not cluster["h2"].runs
+
+
+async def test_register_host(fake_docker, fake_db):
+    fake_db.results["SELECT id, docker_url, address, enabled FROM hosts"] = [
+        {"id": "far", "docker_url": "tcp://127.0.0.1:9", "address": "127.0.0.1", "enabled": True}]
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test") as http:
+            bad = await http.post("/api/hosts", json={"id": "far", "docker_url": "127.0.0.1:9", "address": "x"})
+            unreachable = await http.post("/api/hosts", json={"id": "far", "docker_url": "tcp://127.0.0.1:9",
+                                                               "address": "127.0.0.1"})
+    finally:
+        server.host_registry.shutdown()
+    assert bad.status_code == 422
+    # Registered, but reported as unhealthy rather than failing the request
+    assert unreachable.status_code == 200, unreachable.text
+    assert unreachable.json()["healthy"] is False and unreachable.json()["last_error"]
+
+
+def test_placement_benchmark(fake_docker):
+    registry = server.host_registry
+    for i in range(500):
+        host = server.Host(f"h{i}", server.docker_gateway, server.image_manager, f"10.0.{i // 250}.{i % 250}")
+        host.healthy = True
+        host.ncpu = 8
+        host.mem_total = host.mem_free = float(16 * GiB)
+        host.cpu_free = (i % 97) / 97
+        host.used_ports = {str(9000 + i)}
+        registry.hosts[host.id] = host
+    services = [service_row(f"svc-{n}", ports=[f"{10000 + n}:80"], resources={"cpus": 0.5, "memory_mb": 512})
+                for n in range(2000)]
+
+    timings = []
+    for service in services:
+        started = time.perf_counter()
+        registry.place(service)
+        timings.append((time.perf_counter() - started) * 1e6)
+        registry.placed(service["id"], registry.placements[service["id"]])
+    timings.sort()
+    p50, p99 = timings[len(timings) // 2], timings[int(len(timings) * 0.99)]
+    assert len(set(registry.placements.values())) > 100
+    assert p99 < 5000, f"placement across 500 hosts: p50 {p50:.0f} us, p99 {p99:.0f} us"
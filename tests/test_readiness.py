@@ -0,0 +1,78 @@
+import asyncio
+import time
+
+import pytest
+
+import server
+from tests.conftest import service_row
+from tests.test_container_states import event
+
+pytestmark = pytest.mark.anyio
+
+T0 = 1700000000
+
+
+@pytest.fixture
+def states(monkeypatch, broadcasts):
+    cache = server.ContainerStateCache()
+    cache.synced = True
+    monkeypatch.setattr(server, "container_states", cache)
+    monkeypatch.setattr(server, "health_prober", server.HealthProber())
+    monkeypatch.setattr(server, "readiness", server.ReadinessTracker())
+    return cache
+
+
+async def test_health_from_the_previous_process_is_not_ready(states):
+    await states.apply_event(event("start", "web", when=T0))
+    await states.apply_event(event("health_status: healthy", "web", when=T0 + 1))
+    assert server.readiness.already_ready("web") == {"ready": True, "source": "docker_healthcheck"}
+
+    await states.apply_event(event("die", "web", when=T0 + 2))
+    await states.apply_event(event("start", "web", when=T0 + 3))
+    assert server.readiness.already_ready("web") is None
+
+    await states.apply_event(event("health_status: healthy", "web", when=T0 + 4))
+    assert server.readiness.already_ready("web")["source"] == "docker_healthcheck"
+    # A start the cache has not seen yet still invalidates it
+    assert server.readiness.already_ready("web", since=T0 + 5) is None
+
+
+async def test_repeated_health_events_keep_when_health_changed(states):
+    await states.apply_event(event("start", "web", when=T0))
+    await states.apply_event(event("health_status: healthy", "web", when=T0 + 1))
+    await states.apply_event(event("health_status: healthy", "web", when=T0 + 31))
+    assert server.state_timestamp(states.get("web")["health_at"]) == T0 + 1
+    assert server.state_timestamp("2023-11-14T22:13:21.123456789Z") == pytest.approx(T0 + 1.123456)
+
+
+async def test_prober_results_must_postdate_the_start(states):
+    await states.apply_event(event("start", "web", when=T0 + 10))
+    target = server.HealthTarget("web", "http://127.0.0.1:1/ok", 10)
+    target.healthy = True
+    target.ok_at = T0 + 5
+    server.health_prober.targets["web"] = target
+    assert server.readiness.already_ready("web") is None
+
+    target.ok_at = T0 + 11
+    assert server.readiness.already_ready("web") == {"ready": True, "source": "health_check"}
+
+    # Without a known start time nothing cached can be trusted
+    assert server.readiness.already_ready("other") is None
+
+
+async def test_wait_resolves_on_fresh_health_after_a_restart(fake_docker, fake_db, states):
+    fake_docker.add("web")
+    fake_db.services["web"] = service_row("web")
+    now = time.time()
+    await states.apply_event(event("start", "web", when=now - 20))
+    await states.apply_event(event("health_status: healthy", "web", when=now - 19))
+    await states.apply_event(event("die", "web", when=now - 2))
+    await states.apply_event(event("start", "web", when=now - 1))
+
+    waiter = asyncio.create_task(server.await_service_state("web", "ready", 2))
+    await asyncio.sleep(0.05)
+    assert not waiter.done()
+    await states.apply_event(event("health_status: healthy", "web", when=now))
+    outcome = await waiter
+    assert outcome["reached"] is True
+    assert outcome["detail"]["source"] == "docker_healthcheck"
@@ -0,0 +1,217 @@
+import asyncio
+import time
+from datetime import datetime
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+NOW = datetime(2026, 1, 1)
+
+
+def running(service_id):
+    return {"service_id": service_id, "status": "running", "container_id": f"id-{service_id}"}
+
+
+def exited(service_id):
+    return {"service_id": service_id, "status": "exited", "container_id": f"id-{service_id}"}
+
+
+def test_diff_in_sync_is_empty():
+    rows = [("web", True, "id-web", "running"), ("off", False, None, "stopped")]
+    updates, drift, died = server.diff_container_states(rows, {"web": running("web")}, NOW)
+    assert updates == [] and died == []
+    assert not any(drift.values())
+
+
+def test_diff_reports_a_death_once():
+    rows = [("web", True, "id-web", "running")]
+    updates, drift, died = server.diff_container_states(rows, {"web": exited("web")}, NOW)
+    assert died == ["web"]
+    assert drift["died"] == 1 and drift["status_mismatch"] == 1
+    assert updates == [("web", "web", "id-web", "exited", NOW)]
+
+    # The next pass sees the row it just wrote and has nothing new to report
+    rows = [("web", True, "id-web", "exited")]
+    updates, drift, died = server.diff_container_states(rows, {"web": exited("web")}, NOW)
+    assert updates == [] and died == []
+    assert not any(drift.values())
+
+
+def test_diff_removed_container_stays_quiet():
+    updates, drift, died = server.diff_container_states([("web", True, "id-web", "running")], {}, NOW)
+    assert died == ["web"] and drift["missing"] == 1
+    assert updates == [("web", "web", None, "removed", NOW)]
+
+    updates, drift, died = server.diff_container_states([("web", True, None, "removed")], {}, NOW)
+    assert updates == [] and died == []
+    assert not any(drift.values())
+
+
+def test_diff_untracked_and_disabled():
+    rows = [("new", True, None, None), ("off", False, "id-off", "running")]
+    updates, drift, died = server.diff_container_states(rows, {"new": running("new")}, NOW)
+    assert drift["untracked"] == 1 and drift["missing"] == 1
+    # A disabled service is recorded as gone but never revived
+    assert died == []
+    assert ("new", "new", "id-new", "running", None) in updates
+
+
+def test_diff_stopped_on_purpose_matches_exited():
+    rows = [("web", True, "id-web", "stopped")]
+    updates, drift, died = server.diff_container_states(rows, {"web": exited("web")}, NOW)
+    assert updates == [] and died == []
+
+
+@pytest.fixture
+def reconciler(fake_docker, fake_db, monkeypatch):
+    server.container_states.synced = True
+    return server.Reconciler()
+
+
+def containers_rows(services):
+    return lambda args: [{"id": service_id, "enabled": True, "container_id": f"id-{service_id}",
+                          "status": status} for service_id, status in services.items()]
+
+
+async def test_reconcile_1000_services_under_100ms(reconciler, fake_db):
+    ids = [f"svc-{i}" for i in range(1000)]
+    recorded = dict.fromkeys(ids, "running")
+    fake_db.results["SELECT s.id, s.enabled"] = containers_rows(recorded)
+    server.container_states.states = {service_id: running(service_id) for service_id in ids}
+    for service_id in ids[:10]:
+        server.container_states.states[service_id] = exited(service_id)
+
+    await reconciler.reconcile()
+    timings = []
+    for _ in range(5):
+        started = time.perf_counter()
+        result = await reconciler.reconcile()
+        timings.append((time.perf_counter() - started) * 1000)
+    assert result["drift"]["status_mismatch"] == 10
+    best = min(timings)
+    assert best < 100, f"reconcile of 1000 services took {best:.1f} ms"
+
+
+async def test_failed_restart_is_retried_after_backoff(reconciler, fake_db, monkeypatch):
+    monkeypatch.setattr(server, "RECONCILE_RESTART", True)
+    monkeypatch.setattr(server, "RECONCILE_RESTART_BACKOFF", 0.02)
+    recorded = {"web": "running"}
+    fake_db.results["SELECT s.id, s.enabled"] = containers_rows(recorded)
+    server.container_states.states = {"web": exited("web")}
+    attempts = []
+
+    async def start_container(service_id):
+        attempts.append(service_id)
+        raise RuntimeError("port taken")
+
+    monkeypatch.setattr(server, "start_container", start_container)
+    result = await reconciler.reconcile()
+    assert result["died"] == ["web"]
+    await asyncio.sleep(0.01)
+    assert attempts == ["web"]
+
+    # The row now says exited, so this is no longer a new death, but it is still down
+    recorded["web"] = "exited"
+    await asyncio.sleep(0.05)
+    result = await reconciler.reconcile()
+    assert result["died"] == [] and not any(result["drift"].values())
+    await asyncio.sleep(0.01)
+    assert attempts == ["web", "web"]
+    assert reconciler.counters["restart_failures"] == 2
+    assert reconciler.drift_total["died"] == 1
+
+    # Disabling the service drops its backoff and stops the retries
+    fake_db.results["SELECT s.id, s.enabled"] = lambda args: [
+        {"id": "web", "enabled": False, "container_id": "id-web", "status": "exited"}]
+    await asyncio.sleep(0.1)
+    await reconciler.reconcile()
+    await asyncio.sleep(0.01)
+    assert attempts == ["web", "web"]
+    assert "web" not in reconciler.backoff
+
+
+class LockServer:
+    """MySQL named locks shared by the fake connections."""
+
+    def __init__(self):
+        self.owner = None
+        self.sessions = 0
+
+
+class FakeLockConnection:
+    def __init__(self, locks):
+        self.locks = locks
+        locks.sessions += 1
+        self.session = locks.sessions
+        self.closed = False
+        self.result = None
+
+    def cursor(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def execute(self, query, args=None):
+        if query.startswith("SELECT GET_LOCK") and self.locks.owner is None:
+            self.locks.owner = self.session
+        self.result = (int(self.locks.owner == self.session),)
+
+    async def fetchone(self):
+        return self.result
+
+    def close(self):
+        self.closed = True
+        if self.locks.owner == self.session:
+            self.locks.owner = None
+
+
+@pytest.fixture
+def locks(monkeypatch):
+    locks = LockServer()
+
+    async def connect(**kwargs):
+        return FakeLockConnection(locks)
+
+    monkeypatch.setattr(server.aiomysql, "connect", connect)
+    monkeypatch.setitem(server.db_state, "connected", True)
+    return locks
+
+
+async def test_leader_lock_single_holder(locks, monkeypatch):
+    first, second = server.DatabaseLeaderLock("test"), server.DatabaseLeaderLock("test")
+    assert await first.acquire()
+    assert not await second.acquire()
+    assert await first.acquire()
+
+    first.close()
+    assert await second.acquire()
+    assert not await first.acquire()
+    assert second.stats()["acquired"] == 1
+
+    monkeypatch.setitem(server.db_state, "connected", False)
+    assert not await second.acquire()
+    assert second.stats()["lost"] == 1
+
+
+async def test_only_the_leader_reconciles(locks, reconciler, fake_db, monkeypatch):
+    monkeypatch.setattr(server, "RECONCILE_INTERVAL", 0.01)
+    fake_db.results["SELECT s.id, s.enabled"] = containers_rows({})
+    other = server.Reconciler()
+    tasks = [asyncio.create_task(reconciler.run()), asyncio.create_task(other.run())]
+    try:
+        await asyncio.sleep(0.1)
+        passes = (reconciler.counters["passes"], other.counters["passes"])
+        assert sorted(bool(count) for count in passes) == [False, True]
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    # Cancelling the leader closes its session, which frees the lock
+    assert locks.owner is None
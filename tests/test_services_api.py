@@ -0,0 +1,92 @@
+import statistics
+import time
+
+import httpx
+import pytest
+
+import server
+from tests.conftest import service_row
+
+pytestmark = pytest.mark.anyio
+
+
+def client():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test")
+
+
+def populate(fake_docker, fake_db, count):
+    for i in range(count):
+        service_id = f"svc{i:05d}"
+        fake_db.services[service_id] = service_row(service_id, [f"{10000 + i}:80"])
+        if i % 2 == 0:
+            fake_docker.add(service_id)
+
+
+@pytest.mark.parametrize("count", [20, 200, 2000])
+async def test_status_join_is_one_docker_call(fake_docker, fake_db, count):
+    # 2ms per Docker round trip: a per-service lookup would cost count * 2ms
+    fake_docker.list_delay = 0.002
+    populate(fake_docker, fake_db, count)
+
+    async with client() as http:
+        timings = []
+        for _ in range(10):
+            started = time.perf_counter()
+            response = await http.get("/api/services")
+            timings.append(time.perf_counter() - started)
+            assert response.status_code == 200
+
+    services = response.json()
+    assert len(services) == count
+    assert sum(svc["status"] == "running" for svc in services) == (count + 1) // 2
+    assert fake_docker.calls == {"list": 10}
+    median = statistics.median(timings)
+    # Well under what one Docker round trip per service would take
+    assert median < 0.002 * count, f"{count} services: median {median * 1000:.1f}ms per request"
+
+
+def new_service(name, depends_on=()):
+    return {"name": name, "category": "test", "image": "img", "depends_on": list(depends_on)}
+
+
+async def test_create_service_writes_row_and_edges_in_one_transaction(fake_db, broadcasts):
+    fake_db.services["db"] = service_row("db")
+    async with client() as http:
+        response = await http.post("/api/services", json=new_service("web", ["db", "db"]))
+    assert response.status_code == 200
+    writes = [query.split(" (")[0] for query, _ in fake_db.executed if not query.startswith("SELECT")]
+    assert writes == ["BEGIN", "INSERT INTO services", "INSERT INTO service_dependencies", "COMMIT"]
+    assert fake_db.statements("INSERT INTO service_dependencies")[0][1] == ("web", "db")
+
+
+async def test_create_service_rejects_unknown_dependencies_before_writing(fake_db, broadcasts):
+    async with client() as http:
+        response = await http.post("/api/services", json=new_service("web", ["db", "cache"]))
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Unknown dependencies: db, cache"
+    assert not fake_db.statements("INSERT")
+    assert not fake_db.statements("BEGIN")
+
+
+async def test_create_service_conflicts(fake_db, broadcasts):
+    fake_db.services["web"] = service_row("web")
+    async with client() as http:
+        duplicate = await http.post("/api/services", json=new_service("web"))
+        itself = await http.post("/api/services", json=new_service("api", ["api"]))
+    assert duplicate.status_code == 409
+    assert itself.status_code == 400
+    assert not fake_db.statements("INSERT")
+
+
+async def test_create_service_rolls_back_when_an_edge_fails(fake_db, broadcasts):
+    fake_db.services["db"] = service_row("db")
+
+    def fail(args):
+        raise RuntimeError("lock wait timeout")
+
+    fake_db.results["INSERT INTO service_dependencies"] = fail
+    async with client() as http:
+        response = await http.post("/api/services", json=new_service("web", ["db"]))
+    assert response.status_code == 500
+    assert fake_db.statements("ROLLBACK") and not fake_db.statements("COMMIT")
+    assert not [m for m in broadcasts if m["type"] == "catalog_changed"]
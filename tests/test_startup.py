@@ -0,0 +1,71 @@
+import asyncio
+import subprocess
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+BACKEND = Path(__file__).resolve().parent.parent / "backend"
+
+
+def test_import_leaves_docker_and_mysql_unloaded():
+    code = ("import sys, server; "
+            "print(sorted(m for m in ('docker.errors', 'aiomysql.pool', 'requests.exceptions') if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "[]"
+
+
+async def test_migrations_do_not_run_without_the_lock(fake_db):
+    fake_db.results["SELECT COALESCE(MAX(version), 0)"] = [{"version": 0}]
+    fake_db.results["SELECT GET_LOCK"] = [{"locked": 0}]
+    conn = await fake_db.acquire()
+    async with conn.cursor() as cursor:
+        with pytest.raises(RuntimeError, match="migration lock"):
+            await server.run_migrations(cursor)
+    assert not fake_db.statements("INSERT INTO schema_version")
+    assert not fake_db.statements("SELECT RELEASE_LOCK")
+
+
+async def test_current_schema_skips_the_lock(fake_db):
+    fake_db.results["SELECT COALESCE(MAX(version), 0)"] = [{"version": server.MIGRATIONS[-1][0]}]
+    conn = await fake_db.acquire()
+    async with conn.cursor() as cursor:
+        assert await server.run_migrations(cursor) == server.MIGRATIONS[-1][0]
+    assert not fake_db.statements("SELECT GET_LOCK")
+
+
+async def test_routes_answer_503_before_the_database_connects(fake_docker, monkeypatch):
+    monkeypatch.setattr(server, "db_pool", server.InstrumentedPool(None, server.MYSQL_ACQUIRE_TIMEOUT))
+    server.container_states.synced = True
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test") as http:
+        reconcile = await http.post("/api/reconcile")
+        start = await http.post("/api/containers/web/start")
+        ready = await http.get("/api/ready")
+    assert reconcile.status_code == 503 and reconcile.headers["Retry-After"] == "1"
+    assert start.status_code == 503
+    assert ready.status_code == 503
+
+
+async def test_image_warm_up_waits_for_the_database(monkeypatch):
+    monkeypatch.setitem(server.db_state, "connected", False)
+    manager = server.ImageManager(server.docker_gateway, 1)
+    warmed = asyncio.Event()
+
+    async def warm_enabled():
+        warmed.set()
+
+    monkeypatch.setattr(manager, "warm_enabled", warm_enabled)
+    task = asyncio.create_task(manager.run())
+    try:
+        await asyncio.sleep(0.05)
+        assert not warmed.is_set()
+        server.db_state["connected"] = True
+        await asyncio.wait_for(warmed.wait(), 2)
+    finally:
+        task.cancel()
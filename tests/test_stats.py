@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+
+import server
+from tests.conftest import FakeDocker
+
+pytestmark = pytest.mark.anyio
+
+
+def stats_doc(total_usage, system_usage, memory=100 * 1024 * 1024):
+    return {"cpu_stats": {"cpu_usage": {"total_usage": total_usage}, "system_cpu_usage": system_usage},
+            "precpu_stats": {"cpu_usage": {"total_usage": total_usage - 50}, "system_cpu_usage": system_usage - 1000}
+            if system_usage > 1000 else {},
+            "memory_stats": {"usage": memory, "limit": 4 * memory},
+            "networks": {"eth0": {"rx_bytes": 10, "tx_bytes": 20}}}
+
+
+@pytest.fixture
+def stats_manager(monkeypatch, fake_docker):
+    manager = server.StatsManager(64)
+    monkeypatch.setattr(server, "stats_manager", manager)
+    yield manager
+    fake_docker.stats_hold.set()
+    manager.shutdown()
+
+
+async def test_sampler_streams_on_the_stream_client(fake_docker, stats_manager):
+    streams = FakeDocker()
+    server.docker_gateway.stream_docker_client = streams
+    # The first document has no previous CPU reading and is skipped
+    streams.stats_docs = [stats_doc(100, 1000), stats_doc(200, 2000), stats_doc(300, 3000)]
+
+    await stats_manager.ensure("web")
+    stats_manager.samplers["web"].thread.join(1)
+
+    assert streams.calls["stats"] == 1
+    assert fake_docker.calls["stats"] == 0
+    assert stats_manager.rings["web"].count == 2
+    stats = server.format_stats(stats_manager.latest("web"))
+    assert stats["cpu_percent"] == 5.0
+    assert stats["memory_percent"] == 25.0
+
+
+async def test_ensure_shares_one_sampler_per_container(fake_docker, stats_manager):
+    fake_docker.stats_hold.clear()
+    for _ in range(10):
+        await stats_manager.ensure("web")
+    assert fake_docker.calls["stats"] == 1
+    assert server.docker_gateway.stats()["streams"] == 1
+
+
+async def test_samplers_stay_within_the_stream_budget(fake_docker, stats_manager):
+    fake_docker.stats_hold.clear()
+    server.docker_gateway.stream_slots = threading.BoundedSemaphore(2)
+
+    for service_id in ("a", "b", "c", "d"):
+        await stats_manager.ensure(service_id)
+    assert sorted(stats_manager.samplers) == ["a", "b"]
+    assert server.docker_gateway.stats()["streams_rejected"] == 2
+
+    # A sampler that ends frees its slot for the next scan
+    stats_manager.discard("a")
+    fake_docker.stats_hold.set()
+    stats_manager.samplers["b"].thread.join(1)
+    fake_docker.stats_hold.clear()
+    await stats_manager.ensure("c")
+    assert "c" in stats_manager.samplers
+
+
+def test_ring_window_buckets_recent_samples():
+    ring = server.StatsRing(8)
+    now = time.time()
+    for i in range(12):
+        ring.append({field: float(i) for field in ring.FIELDS} | {"ts": now - 11 + i})
+    assert ring.count == 8
+    assert ring.latest()["cpu_percent"] == 11.0
+    series = ring.window(60, 4)
+    assert [point["cpu_percent"] for point in series] == [4.5, 6.5, 8.5, 10.5]
+    assert ring.window(2.5, 4)[-1]["ts"] == now
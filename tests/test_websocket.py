@@ -0,0 +1,121 @@
+import asyncio
+import json
+import pytest
+from starlette.testclient import TestClient
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeWebSocket:
+    def __init__(self, send_delay=0.0):
+        self.send_delay = send_delay
+        self.frames = []
+        self.closed_with = None
+
+    async def send_text(self, text):
+        if self.send_delay:
+            await asyncio.sleep(self.send_delay)
+        self.frames.append(json.loads(text))
+
+    async def close(self, code=1000, reason=None):
+        self.closed_with = code
+
+
+@pytest.fixture
+def fast_stats(monkeypatch):
+    monkeypatch.setattr(server, "WS_STATS_MIN_INTERVAL", 0.05)
+    monkeypatch.setattr(server, "broadcaster", server.Broadcaster())
+
+
+async def test_stats_soak_with_hundreds_of_subscribers(fake_docker, fast_stats):
+    service_ids = [f"svc{i}" for i in range(20)]
+    sockets = [FakeWebSocket(send_delay=0.3 if i % 10 == 0 else 0.0) for i in range(400)]
+    subscriptions = []
+    began = asyncio.get_running_loop().time()
+    for websocket in sockets:
+        subscription = server.StatsSubscription(server.broadcaster.connect(websocket))
+        await subscription.subscribe(service_ids, 0.1)
+        subscriptions.append(subscription)
+
+    lags = []
+    loop = asyncio.get_running_loop()
+    try:
+        deadline = loop.time() + 1.5
+        while loop.time() < deadline:
+            started = loop.time()
+            await asyncio.sleep(0.01)
+            lags.append(loop.time() - started - 0.01)
+
+        ticks = (loop.time() - began) / 0.1
+        fast = [ws for i, ws in enumerate(sockets) if i % 10]
+        slow = [ws for i, ws in enumerate(sockets) if i % 10 == 0]
+        # Bounds leave room for a loaded CI machine; a stalled loop or a backlog still fails them
+        assert max(lags) < 0.25, f"event loop stalled {max(lags) * 1000:.0f}ms"
+        assert all(5 <= len(ws.frames) <= ticks + 2 for ws in fast), (ticks, sorted({len(ws.frames) for ws in fast}))
+        assert all(set(ws.frames[-1]["stats"]) == set(service_ids) for ws in fast)
+        # Slow clients only ever hold the newest frame instead of a backlog
+        assert all(len(ws.frames) <= (ticks * 0.1) / 0.3 + 2 for ws in slow)
+        assert all(len(conn.queue) == 0 for conn in server.broadcaster.connections)
+    finally:
+        for subscription in subscriptions:
+            subscription.cancel()
+            subscription.connection.close()
+    await asyncio.wait_for(asyncio.gather(*(s.connection.task for s in subscriptions)), 1)
+    assert not server.broadcaster.connections
+
+
+def test_websocket_subscribe_end_to_end(fake_docker, fast_stats):
+    fake_docker.add("web")
+    # No lifespan: only the socket route runs, none of the background loops
+    with TestClient(server.app).websocket_connect("/api/ws") as websocket:
+        websocket.send_text(json.dumps({"type": "subscribe", "service_ids": ["web", "db"], "interval": 0.05}))
+        frames = [websocket.receive_json() for _ in range(3)]
+        websocket.send_text(json.dumps({"type": "unsubscribe"}))
+    assert all(frame["type"] == "stats" and set(frame["stats"]) == {"web", "db"} for frame in frames)
+    assert frames[0]["timestamp"] < frames[-1]["timestamp"]
+
+
+async def test_disconnect_policy_closes_the_socket(fast_stats):
+    websocket = FakeWebSocket(send_delay=10)
+    connection = server.ClientConnection(websocket, 2, "disconnect")
+    connection.task = asyncio.create_task(connection.writer())
+    server.broadcaster.connections.add(connection)
+    await asyncio.sleep(0)
+
+    results = [connection.enqueue(json.dumps({"n": n})) for n in range(4)]
+    await asyncio.wait_for(connection.closer, 1)
+
+    assert results == [True, True, False, False]
+    assert connection.closed
+    assert connection not in server.broadcaster.connections
+    assert websocket.closed_with == server.WS_CLOSE_TRY_AGAIN_LATER
+    assert connection.task.cancelled() or connection.task.done()
+
+
+async def test_drop_policy_keeps_the_socket_open(fast_stats):
+    websocket = FakeWebSocket(send_delay=10)
+    connection = server.ClientConnection(websocket, 2, "drop")
+    for n in range(4):
+        assert connection.enqueue(json.dumps({"n": n}))
+    assert connection.dropped == 2
+    assert connection.closer is None and websocket.closed_with is None
+
+
+async def test_dropped_total_survives_disconnects_and_merges_are_separate(fast_stats):
+    connection = server.broadcaster.connect(FakeWebSocket(send_delay=10))
+    connection.max_queue = 2
+    for n in range(4):
+        connection.enqueue(json.dumps({"n": n}))
+    for n in range(3):
+        connection.offer_latest(json.dumps({"stats": n}))
+    assert (connection.dropped, connection.merged) == (2, 2)
+
+    connection.close()
+    stats = server.broadcaster.stats()
+    assert stats["connections"] == 0
+    assert (stats["dropped_total"], stats["merged_total"]) == (2, 2)
+    metrics = server.render_metrics()
+    assert "orchestrator_websocket_dropped_messages_total 2\n" in metrics
+    assert "orchestrator_websocket_merged_stats_total 2\n" in metrics